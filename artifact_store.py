@@ -0,0 +1,148 @@
+"""Job-scoped artifact workspace: one directory per fetch job.
+
+Every fetch gets its own job id and directory, so concurrent users (and
+several threads or gunicorn workers sharing the same disk) never write to
+the same paths. Only the job id is kept in the session. Old jobs are
+garbage-collected by TTL and by total size.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import threading
+
+# --- Configuration ---
+JOB_ARTIFACTS_DIR_ENV_VAR = "FIGMA_JOBS_DIR"
+DEFAULT_JOB_ARTIFACTS_DIR = ".figma_jobs"
+JOB_TTL_SECONDS = 24 * 60 * 60
+JOB_STORE_MAX_BYTES = 1024 * 1024 * 1024
+GC_INTERVAL_SECONDS = 60
+JOB_META_FILENAME = "job.json"
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Job:
+    """A job's directory plus its metadata (file key, node id, artifact filenames)."""
+
+    def __init__(self, job_id, job_dir, meta):
+        self.job_id = job_id
+        self.job_dir = job_dir
+        self.meta = meta
+
+    def path(self, filename):
+        return os.path.join(self.job_dir, filename)
+
+    def artifact_path(self, name):
+        """Absolute path of a recorded artifact (e.g. 'json', 'image'), or None if it was never produced."""
+        filename = self.meta.get("artifacts", {}).get(name)
+        return self.path(filename) if filename else None
+
+
+class ArtifactStore:
+    """Directory-per-job store. Metadata writes are atomic, so readers in other processes never see partial files."""
+
+    def __init__(self, root_dir=None, ttl_seconds=JOB_TTL_SECONDS, max_bytes=JOB_STORE_MAX_BYTES):
+        self.root_dir = os.path.abspath(root_dir or os.environ.get(JOB_ARTIFACTS_DIR_ENV_VAR) or DEFAULT_JOB_ARTIFACTS_DIR)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._gc_lock = threading.Lock()
+        self._last_gc = 0.0
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.root_dir, job_id)
+
+    def _write_meta(self, job):
+        meta_path = job.path(JOB_META_FILENAME)
+        tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job.meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def create_job(self, **meta):
+        """Creates a fresh job directory and returns the Job."""
+        self.maybe_collect_garbage()
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir)
+        job = Job(job_id, job_dir, dict(meta, created_at=time.time(), artifacts={}))
+        self._write_meta(job)
+        return job
+
+    def get_job(self, job_id):
+        """Loads a job by id (and refreshes its last-access time), or returns None if unknown/expired."""
+        if not job_id or not _JOB_ID_RE.match(job_id):
+            return None
+        job_dir = self._job_dir(job_id)
+        meta_path = os.path.join(job_dir, JOB_META_FILENAME)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            os.utime(meta_path)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return Job(job_id, job_dir, meta)
+
+    def record_artifact(self, job, name, path):
+        """Registers a file inside the job directory (or a subdirectory of it) under a logical name ('json', 'image', ...)."""
+        job.meta.setdefault("artifacts", {})[name] = os.path.relpath(path, job.job_dir)
+        self._write_meta(job)
+
+    def update_meta(self, job, **meta):
+        job.meta.update(meta)
+        self._write_meta(job)
+
+    # --- Garbage collection ---
+
+    def maybe_collect_garbage(self):
+        """Runs collect_garbage at most once per GC_INTERVAL_SECONDS per process."""
+        now = time.time()
+        if now - self._last_gc < GC_INTERVAL_SECONDS or not self._gc_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_gc = now
+            self.collect_garbage()
+        finally:
+            self._gc_lock.release()
+
+    def collect_garbage(self):
+        """Deletes jobs idle longer than the TTL, then the least recently used ones until under max_bytes."""
+        now = time.time()
+        jobs = []
+        for job_id in os.listdir(self.root_dir):
+            if not _JOB_ID_RE.match(job_id):
+                continue
+            job_dir = self._job_dir(job_id)
+            try:
+                last_access = os.path.getmtime(os.path.join(job_dir, JOB_META_FILENAME))
+            except OSError:
+                last_access = 0.0
+            if now - last_access > self.ttl_seconds:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                continue
+            jobs.append((last_access, job_dir, _dir_size(job_dir)))
+
+        total = sum(size for _, _, size in jobs)
+        removed = 0
+        for _, job_dir, size in sorted(jobs):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(job_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            print(f"Artifact store: removed {removed} job(s) to stay under {self.max_bytes} bytes.")
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
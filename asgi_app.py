@@ -0,0 +1,157 @@
+"""asyncio (ASGI) serving mode for many concurrent long-lived SSE streams.
+
+    python3 asgi_app.py              # or: uvicorn asgi_app:app --port 5000
+
+Every request is still handled by the Flask app, so routes, sessions and
+templates are unchanged. Short routes (/, /fetch, /save_generated_code, ...)
+run on a bounded thread pool. A response that streams a generation job
+(marked with the X-Generation-Job header, see generation_jobs.py) is taken
+over by the event loop: the Flask body is dropped unread and the job's
+events are awaited asynchronously. A waiting viewer is then only a coroutine
+and a socket, not a thread. Model calls run on the generation job pool, so
+their concurrency stays bounded no matter how many viewers are attached.
+
+Requires an ASGI server: pip install uvicorn
+"""
+import io
+import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import figma_to_jetpack as flask_module
+from generation_jobs import job_events_sse_async, parse_last_event_id, GENERATION_JOB_HEADER, GENERATION_JOB_RESUME_HEADER
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+# --- Configuration ---
+# Threads for the short, blocking Flask routes (pages, /fetch, /save_generated_code).
+WSGI_THREADS = 32
+_JOB_HEADERS = {GENERATION_JOB_HEADER.lower(), GENERATION_JOB_RESUME_HEADER.lower()}
+
+_wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="asgi-wsgi")
+
+
+def wsgi_environ(scope, body):
+    """Builds a PEP 3333 environ for an ASGI HTTP scope and its fully read body."""
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_flask(environ):
+    """Runs the Flask app for one request. Returns (status_code, headers, body_bytes, generation_job_or_None)."""
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start["status"] = int(status.split(" ", 1)[0])
+        response_start["headers"] = headers
+
+    body_iterable = flask_module.app(environ, start_response)
+    try:
+        headers = dict((name.lower(), value) for name, value in response_start["headers"])
+        job = flask_module.generation_jobs.get(headers.get(GENERATION_JOB_HEADER.lower()))
+        if job is not None:
+            # The event loop streams this job; the blocking Flask generator is never started.
+            return response_start["status"], response_start["headers"], None, job
+        body = b"".join(body_iterable)
+    finally:
+        if hasattr(body_iterable, "close"):
+            body_iterable.close()
+    return response_start["status"], response_start["headers"], body, None
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _stream_job(send, job, last_event_id):
+    async for event in job_events_sse_async(job, last_event_id):
+        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    loop = asyncio.get_running_loop()
+    status, headers, response_body, job = await loop.run_in_executor(_wsgi_executor, call_flask, wsgi_environ(scope, body))
+    raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers
+                   if name.lower() not in _JOB_HEADERS]
+    if job is None:
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": response_body})
+        return
+
+    last_event_id = parse_last_event_id(dict(headers).get(GENERATION_JOB_RESUME_HEADER))
+    raw_headers += [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    stream = asyncio.ensure_future(_stream_job(send, job, last_event_id))
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    for task in (stream, disconnect):
+        task.cancel()
+
+
+if __name__ == '__main__':
+    if uvicorn is None:
+        print("Error: the ASGI serving mode needs an ASGI server. Please run: pip install uvicorn")
+        sys.exit(1)
+    port = int(os.environ.get(flask_module.FLASK_PORT_ENV_VAR, flask_module.DEFAULT_FLASK_PORT))
+    print(f"Starting ASGI server with Gemini model '{flask_module.GEMINI_MODEL_NAME}'. Open http://127.0.0.1:{port} in your browser.")
+    uvicorn.run(app, host='0.0.0.0', port=port, log_level="warning", timeout_keep_alive=30)
@@ -0,0 +1,232 @@
+"""Finds the icons and images in a fetched frame and exports them as an Android drawable set.
+
+discover_assets walks the node JSON of a fetch:
+  - The topmost nodes whose visible leaves are all vector shapes, with at
+    least one real path, are vector assets (icons, logos). A node the
+    designer marked for export in Figma counts as well.
+  - Nodes with an IMAGE fill are raster assets (photos, illustrations).
+    They are only rendered to PNG/JPG; an SVG would just wrap the bitmap.
+Every rendition requested by the export spec (e.g. "png@1x,png@2x,png@3x,svg")
+is rendered by Figma concurrently (see run_asset_export_pipeline). PNG/JPG
+renditions go to res-style drawable-<density>/ directories. SVG/PDF go to
+svg/ and pdf/, for Android Studio's Vector Asset import. assets.json lists
+each asset with its files, so the generated code can refer to it by name.
+"""
+import os
+import re
+import json
+import shutil
+import tempfile
+
+from fetch_pipeline import run_asset_export_pipeline
+from parallel_generation import root_document
+
+# --- Configuration ---
+DEFAULT_ASSET_EXPORT_SPEC = "png@1x,png@2x,png@3x,svg"
+MAX_ASSETS_PER_EXPORT = 200
+ASSET_MANIFEST_FILENAME = "assets.json"
+
+RASTER_FORMATS = ("png", "jpg")
+VECTOR_FORMATS = ("svg", "pdf")
+DENSITY_DIRECTORIES = {1.0: "drawable-mdpi", 1.5: "drawable-hdpi", 2.0: "drawable-xhdpi",
+                       3.0: "drawable-xxhdpi", 4.0: "drawable-xxxhdpi"}
+PATH_NODE_TYPES = frozenset(["VECTOR", "BOOLEAN_OPERATION", "STAR", "LINE", "REGULAR_POLYGON"])
+SHAPE_NODE_TYPES = PATH_NODE_TYPES | frozenset(["RECTANGLE", "ELLIPSE"])
+CONTAINER_NODE_TYPES = frozenset(["GROUP", "FRAME", "COMPONENT", "INSTANCE"])
+
+ASSET_KIND_VECTOR = "vector"
+ASSET_KIND_RASTER = "raster"
+ASSET_NAME_PREFIXES = {ASSET_KIND_VECTOR: "ic", ASSET_KIND_RASTER: "img"}
+
+
+class AssetExportError(Exception):
+    """No rendition of a non-empty export could be written; the previous export is left in place."""
+
+
+class Asset:
+    """One exportable node of the frame, with its Android resource name."""
+
+    def __init__(self, node_id, name, kind, layer_name):
+        self.node_id = node_id
+        self.name = name
+        self.kind = kind
+        self.layer_name = layer_name
+        self.files = []
+
+
+def parse_export_spec(spec):
+    """
+    Parses "png@1x,png@2x,svg" into [("png", 1.0), ("png", 2.0), ("svg", None)].
+    Raises ValueError for unknown formats or raster scales without a drawable density.
+    """
+    renditions = []
+    for item in (spec or "").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        image_format, _, scale_text = item.partition("@")
+        if image_format in VECTOR_FORMATS:
+            rendition = (image_format, None)
+        elif image_format in RASTER_FORMATS:
+            try:
+                scale = float(scale_text.rstrip("x") or 1)
+            except ValueError:
+                raise ValueError(f"Invalid scale in '{item}'.")
+            if scale not in DENSITY_DIRECTORIES:
+                raise ValueError(f"Scale {scale:g}x in '{item}' has no drawable density "
+                                 f"(use {', '.join(f'{s:g}x' for s in DENSITY_DIRECTORIES)}).")
+            rendition = (image_format, scale)
+        else:
+            raise ValueError(f"Unknown asset format '{image_format}' (use {', '.join(RASTER_FORMATS + VECTOR_FORMATS)}).")
+        if rendition not in renditions:
+            renditions.append(rendition)
+    if not renditions:
+        raise ValueError("No asset formats given.")
+    return renditions
+
+
+def drawable_name(layer_name, kind, used_names):
+    """Turns a Figma layer name into a unique Android resource name, e.g. 'Icon/Arrow Back' -> 'ic_arrow_back'."""
+    prefix = ASSET_NAME_PREFIXES[kind]
+    words = [word.lower() for word in re.findall(r"[A-Za-z0-9]+", layer_name or "")]
+    while words and words[0] in ("ic", "icon", "img", "image"):
+        words.pop(0)
+    name = "_".join([prefix] + words) if words else f"{prefix}_asset"
+    candidate, suffix = name, 2
+    while candidate in used_names:
+        candidate = f"{name}_{suffix}"
+        suffix += 1
+    used_names.add(candidate)
+    return candidate
+
+
+def _visible(node):
+    return isinstance(node, dict) and node.get("visible", True) is not False
+
+
+def _has_image_fill(node):
+    return any(isinstance(fill, dict) and fill.get("type") == "IMAGE" and fill.get("visible", True) is not False
+               for fill in node.get("fills") or [])
+
+
+def _vector_only(node):
+    """(all visible leaves are shapes, at least one is a real path) for a node's subtree."""
+    node_type = node.get("type")
+    if _has_image_fill(node):
+        return False, False
+    if node_type in SHAPE_NODE_TYPES:
+        return True, node_type in PATH_NODE_TYPES
+    if node_type not in CONTAINER_NODE_TYPES:
+        return False, False
+    children = [child for child in node.get("children") or [] if _visible(child)]
+    if not children:
+        return False, False
+    has_path = False
+    for child in children:
+        shapes_only, child_has_path = _vector_only(child)
+        if not shapes_only:
+            return False, False
+        has_path = has_path or child_has_path
+    return True, has_path
+
+
+def discover_assets(nodes_response, max_assets=MAX_ASSETS_PER_EXPORT):
+    """Returns (assets, truncated) for the frame in a /nodes response, in document order."""
+    _, entry = root_document(nodes_response)
+    if not entry:
+        return [], False
+    assets, used_names = [], set()
+
+    def visit(node):
+        for child in node.get("children") or []:
+            if not _visible(child) or len(assets) > max_assets:
+                continue
+            shapes_only, has_path = _vector_only(child)
+            if shapes_only and (has_path or child.get("exportSettings")):
+                assets.append(Asset(child["id"], drawable_name(child.get("name"), ASSET_KIND_VECTOR, used_names),
+                                    ASSET_KIND_VECTOR, child.get("name")))
+                continue
+            if _has_image_fill(child) or child.get("exportSettings"):
+                assets.append(Asset(child["id"], drawable_name(child.get("name"), ASSET_KIND_RASTER, used_names),
+                                    ASSET_KIND_RASTER, child.get("name")))
+            visit(child)
+
+    visit(entry["document"])
+    return assets[:max_assets], len(assets) > max_assets
+
+
+def rendition_path(asset, image_format, scale):
+    """Path of a rendition relative to the export directory."""
+    if scale is None:
+        return os.path.join(image_format, f"{asset.name}.{image_format}")
+    return os.path.join(DENSITY_DIRECTORIES[scale], f"{asset.name}.{image_format}")
+
+
+def plan_renditions(assets, export_spec):
+    """(asset, image_format, scale, relative_path) for every rendition an asset should get."""
+    planned = []
+    for asset in assets:
+        for image_format, scale in export_spec:
+            if asset.kind == ASSET_KIND_RASTER and image_format in VECTOR_FORMATS:
+                continue
+            planned.append((asset, image_format, scale, rendition_path(asset, image_format, scale)))
+    return planned
+
+
+def export_assets(client, file_key, nodes_response, output_dir, spec=DEFAULT_ASSET_EXPORT_SPEC):
+    """
+    Discovers, renders and downloads the frame's assets into `output_dir`, replacing any earlier export,
+    and writes its assets.json. Returns (assets, AssetExportResult, warnings). Raises ValueError for an invalid spec,
+    AssetExportError if every rendition failed.
+    """
+    export_spec = parse_export_spec(spec)
+    assets, truncated = discover_assets(nodes_response)
+    warnings = [f"Only the first {MAX_ASSETS_PER_EXPORT} assets were exported."] if truncated else []
+    planned = plan_renditions(assets, export_spec)
+
+    # The export is built next to `output_dir` and swapped in whole, so a failed one leaves the previous
+    # export intact, and renditions from an earlier spec do not linger next to the new ones.
+    parent_dir = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(output_dir)}.", dir=parent_dir)
+    try:
+        export = run_asset_export_pipeline(client, file_key, [(asset.node_id, image_format, scale, os.path.join(work_dir, path))
+                                                              for asset, image_format, scale, path in planned])
+        if planned and not export.files:
+            raise AssetExportError(f"None of the {len(planned)} rendition(s) could be exported"
+                                   + (f": {export.errors[0]}" if export.errors else "."))
+        written = set(export.files)
+        for asset, _, _, path in planned:
+            if os.path.join(work_dir, path) in written:
+                asset.files.append(path.replace(os.sep, "/"))
+        with open(os.path.join(work_dir, ASSET_MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({"file_key": file_key, "spec": spec,
+                       "assets": [{"name": asset.name, "node_id": asset.node_id, "layer_name": asset.layer_name,
+                                   "kind": asset.kind, "files": asset.files} for asset in assets]}, f, indent=2)
+        _swap_in(work_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    export.files = [os.path.join(output_dir, os.path.relpath(path, work_dir)) for path in export.files]
+    return assets, export, warnings + export.errors
+
+
+def _swap_in(work_dir, output_dir):
+    """Replaces `output_dir` with `work_dir`; the old export is only removed once the new one is in place."""
+    retired_dir = None
+    if os.path.exists(output_dir):
+        retired_dir = f"{work_dir}.old"
+        os.replace(output_dir, retired_dir)
+    try:
+        os.replace(work_dir, output_dir)
+    except OSError:
+        if retired_dir:
+            os.replace(retired_dir, output_dir)
+        raise
+    if retired_dir:
+        shutil.rmtree(retired_dir, ignore_errors=True)
+
+
+def format_asset_export_summary(assets, export):
+    return (f"Exported {len(assets)} asset(s) as {len(export.files)} file(s) ({export.bytes_written / 1024:,.0f} KiB) "
+            f"with {export.api_calls} Figma render call(s): {export.timing_summary()}")
@@ -0,0 +1,337 @@
+"""Headless batch mode: converts a manifest of Figma frames without the web UI.
+
+    python3 batch_cli.py manifest.json --out-dir generated
+
+The manifest is a JSON list of frames, or an object with a "frames" list plus
+defaults for every frame ("instructions", "split_subtrees"). A frame is a
+Figma URL string or an object:
+
+    {"url": "https://www.figma.com/design/<key>/...?node-id=1-2",
+     "instructions": "Use Material 3", "name": "LoginScreen", "split_subtrees": false}
+
+With --incremental, each frame only regenerates the subtrees that changed
+since its previous incremental run (see incremental_generation.py), so
+re-running a manifest after small design edits is quick.
+
+Each frame is fetched (through the shared Figma cache) and generated with the
+same prompt building, compaction and generation cache as the web UI. Frames
+run on a bounded worker pool; fetches and Gemini calls have separate
+concurrency limits, so one frame can be generating while the next is being
+fetched. One .kt file is written per frame, followed by a throughput and
+latency summary. Tokens come from the FIGMA_ACCESS_TOKEN and GEMINI_API_KEY
+environment variables. With --export-assets, each frame's icons and images
+are also exported as drawables into <name>_assets/ next to its .kt file
+(see asset_export.py).
+"""
+import os
+import sys
+import math
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import figma_to_jetpack as app_module
+from figma_client import FigmaClient
+from fetch_pipeline import run_fetch_pipeline
+from nodes_stream import load_prompt_json
+from asset_export import export_assets, parse_export_spec, format_asset_export_summary, DEFAULT_ASSET_EXPORT_SPEC
+from parallel_generation import composable_name, root_document
+from sse import event_payload, decode_code_chunk, is_control_payload, ERROR_PREFIX, INFO_PREFIX
+
+# --- Configuration ---
+DEFAULT_FIGMA_CONCURRENCY = 4
+DEFAULT_GEMINI_CONCURRENCY = 2
+DEFAULT_OUTPUT_DIR = "generated"
+KOTLIN_FILE_EXTENSION = ".kt"
+ASSETS_DIR_SUFFIX = "_assets"
+
+
+class ManifestError(ValueError):
+    pass
+
+
+class FrameTask:
+    """One manifest entry and what happened to it."""
+
+    def __init__(self, index, url, file_key, node_id, instructions="", name=None, split_subtrees=False):
+        self.index = index
+        self.url = url
+        self.file_key = file_key
+        self.node_id = node_id
+        self.instructions = instructions
+        self.name = name
+        self.split_subtrees = split_subtrees
+        self.file_suffix = node_id.replace(":", "-").replace(";", "_")
+        self.output_path = None
+        self.error = None
+        self.fetch_cache_status = None
+        self.generation_cached = False
+        self.code_chars = 0
+        self.asset_files = 0
+        self.fetch_seconds = 0.0
+        self.generate_seconds = 0.0
+        self.total_seconds = 0.0
+
+    @property
+    def label(self):
+        return f"[{self.index}] {self.name or self.node_id}"
+
+
+def load_manifest(path):
+    """Parses the manifest file into FrameTasks. Raises ManifestError with a readable message."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ManifestError(f"Could not read manifest '{path}': {e}")
+
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest
+        manifest = manifest.get("frames")
+    if not isinstance(manifest, list) or not manifest:
+        raise ManifestError("Manifest must be a non-empty list of frames or an object with a 'frames' list.")
+
+    tasks, explicit_names, seen_nodes = [], set(), set()
+    for index, entry in enumerate(manifest, 1):
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        if not isinstance(entry, dict) or not entry.get("url"):
+            raise ManifestError(f"Frame {index}: expected a Figma URL or an object with a 'url'.")
+        file_key, node_id = app_module.parse_figma_url(entry["url"])
+        if not file_key or not node_id:
+            raise ManifestError(f"Frame {index}: could not parse File Key or Node ID from URL: {entry['url']}")
+        instructions = "\n".join(part for part in (defaults.get("instructions"), entry.get("instructions")) if part)
+        task = FrameTask(index, entry["url"], file_key, node_id, instructions=instructions, name=entry.get("name"),
+                         split_subtrees=bool(entry.get("split_subtrees", defaults.get("split_subtrees", False))))
+        if task.name:
+            if task.name in explicit_names:
+                raise ManifestError(f"Frame {index}: name '{task.name}' is used by more than one frame.")
+            explicit_names.add(task.name)
+        if (file_key, node_id) in seen_nodes:
+            task.file_suffix += f"_{index}"
+        seen_nodes.add((file_key, node_id))
+        tasks.append(task)
+    return tasks
+
+
+class BatchRunner:
+    """Runs FrameTasks through fetch and generation with separate Figma and Gemini concurrency limits."""
+
+    def __init__(self, figma_token, gemini_api_key, output_dir, figma_concurrency=DEFAULT_FIGMA_CONCURRENCY,
+                 gemini_concurrency=DEFAULT_GEMINI_CONCURRENCY, force_regenerate=False, asset_export_spec=None,
+                 incremental=False):
+        self.figma_client = FigmaClient(figma_token)
+        self.gemini_api_key = gemini_api_key
+        self.output_dir = output_dir
+        self.figma_concurrency = figma_concurrency
+        self.gemini_concurrency = gemini_concurrency
+        self.force_regenerate = force_regenerate
+        self.asset_export_spec = asset_export_spec
+        self.incremental = incremental
+        self._figma_slots = threading.BoundedSemaphore(figma_concurrency)
+        self._gemini_slots = threading.BoundedSemaphore(gemini_concurrency)
+        self._print_lock = threading.Lock()
+
+    def log(self, message):
+        with self._print_lock:
+            sys.stdout.write(message + "\n")
+            sys.stdout.flush()
+
+    def run(self, tasks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        started = time.perf_counter()
+        # Enough workers that every Figma and Gemini slot can be busy at once.
+        with ThreadPoolExecutor(max_workers=self.figma_concurrency + self.gemini_concurrency,
+                                thread_name_prefix="batch-frame") as executor:
+            list(executor.map(self._run_task, tasks))
+        return time.perf_counter() - started
+
+    def _run_task(self, task):
+        started = time.perf_counter()
+        try:
+            job = self._fetch(task)
+            if job is not None:
+                self._generate(task, job)
+        except Exception as e:
+            task.error = f"Unexpected error: {e}"
+        task.total_seconds = time.perf_counter() - started
+        if task.error:
+            self.log(f"{task.label} FAILED after {task.total_seconds:.1f}s: {task.error}")
+        else:
+            self.log(f"{task.label} wrote {task.output_path} ({task.code_chars:,} chars) in {task.total_seconds:.1f}s "
+                     f"(fetch {task.fetch_seconds:.1f}s, generate {task.generate_seconds:.1f}s)")
+
+    def _fetch(self, task):
+        job = app_module.artifact_store.create_job(file_key=task.file_key, node_id=task.node_id)
+        with self._figma_slots:
+            result = run_fetch_pipeline(self.figma_client, task.file_key, task.node_id,
+                                        job.path(app_module.OUTPUT_JSON_FILENAME),
+                                        job.path(app_module.image_filename_for(task.node_id)),
+                                        app_module.OUTPUT_IMAGE_FORMAT, cache=app_module.figma_cache,
+                                        svg_optimizer=app_module.prompt_svg_optimizer())
+        task.fetch_seconds = result.total_seconds
+        task.fetch_cache_status = result.cache_status
+        if result.json_error:
+            task.error = result.json_error
+            return None
+        app_module.artifact_store.record_artifact(job, 'json', result.json_path)
+        if result.prompt_json_path:
+            app_module.artifact_store.record_artifact(job, 'prompt_json', result.prompt_json_path)
+        if result.image_path:
+            app_module.artifact_store.record_artifact(job, 'image', result.image_path)
+            app_module.record_prompt_svg(job, result)
+        elif result.image_error or result.image_warning:
+            self.log(f"{task.label} {result.image_error or result.image_warning}")
+        self._assign_output_path(task, result)
+        if self.asset_export_spec:
+            self._export_assets(task, result.json_path)
+        return job
+
+    def _export_assets(self, task, json_path):
+        """Asset export failures are logged but do not fail the frame; its code can still be generated."""
+        assets_dir = os.path.splitext(task.output_path)[0] + ASSETS_DIR_SUFFIX
+        try:
+            # Export settings are pruned from the prompt JSON, so this reads the raw response.
+            with open(json_path, 'r', encoding='utf-8') as f:
+                node_json = json.load(f)
+            with self._figma_slots:
+                assets, export, warnings = export_assets(self.figma_client, task.file_key, node_json, assets_dir,
+                                                         self.asset_export_spec)
+        except Exception as e:
+            self.log(f"{task.label} asset export failed: {e}")
+            return
+        task.asset_files = len(export.files)
+        self.log(f"{task.label} {format_asset_export_summary(assets, export)} -> {assets_dir}")
+        for warning in warnings:
+            self.log(f"{task.label} {warning}")
+
+    def _assign_output_path(self, task, result):
+        """Manifest name if given, else the Figma layer name plus the node id, so reruns write the same files."""
+        if task.name:
+            file_stem = task.name
+        else:
+            # A cache hit has no node_json; its name comes from one pass over the cached JSON.
+            node_json = result.node_json or load_prompt_json(result.json_path)
+            _, entry = root_document(node_json)
+            figma_name = entry["document"].get("name") if entry else None
+            file_stem = f"{composable_name(figma_name, set(), fallback='Frame')}_{task.file_suffix}"
+        task.output_path = os.path.join(self.output_dir, file_stem + KOTLIN_FILE_EXTENSION)
+
+    def _generate(self, task, job):
+        inputs = app_module.load_generation_inputs(job.artifact_path('json'), app_module.prompt_svg_path(job),
+                                                   job.artifact_path('prompt_json'))
+        with self._gemini_slots:
+            started = time.perf_counter()
+            events = app_module.compose_generation_sse(self.gemini_api_key, inputs, task.instructions,
+                                                       split_subtrees=task.split_subtrees,
+                                                       force_regenerate=self.force_regenerate,
+                                                       incremental_node=(task.file_key, task.node_id) if self.incremental else None)
+            code, error = collect_generated_code(events, task)
+            task.generate_seconds = time.perf_counter() - started
+        if error:
+            task.error = error
+            return
+        with open(task.output_path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        task.code_chars = len(code)
+
+
+def collect_generated_code(sse_events, task=None):
+    """Consumes a generation's SSE events. Returns (code, error_message)."""
+    parts, error = [], None
+    for event in sse_events:
+        payload = event_payload(event)
+        if payload.startswith(ERROR_PREFIX):
+            error = error or payload[len(ERROR_PREFIX):].strip()
+        elif payload.startswith(INFO_PREFIX):
+            if task is not None and "Served from generation cache" in payload:
+                task.generation_cached = True
+        elif not is_control_payload(payload):
+            parts.append(decode_code_chunk(payload))
+    code = "".join(parts)
+    if not error and not code.strip():
+        error = "No code was generated."
+    return code, error
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def format_summary(tasks, wall_seconds, figma_concurrency, gemini_concurrency):
+    succeeded = [task for task in tasks if not task.error]
+    lines = [
+        "--- Batch summary ---",
+        f"Frames: {len(succeeded)} succeeded, {len(tasks) - len(succeeded)} failed, {len(tasks)} total "
+        f"(Figma concurrency {figma_concurrency}, Gemini concurrency {gemini_concurrency})",
+        f"Wall time: {wall_seconds:.1f}s, throughput: {len(succeeded) / wall_seconds * 60 if wall_seconds else 0.0:.1f} frames/min",
+    ]
+    if succeeded:
+        for label, attribute in (("Fetch", "fetch_seconds"), ("Generate", "generate_seconds"), ("End-to-end", "total_seconds")):
+            values = [getattr(task, attribute) for task in succeeded]
+            lines.append(f"{label} latency: p50 {percentile(values, 0.5):.1f}s, p95 {percentile(values, 0.95):.1f}s, "
+                         f"max {max(values):.1f}s")
+        fetch_hits = sum(1 for task in succeeded if task.fetch_cache_status in ("hit", "revalidated"))
+        generation_hits = sum(1 for task in succeeded if task.generation_cached)
+        lines.append(f"Cache: {fetch_hits} fetch hit(s), {generation_hits} generation hit(s)")
+        asset_files = sum(task.asset_files for task in succeeded)
+        if asset_files:
+            lines.append(f"Assets: {asset_files} drawable file(s) exported")
+    for task in tasks:
+        if task.error:
+            lines.append(f"Failed {task.label} ({task.url}): {task.error}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a manifest of Figma frames to Jetpack Compose files.")
+    parser.add_argument("manifest", help="JSON manifest of Figma frame URLs and per-frame instructions")
+    parser.add_argument("--out-dir", default=DEFAULT_OUTPUT_DIR, help=f"where .kt files are written (default: {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("--figma-concurrency", type=int, default=DEFAULT_FIGMA_CONCURRENCY,
+                        help=f"max concurrent Figma fetches (default: {DEFAULT_FIGMA_CONCURRENCY})")
+    parser.add_argument("--gemini-concurrency", type=int, default=DEFAULT_GEMINI_CONCURRENCY,
+                        help=f"max concurrent Gemini generations (default: {DEFAULT_GEMINI_CONCURRENCY})")
+    parser.add_argument("--force-regenerate", action="store_true", help="ignore the generation cache")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only regenerate the subtrees of each frame that changed since its last incremental run")
+    parser.add_argument("--export-assets", nargs="?", const=DEFAULT_ASSET_EXPORT_SPEC, metavar="SPEC",
+                        help=f"also export icons and images as drawables (default spec: {DEFAULT_ASSET_EXPORT_SPEC})")
+    args = parser.parse_args(argv)
+
+    if args.figma_concurrency < 1 or args.gemini_concurrency < 1:
+        parser.error("concurrency limits must be at least 1")
+    if args.export_assets:
+        try:
+            parse_export_spec(args.export_assets)
+        except ValueError as e:
+            parser.error(f"--export-assets: {e}")
+    figma_token = os.environ.get(app_module.FIGMA_TOKEN_ENV_VAR)
+    gemini_api_key = os.environ.get(app_module.GEMINI_API_KEY_ENV_VAR)
+    if not figma_token or not gemini_api_key:
+        print(f"Error: set the '{app_module.FIGMA_TOKEN_ENV_VAR}' and '{app_module.GEMINI_API_KEY_ENV_VAR}' environment variables.",
+              file=sys.stderr)
+        return 2
+    try:
+        tasks = load_manifest(args.manifest)
+    except ManifestError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    # Several frames stream at once, so per-chunk console output would interleave.
+    app_module.ECHO_GEMINI_STREAM = False
+    runner = BatchRunner(figma_token, gemini_api_key, args.out_dir, figma_concurrency=args.figma_concurrency,
+                         gemini_concurrency=args.gemini_concurrency, force_regenerate=args.force_regenerate,
+                         asset_export_spec=args.export_assets, incremental=args.incremental)
+    print(f"Batch: {len(tasks)} frame(s) from '{args.manifest}' -> '{args.out_dir}/' with Gemini model '{app_module.GEMINI_MODEL_NAME}'.")
+    wall_seconds = runner.run(tasks)
+    print(format_summary(tasks, wall_seconds, args.figma_concurrency, args.gemini_concurrency))
+    return 1 if any(task.error for task in tasks) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
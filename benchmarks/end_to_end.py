@@ -0,0 +1,415 @@
+"""Benchmark: offline end-to-end latency of fetch and generation.
+
+    python3 benchmarks/end_to_end.py --sizes small,medium,huge --concurrency 1,8 --output results.json
+    python3 benchmarks/end_to_end.py --baseline results-main.json       # run and compare with an older run
+    python3 benchmarks/end_to_end.py --compare results-main.json results.json
+
+Nothing leaves the machine. A stub Figma API (stub_figma.py) serves small,
+medium and huge synthetic frames with configurable latency. The app runs in
+its own process (Flask's threaded server, or asgi_app.py with --server asgi)
+with its model swapped for fake_genai.py, which streams canned Kotlin at a
+configurable token rate. Caches, job artifacts and rate-limit state go to a
+temporary directory, and the rate limits are raised out of the way.
+
+For every size and concurrency level, --requests user flows run with
+`concurrency` at a time. Each flow is a browser's sequence:
+  fetch       POST /fetch (fresh node id, so the node cache misses unless --warm-figma-cache) and the page it redirects to
+  generation  GET /stream_compose_generation?force_regenerate=1 until [STREAM_END]; first_chunk is the first code event
+Results are p50/p95/p99/mean/max latencies per phase, throughput and the app
+server's CPU time per flow (Linux only), written as JSON (--output) together
+with the git commit and full configuration.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import itertools
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.cookiejar
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from stub_figma import StubFigmaServer, FRAME_SIZES, file_key_for
+import fake_genai
+
+# --- Configuration ---
+RESULTS_FORMAT_VERSION = 1
+DEFAULT_SIZES = "small,medium,huge"
+DEFAULT_CONCURRENCY = "1,8"
+DEFAULT_REQUESTS = 16
+DEFAULT_WARMUP = 2
+DEFAULT_PORT = 5097
+DEFAULT_FIGMA_LATENCY_MS = 120.0
+DEFAULT_FIGMA_JITTER_MS = 40.0
+SERVER_START_TIMEOUT_SECONDS = 30.0
+REQUEST_TIMEOUT_SECONDS = 300.0
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+PHASES = ("fetch", "first_chunk", "generation", "end_to_end")
+# Relative change that --compare flags as a regression or improvement.
+COMPARE_THRESHOLD = 0.10
+
+
+# --- Server side ---
+
+def serve(args):
+    """Runs the app with the fake model (in the benchmark's server subprocess)."""
+    import figma_to_jetpack as flask_module
+    fake_genai.set_stream_profile(first_chunk_seconds=args.first_chunk_ms / 1000.0, tokens_per_second=args.tokens_per_second,
+                                  output_tokens=args.output_tokens, tokens_per_chunk=args.tokens_per_chunk)
+    flask_module.genai = fake_genai
+    flask_module.ECHO_GEMINI_STREAM = False
+    # The per-request prints are not what is being measured; keep them off the console.
+    sys.stdout = open(os.devnull, "w")
+    if args.server == "asgi":
+        import uvicorn
+        import asgi_app
+        uvicorn.run(asgi_app.app, host="127.0.0.1", port=args.port, log_level="error", backlog=2048)
+    else:
+        from werkzeug.serving import run_simple
+        import logging
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        run_simple("127.0.0.1", args.port, flask_module.app, threaded=True)
+
+
+def server_environment(work_dir, figma_base_url):
+    return dict(
+        os.environ,
+        PYTHONUNBUFFERED="1",
+        FIGMA_API_BASE_URL=figma_base_url,
+        FIGMA_ACCESS_TOKEN="benchmark-figma-token",
+        GEMINI_API_KEY="benchmark-gemini-key",
+        FLASK_SECRET_KEY="benchmark",
+        FIGMA_CACHE_DIR=os.path.join(work_dir, "figma_cache"),
+        FIGMA_JOBS_DIR=os.path.join(work_dir, "jobs"),
+        GENERATION_CACHE_PATH=os.path.join(work_dir, "generations.sqlite3"),
+        RATE_LIMIT_DB_PATH=os.path.join(work_dir, "rate_limits.sqlite3"),
+        RESULT_STORE_PATH=os.path.join(work_dir, "results.sqlite3"),
+        FIGMA_RATE_LIMIT_PER_MINUTE="1000000",
+        GEMINI_RATE_LIMIT_PER_MINUTE="1000000",
+    )
+
+
+def wait_for_server(port, process):
+    deadline = time.time() + SERVER_START_TIMEOUT_SECONDS
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app server exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("app server did not start")
+
+
+# --- Client side ---
+
+class UserSession:
+    """One browser: its own cookie jar, so the Flask session (and fetched job) is per user."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def fetch(self, figma_url):
+        data = urllib.parse.urlencode({"figma_url": figma_url}).encode()
+        with self._opener.open(f"{self.base_url}/fetch", data=data, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+            page = response.read().decode("utf-8", "replace")
+        # "Fetch timings" is only flashed once the node JSON is saved.
+        if "Fetch timings:" not in page:
+            raise RuntimeError("fetch did not succeed")
+
+    def generate(self, params):
+        """Streams one generation. Returns (seconds to first code event, total seconds)."""
+        query = urllib.parse.urlencode(params)
+        started = time.perf_counter()
+        first_chunk = None
+        with self._opener.open(f"{self.base_url}/stream_compose_generation?{query}",
+                               timeout=REQUEST_TIMEOUT_SECONDS) as response:
+            for raw_line in response:
+                line = raw_line.decode("utf-8", "replace").rstrip("\n")
+                if not line.startswith("data: "):
+                    continue
+                payload = line[len("data: "):]
+                if payload == "[STREAM_END]":
+                    break
+                if payload.startswith("[ERROR]"):
+                    raise RuntimeError(payload)
+                if first_chunk is None and not payload.startswith("["):
+                    first_chunk = time.perf_counter() - started
+        if first_chunk is None:
+            raise RuntimeError("generation produced no code")
+        return first_chunk, time.perf_counter() - started
+
+
+class Scenario:
+    def __init__(self, size, concurrency, requests):
+        self.size = size
+        self.concurrency = concurrency
+        self.requests = requests
+
+    @property
+    def name(self):
+        return f"{self.size}-c{self.concurrency}"
+
+
+def run_flow(base_url, figma_url, generation_params):
+    user = UserSession(base_url)
+    started = time.perf_counter()
+    user.fetch(figma_url)
+    fetch_seconds = time.perf_counter() - started
+    first_chunk, generation_seconds = user.generate(generation_params)
+    return {"fetch": fetch_seconds, "first_chunk": first_chunk, "generation": generation_seconds,
+            "end_to_end": time.perf_counter() - started}
+
+
+def process_cpu_seconds(pid):
+    """User + system CPU time of process `pid` from /proc, or None where that is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def run_scenario(scenario, base_url, args, node_counter, server_pid):
+    def figma_url():
+        # A fresh node id per flow misses the node cache; a fixed one hits it after the first fetch.
+        node = 1 if args.warm_figma_cache else next(node_counter)
+        return f"https://www.figma.com/design/{file_key_for(scenario.size)}/Bench?node-id=1-{node}"
+
+    generation_params = {"force_regenerate": "1", "split_subtrees": "1" if args.split_subtrees else "0"}
+    for _ in range(args.warmup):
+        run_flow(base_url, figma_url(), generation_params)
+
+    samples, errors = [], []
+    lock = threading.Lock()
+
+    def one_flow(_):
+        try:
+            sample = run_flow(base_url, figma_url(), generation_params)
+        except Exception as e:
+            with lock:
+                errors.append(str(e) or type(e).__name__)
+            return
+        with lock:
+            samples.append(sample)
+
+    cpu_before = process_cpu_seconds(server_pid)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=scenario.concurrency) as pool:
+        list(pool.map(one_flow, range(scenario.requests)))
+    wall_seconds = time.perf_counter() - started
+    cpu_after = process_cpu_seconds(server_pid)
+    server_cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return scenario_result(scenario, samples, errors, wall_seconds, server_cpu)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def latency_summary(values):
+    if not values:
+        return None
+    summary = {name: round(percentile(values, fraction), 4) for name, fraction in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 4)
+    summary["max"] = round(max(values), 4)
+    return summary
+
+
+def scenario_result(scenario, samples, errors, wall_seconds, server_cpu_seconds=None):
+    return {
+        "name": scenario.name,
+        "size": scenario.size,
+        "concurrency": scenario.concurrency,
+        "requests": scenario.requests,
+        "completed": len(samples),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_second": round(len(samples) / wall_seconds, 4) if wall_seconds > 0 else None,
+        "server_cpu_seconds_per_flow": round(server_cpu_seconds / len(samples), 4)
+        if server_cpu_seconds is not None and samples else None,
+        "latency_seconds": {phase: latency_summary([sample[phase] for sample in samples]) for phase in PHASES},
+    }
+
+
+def git_revision():
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "subject": git("log", "-1", "--format=%s") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def run_benchmark(args):
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in FRAME_SIZES]
+    if unknown:
+        raise SystemExit(f"Unknown frame size(s): {', '.join(unknown)} (choose from {', '.join(FRAME_SIZES)})")
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+
+    work_dir = tempfile.mkdtemp(prefix="figma-bench-")
+    stub = StubFigmaServer(latency_ms=args.figma_latency_ms, jitter_ms=args.figma_jitter_ms).start()
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--server", args.server, "--port", str(args.port),
+               "--first-chunk-ms", str(args.first_chunk_ms), "--tokens-per-second", str(args.tokens_per_second),
+               "--output-tokens", str(args.output_tokens), "--tokens-per-chunk", str(args.tokens_per_chunk)]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=server_environment(work_dir, stub.base_url),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    node_counter = itertools.count(2)
+    scenarios = []
+    try:
+        wait_for_server(args.port, process)
+        base_url = f"http://127.0.0.1:{args.port}"
+        for size in sizes:
+            for concurrency in concurrency_levels:
+                scenario = Scenario(size, concurrency, args.requests)
+                result = run_scenario(scenario, base_url, args, node_counter, process.pid)
+                scenarios.append(result)
+                print(format_scenario(result), flush=True)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    config = {key: getattr(args, key) for key in (
+        "server", "sizes", "concurrency", "requests", "warmup", "figma_latency_ms", "figma_jitter_ms",
+        "first_chunk_ms", "tokens_per_second", "output_tokens", "tokens_per_chunk", "split_subtrees",
+        "warm_figma_cache")}
+    config["frame_nodes"] = {size: FRAME_SIZES[size] * 6 for size in sizes}
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "benchmark": "end_to_end",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git": git_revision(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "config": config,
+        "scenarios": scenarios,
+    }
+
+
+# --- Reporting ---
+
+def format_scenario(result):
+    lines = [f"{result['name']}: {result['completed']}/{result['requests']} flows, {result['errors']} error(s), "
+             f"{result['throughput_per_second'] or 0:.2f} flows/s"]
+    if result.get("server_cpu_seconds_per_flow") is not None:
+        lines[0] += f", server CPU {result['server_cpu_seconds_per_flow'] * 1000:.0f}ms/flow"
+    for phase in PHASES:
+        summary = result["latency_seconds"][phase]
+        if summary:
+            lines.append(f"  {phase:12s} p50 {summary['p50'] * 1000:8.1f}ms  p95 {summary['p95'] * 1000:8.1f}ms  "
+                         f"p99 {summary['p99'] * 1000:8.1f}ms")
+    if result["first_error"]:
+        lines.append(f"  first error: {result['first_error']}")
+    return "\n".join(lines)
+
+
+def _change(old, new, lower_is_better=True):
+    if old is None or new is None:
+        return "n/a"
+    if old == 0:
+        return f"{new:.3f}"
+    delta = (new - old) / old
+    flag = ""
+    if abs(delta) >= COMPARE_THRESHOLD:
+        flag = "  better" if (delta < 0) == lower_is_better else "  WORSE"
+    return f"{delta * 100:+6.1f}%{flag}"
+
+
+def compare_results(baseline, current):
+    """Human-readable comparison of two result documents, matched by scenario name."""
+    def label(results):
+        git = results.get("git") or {}
+        commit = (git.get("commit") or "unknown")[:10]
+        return commit + (" (dirty)" if git.get("dirty") else "")
+
+    lines = [f"baseline {label(baseline)}  vs  current {label(current)}"]
+    if baseline.get("config") != current.get("config"):
+        lines.append("  note: the two runs used different configurations")
+    old_scenarios = {scenario["name"]: scenario for scenario in baseline.get("scenarios", [])}
+    for scenario in current.get("scenarios", []):
+        old = old_scenarios.get(scenario["name"])
+        if old is None:
+            lines.append(f"{scenario['name']}: not in baseline")
+            continue
+        lines.append(f"{scenario['name']}: throughput "
+                     f"{_change(old['throughput_per_second'], scenario['throughput_per_second'], lower_is_better=False)}, "
+                     f"server CPU/flow {_change(old.get('server_cpu_seconds_per_flow'), scenario.get('server_cpu_seconds_per_flow'))}, "
+                     f"errors {old['errors']} -> {scenario['errors']}")
+        for phase in PHASES:
+            old_summary, new_summary = old["latency_seconds"].get(phase), scenario["latency_seconds"].get(phase)
+            if not old_summary or not new_summary:
+                continue
+            changes = ", ".join(f"{name} {_change(old_summary[name], new_summary[name])}" for name, _ in PERCENTILES)
+            lines.append(f"  {phase:12s} {changes}")
+    return "\n".join(lines)
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with a stub Figma API and a fake model.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated frame sizes: {', '.join(FRAME_SIZES)}")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma-separated concurrent user counts")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="measured flows per scenario")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="unmeasured flows before each scenario")
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--figma-latency-ms", type=float, default=DEFAULT_FIGMA_LATENCY_MS)
+    parser.add_argument("--figma-jitter-ms", type=float, default=DEFAULT_FIGMA_JITTER_MS)
+    parser.add_argument("--first-chunk-ms", type=float, default=fake_genai.DEFAULT_FIRST_CHUNK_SECONDS * 1000)
+    parser.add_argument("--tokens-per-second", type=float, default=fake_genai.DEFAULT_TOKENS_PER_SECOND)
+    parser.add_argument("--output-tokens", type=int, default=fake_genai.DEFAULT_OUTPUT_TOKENS)
+    parser.add_argument("--tokens-per-chunk", type=int, default=fake_genai.DEFAULT_TOKENS_PER_CHUNK)
+    parser.add_argument("--split-subtrees", action="store_true", help="generate subtrees in parallel")
+    parser.add_argument("--warm-figma-cache", action="store_true", help="fetch the same node every time")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare this run with")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two results files and exit")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args)
+        return 0
+    if args.compare:
+        print(compare_results(load_results(args.compare[0]), load_results(args.compare[1])))
+        return 0
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    results = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Results written to {args.output}")
+    if baseline is not None:
+        print(compare_results(baseline, results))
+    return 1 if any(scenario["errors"] for scenario in results["scenarios"]) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
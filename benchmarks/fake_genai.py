@@ -0,0 +1,112 @@
+"""Stand-in for `google.generativeai` that streams canned Kotlin at a fixed token rate.
+
+Only the surface this app uses is implemented: configure(), GenerativeModel
+and generate_content(prompt, stream=True). Timing is set with
+set_stream_profile(): a time-to-first-chunk, then chunks of
+`tokens_per_chunk` tokens paced at `tokens_per_second`, for `output_tokens`
+tokens in total. Swap it in with `figma_to_jetpack.genai = fake_genai`.
+"""
+import time
+
+# --- Configuration ---
+CHARS_PER_TOKEN = 4
+DEFAULT_FIRST_CHUNK_SECONDS = 0.8
+DEFAULT_TOKENS_PER_SECOND = 150.0
+DEFAULT_OUTPUT_TOKENS = 1500
+DEFAULT_TOKENS_PER_CHUNK = 24
+
+_profile = {
+    "first_chunk_seconds": DEFAULT_FIRST_CHUNK_SECONDS,
+    "tokens_per_second": DEFAULT_TOKENS_PER_SECOND,
+    "output_tokens": DEFAULT_OUTPUT_TOKENS,
+    "tokens_per_chunk": DEFAULT_TOKENS_PER_CHUNK,
+}
+
+_KOTLIN_HEADER = """package com.example.generated
+
+import androidx.compose.foundation.layout.*
+import androidx.compose.material3.*
+import androidx.compose.runtime.Composable
+import androidx.compose.ui.Modifier
+import androidx.compose.ui.unit.dp
+
+@Composable
+fun GeneratedScreen(modifier: Modifier = Modifier) {
+    Column(modifier = modifier.fillMaxSize().padding(16.dp), verticalArrangement = Arrangement.spacedBy(16.dp)) {
+"""
+_KOTLIN_CARD = """        Card(modifier = Modifier.fillMaxWidth()) {{
+            Column(modifier = Modifier.padding(16.dp), verticalArrangement = Arrangement.spacedBy(8.dp)) {{
+                Text(text = "Card title number {0}", style = MaterialTheme.typography.titleMedium)
+                Button(onClick = {{}}) {{ Text("Open") }}
+            }}
+        }}
+"""
+_KOTLIN_FOOTER = "    }\n}\n"
+
+
+def set_stream_profile(first_chunk_seconds=None, tokens_per_second=None, output_tokens=None, tokens_per_chunk=None):
+    """Sets how every subsequent fake stream is paced (None keeps the current value)."""
+    for key, value in (("first_chunk_seconds", first_chunk_seconds), ("tokens_per_second", tokens_per_second),
+                       ("output_tokens", output_tokens), ("tokens_per_chunk", tokens_per_chunk)):
+        if value is not None:
+            _profile[key] = value
+
+
+def stream_profile():
+    return dict(_profile)
+
+
+def kotlin_output(output_tokens):
+    """Plausible Compose code of roughly `output_tokens` tokens, wrapped in a ```kotlin fence."""
+    target_chars = output_tokens * CHARS_PER_TOKEN
+    body, card = [], 0
+    size = len(_KOTLIN_HEADER) + len(_KOTLIN_FOOTER)
+    while size < target_chars:
+        card += 1
+        body.append(_KOTLIN_CARD.format(card))
+        size += len(body[-1])
+    return "```kotlin\n" + _KOTLIN_HEADER + "".join(body) + _KOTLIN_FOOTER + "```\n"
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponseStream:
+    """Iterable like the real streaming response; paced by the profile captured when it was created."""
+
+    prompt_feedback = None
+
+    def __init__(self, profile):
+        self._profile = profile
+
+    def __iter__(self):
+        profile = self._profile
+        text = kotlin_output(profile["output_tokens"])
+        chunk_chars = max(1, int(profile["tokens_per_chunk"] * CHARS_PER_TOKEN))
+        seconds_per_chunk = profile["tokens_per_chunk"] / profile["tokens_per_second"] if profile["tokens_per_second"] else 0
+        started = time.perf_counter()
+        time.sleep(profile["first_chunk_seconds"])
+        for index, offset in enumerate(range(0, len(text), chunk_chars)):
+            # Pace against the start time so sleep overhead does not accumulate.
+            due = started + profile["first_chunk_seconds"] + index * seconds_per_chunk
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield Chunk(text[offset:offset + chunk_chars])
+
+
+def configure(api_key=None, **kwargs):
+    pass
+
+
+class GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        response = FakeResponseStream(stream_profile())
+        if stream:
+            return response
+        return Chunk("".join(chunk.text for chunk in response))
@@ -0,0 +1,194 @@
+"""Benchmark: how many concurrent SSE viewers one server process can hold.
+
+    python3 benchmarks/sse_concurrency.py --viewers 1000 --modes wsgi,asgi
+
+For each mode a server process is started with a synthetic generation job
+that emits one event per --interval for --duration seconds (no Figma or
+Gemini calls). N viewers then attach to /generation_jobs/<id>/events. The
+report covers how many viewers connected, the time until all of them got
+their first event, and the server's thread count and RSS while every stream
+was open. It also reports fan-out latency: the delay from an event being
+emitted to each viewer receiving it.
+
+    wsgi  Flask's threaded development server (what `python3 figma_to_jetpack.py` runs): one thread per stream
+    asgi  asgi_app.py under uvicorn: streams are coroutines on one event loop
+"""
+import os
+import sys
+import time
+import math
+import asyncio
+import argparse
+import resource
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# --- Configuration ---
+DEFAULT_VIEWERS = 500
+DEFAULT_DURATION_SECONDS = 10.0
+DEFAULT_INTERVAL_SECONDS = 0.5
+DEFAULT_PORT = 5099
+CONNECT_TIMEOUT_SECONDS = 30.0
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+# --- Server side ---
+
+def synthetic_generation(duration, interval):
+    """Stands in for a Gemini stream: one code chunk with its emit time every `interval` seconds."""
+    from sse import sse_data, sse_end
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        time.sleep(interval)
+        yield sse_data(f"// emitted_at={time.time():.6f}\n")
+    yield sse_end()
+
+
+def serve(mode, port, duration, interval, start_delay):
+    raise_fd_limit()
+    import figma_to_jetpack as flask_module
+    flask_module.ECHO_GEMINI_STREAM = False
+
+    def delayed_generation():
+        time.sleep(start_delay)
+        return synthetic_generation(duration, interval)
+
+    job = flask_module.generation_jobs.submit(delayed_generation)
+    print(f"JOB {job.job_id}", flush=True)
+    if mode == "asgi":
+        import uvicorn
+        import asgi_app
+        uvicorn.run(asgi_app.app, host="127.0.0.1", port=port, log_level="error", backlog=4096)
+    else:
+        from werkzeug.serving import run_simple
+        run_simple("127.0.0.1", port, flask_module.app, threaded=True)
+
+
+# --- Client side ---
+
+def process_stats(pid):
+    stats = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Threads", "VmRSS"):
+                    stats[key] = value.strip()
+    except OSError:
+        pass
+    return stats
+
+
+async def viewer(port, path, first_event_times, latencies, errors):
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), CONNECT_TIMEOUT_SECONDS)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n".encode())
+        await writer.drain()
+        got_first = False
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode().strip()
+            if line.startswith("id:") and not got_first:
+                got_first = True
+                first_event_times.append(time.perf_counter() - started)
+            if "emitted_at=" in line:
+                emitted_at = float(line.split("emitted_at=", 1)[1].split("\\n", 1)[0])
+                latencies.append(time.time() - emitted_at)
+            if line == "data: [STREAM_END]":
+                break
+        writer.close()
+    except Exception as e:
+        errors.append(str(e) or type(e).__name__)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+async def run_viewers(process, port, job_id, viewers, stats_after):
+    path = f"/generation_jobs/{job_id}/events"
+    first_event_times, latencies, errors = [], [], []
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(viewer(port, path, first_event_times, latencies, errors)) for _ in range(viewers)]
+    await asyncio.sleep(stats_after)
+    peak = process_stats(process.pid)
+    await asyncio.gather(*tasks)
+    return {
+        "connected": len(first_event_times),
+        "errors": errors,
+        "all_first_events_seconds": max(first_event_times) if first_event_times else None,
+        "latencies": latencies,
+        "wall_seconds": time.perf_counter() - started,
+        "server": peak,
+    }
+
+
+def benchmark_mode(mode, args):
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(args.port),
+         "--duration", str(args.duration), "--interval", str(args.interval), "--start-delay", str(args.start_delay)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, cwd=REPO_ROOT, env=env)
+    try:
+        job_line = process.stdout.readline().strip()
+        if not job_line.startswith("JOB "):
+            raise RuntimeError(f"{mode} server did not start")
+        time.sleep(1.5)  # let the server bind its port
+        return asyncio.run(run_viewers(process, args.port, job_line.split()[1], args.viewers,
+                                       stats_after=args.start_delay + args.duration / 2))
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def format_result(mode, result, viewers):
+    server = result["server"]
+    lines = [f"{mode}: {result['connected']}/{viewers} viewers connected, {len(result['errors'])} error(s)"]
+    if result["all_first_events_seconds"] is not None:
+        lines.append(f"  all viewers streaming after {result['all_first_events_seconds']:.2f}s")
+    lines.append(f"  server threads {server.get('Threads', '?')}, RSS {server.get('VmRSS', '?')} (mid-stream)")
+    if result["latencies"]:
+        latencies = result["latencies"]
+        lines.append(f"  fan-out latency p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+                     f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms, max {max(latencies) * 1000:.1f}ms")
+    if result["errors"]:
+        lines.append(f"  first error: {result['errors'][0]}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare concurrent SSE viewers under the WSGI and ASGI serving modes.")
+    parser.add_argument("--viewers", type=int, default=DEFAULT_VIEWERS)
+    parser.add_argument("--modes", default="wsgi,asgi", help="comma-separated: wsgi, asgi")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS, help="seconds the synthetic generation streams")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_SECONDS, help="seconds between synthetic events")
+    parser.add_argument("--start-delay", type=float, default=2.0, help="seconds before the synthetic generation starts")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--serve", choices=["wsgi", "asgi"], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, args.port, args.duration, args.interval, args.start_delay)
+        return 0
+
+    raise_fd_limit()
+    print(f"{args.viewers} viewers on one generation job streaming for {args.duration:.0f}s "
+          f"(one event every {args.interval}s)")
+    for mode in args.modes.split(","):
+        print(format_result(mode, benchmark_mode(mode.strip(), args), args.viewers), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
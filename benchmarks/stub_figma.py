@@ -0,0 +1,287 @@
+"""Stub Figma REST API for offline benchmarks.
+
+    python3 benchmarks/stub_figma.py --port 5098 --latency-ms 80
+    FIGMA_API_BASE_URL=http://127.0.0.1:5098 python3 figma_to_jetpack.py
+
+Serves the endpoints the fetch pipeline calls: /v1/files/{key}/nodes,
+/v1/images/{key}, /v1/files/{key}/meta and the image downloads those
+return. The frame size is chosen by the file key (see FRAME_SIZES). Any node
+id is accepted, so benchmarks can use fresh ids to defeat the node cache.
+Frames are synthetic but shaped like real exports: auto-layout cards with
+fills, strokes, effects, text styles, component instances, plugin data and
+full-precision floats, so compaction and prompt assembly do realistic work.
+Every response waits --latency-ms (plus up to --jitter-ms) first.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- Configuration ---
+DEFAULT_PORT = 5098
+# Cards per frame; each card is six nodes.
+FRAME_SIZES = {"small": 4, "medium": 60, "huge": 1000}
+CARDS_PER_SECTION = 20
+FILE_VERSION = "4242424242"
+LAST_MODIFIED = "2024-01-01T00:00:00Z"
+_ROOT_ID_PLACEHOLDER = "__ROOT_NODE_ID__"
+
+
+def file_key_for(size):
+    """File key the stub serves `size` frames under, e.g. BenchMedium."""
+    return f"Bench{size.capitalize()}"
+
+
+def size_for(file_key):
+    for size in FRAME_SIZES:
+        if file_key == file_key_for(size):
+            return size
+    return None
+
+
+def _color(rng):
+    return {"r": rng.random(), "g": rng.random(), "b": rng.random(), "a": 1}
+
+
+def _box(rng, x, y, width, height):
+    return {"x": x + rng.random() / 7, "y": y + rng.random() / 7, "width": width, "height": height}
+
+
+def _text(rng, node_id, name, characters, x, y, font_size):
+    return {
+        "id": node_id, "name": name, "type": "TEXT", "visible": True, "blendMode": "PASS_THROUGH",
+        "absoluteBoundingBox": _box(rng, x, y, 311, font_size * 1.5),
+        "absoluteRenderBounds": _box(rng, x, y, 311, font_size * 1.5),
+        "constraints": {"vertical": "TOP", "horizontal": "LEFT"},
+        "fills": [{"blendMode": "NORMAL", "type": "SOLID", "color": {"r": 0.1294117718935013, "g": 0.1294117718935013,
+                                                                     "b": 0.1294117718935013, "a": 1}}],
+        "strokes": [], "strokeWeight": 1, "strokeAlign": "OUTSIDE", "effects": [],
+        "characters": characters,
+        "style": {"fontFamily": "Roboto", "fontPostScriptName": "Roboto-Medium", "fontWeight": 500,
+                  "textAutoResize": "HEIGHT", "fontSize": font_size, "textAlignHorizontal": "LEFT",
+                  "textAlignVertical": "TOP", "letterSpacing": 0.15000000596046448,
+                  "lineHeightPx": font_size * 1.3333333730697632, "lineHeightPercent": 100,
+                  "lineHeightUnit": "INTRINSIC_%"},
+        "characterStyleOverrides": [], "styleOverrideTable": {}, "lineTypes": ["NONE"], "lineIndentations": [0],
+        "layoutAlign": "STRETCH", "layoutGrow": 0,
+        "pluginData": {"com.example.tokens": json.dumps({"token": f"text/{name.lower()}"})},
+    }
+
+
+def _card(rng, index, y):
+    base = f"{index + 2}:{index * 10}"
+    card = {
+        "id": f"{base}0", "name": f"Card {index + 1}", "type": "FRAME", "visible": True, "blendMode": "PASS_THROUGH",
+        "clipsContent": True, "background": [], "backgroundColor": {"r": 1, "g": 1, "b": 1, "a": 1},
+        "fills": [{"blendMode": "NORMAL", "type": "SOLID", "color": {"r": 1, "g": 1, "b": 1, "a": 1}}],
+        "strokes": [{"blendMode": "NORMAL", "type": "SOLID", "color": _color(rng)}],
+        "strokeWeight": 1, "strokeAlign": "INSIDE", "cornerRadius": 12, "rectangleCornerRadii": [12, 12, 12, 12],
+        "effects": [{"type": "DROP_SHADOW", "visible": True, "color": {"r": 0, "g": 0, "b": 0, "a": 0.11999999731779099},
+                     "blendMode": "NORMAL", "offset": {"x": 0, "y": 2}, "radius": 8, "showShadowBehindNode": False}],
+        "absoluteBoundingBox": _box(rng, 32, y, 311, 236),
+        "absoluteRenderBounds": _box(rng, 24, y - 6, 327, 252),
+        "constraints": {"vertical": "TOP", "horizontal": "LEFT_RIGHT"},
+        "layoutMode": "VERTICAL", "itemSpacing": 8, "paddingLeft": 16, "paddingRight": 16, "paddingTop": 16,
+        "paddingBottom": 16, "primaryAxisSizingMode": "AUTO", "counterAxisSizingMode": "FIXED",
+        "exportSettings": [{"suffix": "", "format": "PNG", "constraint": {"type": "SCALE", "value": 2}}],
+        "interactions": [{"trigger": {"type": "ON_CLICK"}, "actions": [{"type": "NODE", "destinationId": "1:1",
+                                                                         "navigation": "NAVIGATE"}]}],
+        "children": [
+            {
+                "id": f"{base}1", "name": "Thumbnail", "type": "RECTANGLE", "visible": True, "blendMode": "PASS_THROUGH",
+                "fills": [{"blendMode": "NORMAL", "type": "IMAGE", "scaleMode": "FILL",
+                           "imageRef": f"{rng.getrandbits(160):040x}"}],
+                "strokes": [], "strokeWeight": 1, "strokeAlign": "INSIDE", "cornerRadius": 8, "effects": [],
+                "absoluteBoundingBox": _box(rng, 48, y + 16, 279, 120),
+                "constraints": {"vertical": "TOP", "horizontal": "LEFT"}, "layoutAlign": "STRETCH", "layoutGrow": 0,
+            },
+            _text(rng, f"{base}2", "Title", f"Card title number {index + 1}", 48, y + 144, 18),
+            _text(rng, f"{base}3", "Body", "Supporting text that wraps onto a second line in most cards.", 48, y + 176, 14),
+            {
+                "id": f"I{base}4", "name": "Button", "type": "INSTANCE", "visible": True, "blendMode": "PASS_THROUGH",
+                "componentId": "9:1", "componentProperties": {"Label": {"value": "Open", "type": "TEXT"}},
+                "componentPropertyReferences": {}, "overrides": [],
+                "fills": [{"blendMode": "NORMAL", "type": "SOLID", "color": {"r": 0.3843137323856354,
+                                                                             "g": 0, "b": 0.9333333373069763, "a": 1}}],
+                "strokes": [], "strokeWeight": 1, "strokeAlign": "INSIDE", "cornerRadius": 20, "effects": [],
+                "absoluteBoundingBox": _box(rng, 48, y + 204, 96, 40),
+                "constraints": {"vertical": "TOP", "horizontal": "LEFT"},
+                "layoutMode": "HORIZONTAL", "primaryAxisAlignItems": "CENTER", "counterAxisAlignItems": "CENTER",
+                "paddingLeft": 24, "paddingRight": 24, "paddingTop": 10, "paddingBottom": 10,
+                "children": [_text(rng, f"I{base}4;5:1", "Label", "Open", 72, y + 214, 14)],
+            },
+        ],
+    }
+    return card
+
+
+def frame_document(size, seed=0):
+    """The root FRAME of a synthetic `size` frame (its id is a placeholder, see StubFigmaData)."""
+    rng = random.Random(seed)
+    cards = [_card(rng, i, 120 + i * 252) for i in range(FRAME_SIZES[size])]
+    if len(cards) > CARDS_PER_SECTION:
+        # Big screens are grouped into sections, which also gives the tree some depth.
+        children = [{
+            "id": f"1:{1000 + i}", "name": f"Section {i // CARDS_PER_SECTION + 1}", "type": "FRAME", "visible": True,
+            "layoutMode": "VERTICAL", "itemSpacing": 16, "fills": [], "strokes": [], "effects": [],
+            "absoluteBoundingBox": _box(rng, 0, cards[i]["absoluteBoundingBox"]["y"], 375, 252 * CARDS_PER_SECTION),
+            "children": cards[i:i + CARDS_PER_SECTION],
+        } for i in range(0, len(cards), CARDS_PER_SECTION)]
+    else:
+        children = cards
+    return {
+        "id": _ROOT_ID_PLACEHOLDER, "name": f"{size.capitalize()} Screen", "type": "FRAME", "visible": True,
+        "blendMode": "PASS_THROUGH", "clipsContent": True, "layoutMode": "VERTICAL", "itemSpacing": 16,
+        "fills": [{"blendMode": "NORMAL", "type": "SOLID", "color": {"r": 0.9607843160629272, "g": 0.9607843160629272,
+                                                                     "b": 0.9607843160629272, "a": 1}}],
+        "strokes": [], "strokeWeight": 1, "strokeAlign": "INSIDE", "effects": [],
+        "absoluteBoundingBox": {"x": 0, "y": 0, "width": 375, "height": 120 + 252 * len(cards)},
+        "constraints": {"vertical": "TOP", "horizontal": "LEFT"},
+        "children": children,
+    }
+
+
+def frame_svg(size):
+    """An SVG export of a `size` frame: a group per card, with its shapes and text."""
+    parts = ['<svg width="375" height="{0}" viewBox="0 0 375 {0}" fill="none" xmlns="http://www.w3.org/2000/svg">'
+             .format(120 + 252 * FRAME_SIZES[size])]
+    for i in range(FRAME_SIZES[size]):
+        y = 120 + i * 252
+        parts.append(
+            f'<g id="Card {i + 1}" filter="url(#shadow)">'
+            f'<rect x="32.5" y="{y + 0.5}" width="310" height="235" rx="11.5" fill="white" stroke="#6E6E6E"/>'
+            f'<rect id="Thumbnail" x="48" y="{y + 16}" width="279" height="120" rx="8" fill="#D9D9D9"/>'
+            f'<path id="Title" d="M48.8906 {y + 158.5}H50.8125V{y + 171}H48.8906V{y + 158.5}Z" fill="#212121"/>'
+            f'<path id="Body" d="M48.6094 {y + 186.1}C48.6094 {y + 187.3} 49.4219 {y + 188.2} 50.75 {y + 188.2}Z" fill="#212121"/>'
+            f'<rect id="Button" x="48" y="{y + 204}" width="96" height="40" rx="20" fill="#6200EE"/>'
+            '</g>')
+    parts.append('<defs><filter id="shadow" x="0" y="0" width="1" height="1"><feDropShadow dx="0" dy="2" stdDeviation="4" '
+                 'flood-opacity="0.12"/></filter></defs></svg>')
+    return "".join(parts).encode('utf-8')
+
+
+class StubFigmaData:
+    """Pre-serialized responses per frame size; only the root node id is substituted per request."""
+
+    def __init__(self, sizes=FRAME_SIZES):
+        self._documents = {size: json.dumps(frame_document(size), separators=(",", ":")) for size in sizes}
+        self._svgs = {size: frame_svg(size) for size in sizes}
+
+    def nodes_response(self, file_key, node_ids):
+        document = self._documents[size_for(file_key)]
+        nodes = ",".join(
+            '{}:{{"document":{},"components":{{"9:1":{{"key":"btn","name":"Button","description":""}}}},'
+            '"componentSets":{{}},"schemaVersion":0,"styles":{{}}}}'.format(
+                json.dumps(node_id), document.replace(json.dumps(_ROOT_ID_PLACEHOLDER), json.dumps(node_id), 1))
+            for node_id in node_ids)
+        header = json.dumps({"name": f"{file_key} benchmark file", "lastModified": LAST_MODIFIED,
+                             "thumbnailUrl": "", "version": FILE_VERSION, "role": "viewer",
+                             "editorType": "figma", "linkAccess": "view"})
+        return (header[:-1] + ',"nodes":{' + nodes + '}}').encode('utf-8')
+
+    def image(self, size):
+        return self._svgs[size]
+
+
+class StubFigmaServer:
+    """Threaded stub Figma API on 127.0.0.1. Use .base_url as FIGMA_API_BASE_URL."""
+
+    def __init__(self, port=0, latency_ms=0.0, jitter_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.data = StubFigmaData()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-figma", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _delay(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._delay()
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                parts = url.path.strip("/").split("/")
+                if len(parts) == 3 and parts[0] == "img" and parts[1] in FRAME_SIZES:
+                    return self._send(200, stub.data.image(parts[1]), "image/svg+xml")
+                if self.headers.get("X-Figma-Token") is None:
+                    return self._send_json(403, {"status": 403, "err": "Invalid token"})
+                if len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "nodes" and size_for(parts[2]):
+                    node_ids = query.get("ids", [""])[0].split(",")
+                    return self._send(200, stub.data.nodes_response(parts[2], node_ids), "application/json")
+                if len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "meta" and size_for(parts[2]):
+                    return self._send_json(200, {"file": {"name": parts[2], "version": FILE_VERSION,
+                                                          "last_touched_at": LAST_MODIFIED}})
+                if len(parts) == 3 and parts[:2] == ["v1", "images"] and size_for(parts[2]):
+                    size = size_for(parts[2])
+                    image_format = query.get("format", ["png"])[0]
+                    host = self.headers.get("Host", f"127.0.0.1:{stub._server.server_port}")
+                    images = {node_id: f"http://{host}/img/{size}/{node_id.replace(':', '-')}.{image_format}"
+                              for node_id in query.get("ids", [""])[0].split(",")}
+                    return self._send_json(200, {"err": None, "images": images})
+                return self._send_json(404, {"status": 404, "err": "Not found"})
+
+            def _send_json(self, status, payload):
+                self._send(status, json.dumps(payload).encode('utf-8'), "application/json")
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a stub Figma API with synthetic frames for offline benchmarks.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random delay, up to this much")
+    args = parser.parse_args(argv)
+
+    server = StubFigmaServer(args.port, args.latency_ms, args.jitter_ms).start()
+    print(f"Stub Figma API on {server.base_url}")
+    for size, cards in FRAME_SIZES.items():
+        print(f"  {size:6s} https://www.figma.com/design/{file_key_for(size)}/Bench?node-id=1-1  ({cards * 6} nodes)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Prompt construction for Figma -> Jetpack Compose generation.
+
+Shared by the streaming endpoint, parallel subtree generation and any other
+entry point that talks to Gemini, so every path sends the same instructions.
+"""
+from figma_compact import (SHARED_STYLES_KEY, SHARED_STYLE_REF_KEY, COMPONENT_DEFINITIONS_KEY, COMPONENT_REF_KEY,
+                           COMPONENT_OVERRIDES_KEY, INSTANCE_ROOT_PATH)
+
+
+def build_compose_prompt(figma_json_str, figma_svg_str=None, custom_kotlin_files_content=None, additional_instructions=None,
+                         json_uses_shared_styles=False, task_instructions=None, json_uses_component_definitions=False):
+    """Builds the Gemini prompt. `task_instructions` narrows the request (e.g. "only generate composable X")."""
+    prompt = f"""
+        You are an expert Android Jetpack Compose developer. Your primary task is to generate high-quality, production-ready, and syntactically correct Jetpack Compose (Kotlin) code.
+        This code must be based on the provided Figma design data (JSON and SVG if available) and MUST preferentially use any custom Kotlin definitions (colors, typography, utilities) also provided.
+
+        Figma Node JSON:
+        ```json
+        {figma_json_str}
+        ```
+        """
+
+    if json_uses_shared_styles:
+        prompt += f"""
+        NOTE: To save space, repeated style values in the JSON above were moved into the top-level `{SHARED_STYLES_KEY}` table. A value like `{{"{SHARED_STYLE_REF_KEY}": "s1"}}` means "use `{SHARED_STYLES_KEY}.s1` here".
+        """
+
+    if json_uses_component_definitions:
+        prompt += f"""
+        NOTE: Repeated Figma component instances were factored out of the JSON above. Each entry of the top-level `{COMPONENT_DEFINITIONS_KEY}` table is one component: its full layer tree is under `node`, with boxes relative to the component's top-left corner. A node like `{{"{COMPONENT_REF_KEY}": "c1", "{COMPONENT_OVERRIDES_KEY}": {{...}}}}` is an instance of `{COMPONENT_DEFINITIONS_KEY}.c1` placed at its own `absoluteBoundingBox`; `{COMPONENT_OVERRIDES_KEY}` maps a layer-name path inside the component (`{INSTANCE_ROOT_PATH}` is the instance itself) to the properties that instance changes.
+        Generate ONE reusable `@Composable` per component definition, named after its `name`, taking `modifier: Modifier = Modifier` plus one parameter for each entry of its `parameters` (e.g. the text of a label, an icon's visibility) with the definition's value as the default. Call it once for every instance, passing that instance's overrides. Do NOT inline a copy of the component for each instance.
+        """
+
+    if figma_svg_str:
+        prompt += f"""
+        Figma Node SVG Content (if applicable, for VECTOR nodes or image fills):
+        ```svg
+        {figma_svg_str}
+        ```
+        """
+    else:
+        prompt += "\nNo SVG content was provided for this node.\n"
+
+    if custom_kotlin_files_content:
+        prompt += "\nIMPORTANT CONTEXT: You MUST use the following existing custom Kotlin code from the project. Prioritize these definitions over generating new ones. If a Figma property (e.g., a color hex code, a font style) matches a definition in this custom code, YOU MUST use the custom definition (e.g., `AppColors.PrimaryBlue`, `AppTypography.h1`). Do NOT redefine these variables or styles.\n"
+        for file_info in custom_kotlin_files_content:
+            prompt += f"""
+                --- Start of content from '{file_info['filename']}' ---
+                ```kotlin
+                {file_info['content']}
+                ```
+                --- End of content from '{file_info['filename']}' ---
+                """
+    else:
+        prompt += "\nNo custom Kotlin files were provided. Generate standard Jetpack Compose code using standard Color objects and TextStyle configurations as needed.\n"
+    
+    if additional_instructions:
+        prompt += f"""
+        CRITICAL USER INSTRUCTIONS: Please strictly adhere to the following additional user-provided instructions for this specific component:
+        --- Start of Additional User Instructions ---
+        {additional_instructions}
+        --- End of Additional User Instructions ---
+        """
+
+    prompt += """
+        Key Instructions for Jetpack Compose Code Generation:
+        1.  **PRIORITIZE CUSTOM CODE**: This is the most important instruction. If custom Kotlin code (colors, typography, utilities from the files listed above) is provided, YOU ABSOLUTELY MUST use those definitions. For example, if a Figma color is `#FF0000` and the custom code has `val ErrorRed = Color(0xFFFF0000)`, you must use `ErrorRed`. Do not generate `Color(0xFFFF0000)` directly.
+        2.  **Accuracy and Pixel Perfection**: Strive for the closest possible visual match to the Figma design. Pay close attention to dimensions (width, height, `absoluteBoundingBox`), padding, margins, colors, fonts (family, weight, size, letterSpacing, lineHeight), corner radii, and layout (auto-layout properties like `layoutMode`, `itemSpacing`, `primaryAxisSizingMode`, `counterAxisSizingMode`).
+        3.  **Error-Free and Runnable Code**: The generated Kotlin code MUST be syntactically correct and immediately runnable within a standard Jetpack Compose project. Include ALL necessary import statements.
+        4.  **Standard Composables**: Use standard Jetpack Compose functions and Modifiers (`Box`, `Column`, `Row`, `Text`, `Image`, `Surface`, `Modifier.padding`, `Modifier.size`, `Modifier.background`, etc.).
+        5.  **SVG Handling**: If SVG content is provided, generate code to render it, preferably using a common library like Coil-SVG for Compose (`rememberAsyncImagePainter` with an SVG decoder). If the SVG is extremely simple, you may note that it could be converted to an Android VectorDrawable, but still provide the Coil-SVG based solution.
+        6.  **Interactivity**: For elements that appear interactive (buttons, input fields), include a placeholder `onClick` lambda (e.g., `onClick = {{ /* TODO: Implement action */ }}`). For input-like elements, suggest `remember {{ mutableStateOf("") }}`.
+        7.  **Previews**: ALWAYS include a `@Preview` Composable function. Ensure it's self-contained or uses easily mockable data.
+        8.  **Comments for Ambiguity**: If a Figma property is ambiguous or its direct translation is overly complex and might lead to errors, use a simpler, standard Jetpack Compose equivalent and add a clear comment in the code explaining the original Figma property or the intended behavior (e.g., `// Figma 'complex-gradient': Using solid color as fallback. Original: ...`).
+        9.  **Color Mapping (Fallback)**: If a Figma color does NOT have a clear match in the provided custom color definitions, then (and only then) generate a standard Compose `Color(red, green, blue, alpha)` object based on the RGBA values from Figma.
+        10. **Typography Mapping (Fallback)**: If Figma typography does NOT have a clear match in the provided custom typography definitions, then (and only then) create new `TextStyle` objects using Figma properties.
+        11. **Layout Translation**: Carefully translate Figma's auto-layout properties to Compose `Row`/`Column` arrangements, `Arrangement` parameters, and `Alignment` modifiers.
+        12. **Clarity and Readability**: Generate clean, well-formatted, and readable Kotlin code.
+
+        Output ONLY the complete, runnable Kotlin code block. Do not include any explanatory text, greetings, or apologies before or after the code block. Start directly with the package statement or imports.
+        """
+
+    if task_instructions:
+        prompt += f"""
+        SCOPE OF THIS REQUEST (this takes precedence over the general instructions above where they conflict):
+        {task_instructions}
+        """
+
+    return prompt
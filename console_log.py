@@ -0,0 +1,63 @@
+"""Non-blocking, level-controlled console output for hot paths such as the Gemini stream echo.
+
+Loggers from get_console_logger put records on a bounded queue. One
+listener thread writes them to stdout, so a request thread never waits on
+the console. When the queue is full, records are dropped rather than
+blocking. Messages are written verbatim, with no newline added (like
+print(..., end='')). The level comes from CONSOLE_LOG_LEVEL. The default,
+DEBUG, echoes every streamed chunk; set INFO or higher in production to
+turn the echo off.
+"""
+import os
+import sys
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# --- Configuration ---
+CONSOLE_LOG_LEVEL_ENV_VAR = "CONSOLE_LOG_LEVEL"
+DEFAULT_CONSOLE_LOG_LEVEL = "DEBUG"
+CONSOLE_LOG_QUEUE_RECORDS = 10000
+ROOT_LOGGER_NAME = "figma_to_compose"
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # a slow console must not slow down generation
+
+
+class _VerbatimStreamHandler(logging.StreamHandler):
+    terminator = ""
+
+
+def console_log_level():
+    level = logging.getLevelName((os.environ.get(CONSOLE_LOG_LEVEL_ENV_VAR) or DEFAULT_CONSOLE_LOG_LEVEL).upper())
+    return level if isinstance(level, int) else logging.DEBUG
+
+
+def _root_logger():
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    with _listener_lock:
+        if _listener is None:
+            records = queue.Queue(maxsize=CONSOLE_LOG_QUEUE_RECORDS)
+            root.addHandler(_DroppingQueueHandler(records))
+            root.setLevel(console_log_level())
+            root.propagate = False
+            _listener = logging.handlers.QueueListener(records, _VerbatimStreamHandler(sys.stdout))
+            _listener.start()
+            atexit.register(_listener.stop)
+    return root
+
+
+def get_console_logger(name):
+    """A logger whose records are written to stdout by a background thread."""
+    return _root_logger().getChild(name)
@@ -0,0 +1,575 @@
+"""Concurrent fetch pipeline for a Figma node: node JSON and rendered image.
+
+The `/v1/images` lookup does not depend on the `/v1/files/{key}/nodes`
+response, so the two branches run side by side on a shared worker pool and
+the image is streamed to disk as soon as its URL arrives. Every stage is
+timed, so a fetch costs roughly max(JSON, image URL + download).
+
+A large /nodes body is streamed to disk as it arrives (see nodes_stream.py):
+one pass computes the cache's content hash and the pruned form generation
+reads, which is written next to the raw JSON as `*.prompt.json`. Smaller
+bodies are read whole and decoded with json.loads, to the same effect.
+
+With a FigmaCache, current entries are served from disk, and stale ones are
+refreshed without re-downloading an image whose node subtree is unchanged.
+
+Given an `svg_optimizer`, a downloaded SVG is also shrunk once here (see
+svg_optimize.py) and written next to the raw one as `*.prompt.svg`, so every
+later generation from the job reuses it.
+
+run_asset_export_pipeline renders a frame's icons and images (see
+asset_export.py) in several formats and scales on the same pool.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from figma_client import FigmaAPIError
+from metrics import FIGMA_STAGE_SECONDS, FIGMA_CACHE_REQUESTS, PROMPT_SVG_BYTES
+from figma_cache import CACHE_STATUS_HIT, CACHE_STATUS_REVALIDATED, CACHE_STATUS_REFRESHED, CACHE_STATUS_MISS
+from nodes_stream import (scan_nodes_response, stream_nodes_response, scan_nodes_body, save_nodes_body, streaming_min_bytes,
+                          write_node_response, prompt_json_path_for, write_prompt_json)
+
+# --- Configuration ---
+FETCH_PIPELINE_WORKERS = 16
+ASSET_IDS_PER_IMAGES_CALL = 100
+
+_fetch_executor = ThreadPoolExecutor(max_workers=FETCH_PIPELINE_WORKERS, thread_name_prefix="figma-fetch")
+
+STAGE_NODES = "nodes"
+STAGE_IMAGE_URL = "image_url"
+STAGE_IMAGE_DOWNLOAD = "image_download"
+STAGE_REVALIDATE = "revalidate"
+STAGE_CACHE_READ = "cache_read"
+STAGE_SVG_OPTIMIZE = "svg_optimize"
+STAGE_ASSET_URLS = "asset_urls"
+STAGE_ASSET_DOWNLOAD = "asset_download"
+STAGE_ORDER = (STAGE_REVALIDATE, STAGE_CACHE_READ, STAGE_NODES, STAGE_IMAGE_URL, STAGE_IMAGE_DOWNLOAD, STAGE_SVG_OPTIMIZE,
+               STAGE_ASSET_URLS, STAGE_ASSET_DOWNLOAD)
+PROMPT_SVG_SUFFIX = ".prompt.svg"
+
+
+class FetchResult:
+    """Outcome of one pipeline run. Errors are kept per branch so a failed image does not hide the JSON."""
+
+    def __init__(self, file_key, node_id):
+        self.file_key = file_key
+        self.node_id = node_id
+        self.json_path = None
+        # Pruned /nodes response (see nodes_stream.py); None when the JSON was served from the cache.
+        self.node_json = None
+        self.prompt_json_path = None
+        self.node_hash = None
+        self.version = None
+        self.json_error = None
+        self.image_path = None
+        self.image_url_response = None
+        self.image_error = None
+        self.image_warning = None
+        self.prompt_svg_path = None
+        self.svg_report = None
+        self.cache_status = None
+        self.timings = {}
+        self.total_seconds = 0.0
+
+    def timing_summary(self):
+        """Human-readable per-stage timings, e.g. 'nodes 0.41s, image_url 0.38s, ... (total 0.52s)'."""
+        ordered = sorted(self.timings.items(), key=lambda item: STAGE_ORDER.index(item[0]) if item[0] in STAGE_ORDER else len(STAGE_ORDER))
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in ordered)
+        return f"{stages} (total {self.total_seconds:.2f}s)"
+
+
+class _Stage:
+    """Context manager that records how long a stage took into result.timings."""
+
+    def __init__(self, result, name):
+        self.result = result
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.result.timings[self.name] = elapsed
+        FIGMA_STAGE_SECONDS.labels(stage=self.name).observe(elapsed)
+
+
+def _node_keys(node_id):
+    """The forms a node id may take as a key of a Figma response: as given, and '1-2' as '1:2'."""
+    node_id_parts = node_id.split('-', 1)
+    return [node_id, f"{node_id_parts[0]}:{node_id_parts[1]}"] if len(node_id_parts) == 2 else [node_id]
+
+
+def lookup_by_node_id(mapping, node_id):
+    """Looks up a node id in a Figma id-keyed dict, tolerating URL ('1-2') vs API ('1:2') forms."""
+    if not isinstance(mapping, dict):
+        return None
+    for key in _node_keys(node_id):
+        if key in mapping:
+            return mapping[key]
+    return None
+
+
+def find_image_url(image_dict, node_id):
+    """Looks up a node's render URL in the `images` dict, tolerating '1-2' vs '1:2' id forms."""
+    if not isinstance(image_dict, dict) or not image_dict:
+        return None
+    actual_image_url = lookup_by_node_id(image_dict, node_id)
+    if actual_image_url is None and ',' not in node_id and len(image_dict) == 1:
+        return list(image_dict.values())[0]
+    return actual_image_url
+
+
+def _content_length(resp):
+    try:
+        return int(resp.getheader("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _stream_nodes(client, file_key, node_ids, json_output_path=None, entry_paths=None):
+    """
+    Scans a /nodes response (writing it to `json_output_path`, if given) and returns its NodesScan. Bodies of
+    unknown length or at least streaming_min_bytes() are scanned as they arrive; smaller ones are read whole.
+    """
+    with client.open_file_nodes(file_key, node_ids) as resp:
+        try:
+            length = _content_length(resp)
+            if length is not None and length < streaming_min_bytes():
+                body = resp.read()
+                if json_output_path is None:
+                    return scan_nodes_body(body, entry_paths)
+                return save_nodes_body(body, json_output_path, entry_paths)
+            if json_output_path is None:
+                return scan_nodes_response(resp.iter_chunks(), entry_paths)
+            return stream_nodes_response(resp.iter_chunks(), json_output_path, entry_paths)
+        except ValueError as e:
+            raise FigmaAPIError(f"Error decoding JSON from Figma API: {e}", status=resp.status) from e
+
+
+def _record_scan(result, scan, node_key, json_output_path, pruned_response):
+    prompt_json_path = prompt_json_path_for(json_output_path)
+    write_prompt_json(pruned_response, prompt_json_path)
+    result.node_json = pruned_response
+    result.prompt_json_path = prompt_json_path
+    result.node_hash = scan.node_hashes.get(node_key)
+    result.version = scan.version
+    result.json_path = json_output_path
+
+
+def _fetch_node_json(client, result, json_output_path):
+    with _Stage(result, STAGE_NODES):
+        scan = _stream_nodes(client, result.file_key, result.node_id, json_output_path)
+        node_key = next((key for key in _node_keys(result.node_id) if key in scan.node_hashes), result.node_id)
+        _record_scan(result, scan, node_key, json_output_path, scan.pruned_response())
+
+
+def _fetch_image(client, result, image_output_path, image_format):
+    with _Stage(result, STAGE_IMAGE_URL):
+        image_url_response_json = client.get_image_urls(result.file_key, result.node_id, image_format)
+    result.image_url_response = image_url_response_json
+    actual_image_url = find_image_url(image_url_response_json.get("images"), result.node_id)
+    if not actual_image_url:
+        err_msg = image_url_response_json.get("err") if isinstance(image_url_response_json, dict) else "Image not found in API response."
+        result.image_warning = (f"Could not find/fetch {image_format.upper()} image URL for '{result.node_id}'. "
+                                f"API msg: {err_msg}. Response: {str(image_url_response_json)[:100]}...")
+        return
+    with _Stage(result, STAGE_IMAGE_DOWNLOAD):
+        client.download_to_file(actual_image_url, image_output_path)
+    result.image_path = image_output_path
+
+
+def prompt_svg_path_for(image_path):
+    return os.path.splitext(image_path)[0] + PROMPT_SVG_SUFFIX
+
+
+def _optimize_prompt_svg(result, svg_optimizer):
+    """Writes the optimized SVG next to the raw one. On failure generation simply uses the raw SVG."""
+    if svg_optimizer is None or not result.image_path or not result.image_path.endswith(".svg"):
+        return
+    prompt_svg_path = prompt_svg_path_for(result.image_path)
+    try:
+        with _Stage(result, STAGE_SVG_OPTIMIZE):
+            with open(result.image_path, 'r', encoding='utf-8') as f:
+                optimized_svg, report = svg_optimizer(f.read())
+            with open(prompt_svg_path, 'w', encoding='utf-8') as f:
+                f.write(optimized_svg)
+    except Exception as e:
+        print(f"Fetch pipeline: SVG optimization failed for {result.file_key}/{result.node_id}: {e}")
+        return
+    result.prompt_svg_path = prompt_svg_path
+    result.svg_report = report
+    PROMPT_SVG_BYTES.labels(stage="raw").observe(report["before_bytes"])
+    PROMPT_SVG_BYTES.labels(stage="optimized").observe(report["after_bytes"])
+
+
+def _describe_error(prefix, e):
+    if isinstance(e, FigmaAPIError):
+        message = f"{prefix}. "
+        if e.status:
+            message += f"HTTP status: {e.status}. "
+        return message + str(e)
+    return f"{prefix}: {str(e)}"
+
+
+def _run_node_json(client, result, json_output_path):
+    try:
+        _fetch_node_json(client, result, json_output_path)
+    except FigmaAPIError as e:
+        result.json_error = _describe_error(f"Error fetching node JSON for '{result.node_id}'", e)
+    except Exception as e:
+        result.json_error = _describe_error(f"Error fetching/saving JSON for '{result.node_id}'", e)
+
+
+def _wait_image(image_future, result, image_format):
+    try:
+        image_future.result()
+    except FigmaAPIError as e:
+        result.image_error = _describe_error(f"Error during {image_format.upper()} image API call for node '{result.node_id}'", e)
+    except Exception as e:
+        result.image_error = _describe_error(f"Error fetching/saving {image_format.upper()} image for '{result.node_id}'", e)
+
+
+def _run_concurrent(client, result, json_output_path, image_output_path, image_format):
+    image_future = _fetch_executor.submit(_fetch_image, client, result, image_output_path, image_format)
+    _run_node_json(client, result, json_output_path)
+    _wait_image(image_future, result, image_format)
+
+
+def _serve_from_cache(cache, entry, result, json_output_path, image_output_path):
+    """Copies a cached entry's blobs into place. Returns False if a blob disappeared underneath us."""
+    if not cache.materialize(entry.json_blob, json_output_path):
+        return False
+    if entry.image_blob:
+        if not cache.materialize(entry.image_blob, image_output_path):
+            return False
+        result.image_path = image_output_path
+    result.json_path = json_output_path
+    return True
+
+
+def _run_cached(client, cache, result, json_output_path, image_output_path, image_format):
+    entry = cache.lookup(result.file_key, result.node_id, image_format)
+
+    if entry and cache.has_blob(entry.json_blob):
+        fresh = not cache.needs_revalidation(entry)
+        if not fresh:
+            try:
+                with _Stage(result, STAGE_REVALIDATE):
+                    fresh = client.get_file_version(result.file_key) == entry.version
+            except FigmaAPIError as e:
+                # Fall through to a full fetch, which reports the error properly if Figma is really down.
+                print(f"Fetch pipeline: version check failed for {result.file_key}: {e}")
+        if fresh:
+            with _Stage(result, STAGE_CACHE_READ):
+                served = _serve_from_cache(cache, entry, result, json_output_path, image_output_path)
+            if served:
+                cache.mark_validated(entry)
+                result.cache_status = CACHE_STATUS_HIT if STAGE_REVALIDATE not in result.timings else CACHE_STATUS_REVALIDATED
+                return
+
+        # Stale: the node JSON is needed to decide whether the rendered image changed at all.
+        _run_node_json(client, result, json_output_path)
+        if result.json_error:
+            return
+        if result.node_hash == entry.node_hash and entry.image_blob and cache.materialize(entry.image_blob, image_output_path):
+            result.image_path = image_output_path
+        else:
+            _wait_image(_fetch_executor.submit(_fetch_image, client, result, image_output_path, image_format), result, image_format)
+        result.cache_status = CACHE_STATUS_REFRESHED
+    else:
+        _run_concurrent(client, result, json_output_path, image_output_path, image_format)
+        if result.json_error:
+            return
+        result.cache_status = CACHE_STATUS_MISS
+
+    image_blob = cache.add_blob(result.image_path) if result.image_path else None
+    cache.store(result.file_key, result.node_id, image_format, result.version,
+                result.node_hash, cache.add_blob(result.json_path), image_blob)
+
+
+def run_fetch_pipeline(client, file_key, node_id, json_output_path, image_output_path, image_format, cache=None,
+                       svg_optimizer=None):
+    """
+    Fetches node JSON and the rendered image (concurrently, or from `cache` when current) and returns a FetchResult.
+    `svg_optimizer(svg_text) -> (prompt_svg, report)`, if given, produces the job's prompt SVG.
+    """
+    result = FetchResult(file_key, node_id)
+    started = time.perf_counter()
+
+    if cache is None:
+        _run_concurrent(client, result, json_output_path, image_output_path, image_format)
+    else:
+        _run_cached(client, cache, result, json_output_path, image_output_path, image_format)
+    _optimize_prompt_svg(result, svg_optimizer)
+
+    result.total_seconds = time.perf_counter() - started
+    if result.cache_status:
+        FIGMA_CACHE_REQUESTS.labels(status=result.cache_status).inc()
+    cache_note = f" [cache {result.cache_status}]" if result.cache_status else ""
+    print(f"Fetch pipeline: {file_key}/{node_id}: {result.timing_summary()}{cache_note}")
+    return result
+
+
+# --- Batch fetch ---
+
+class BatchFetchResult:
+    """Per-node FetchResults of one batch, plus timings for the shared batch stages."""
+
+    def __init__(self, file_key):
+        self.file_key = file_key
+        self.results = []
+        self.timings = {}
+        self.total_seconds = 0.0
+        self.api_calls = 0
+
+    timing_summary = FetchResult.timing_summary
+
+
+def _download_for(client, result, actual_image_url, image_output_path):
+    started = time.perf_counter()
+    client.download_to_file(actual_image_url, image_output_path)
+    result.timings[STAGE_IMAGE_DOWNLOAD] = time.perf_counter() - started
+    result.image_path = image_output_path
+
+
+def _batch_image_urls(client, batch, node_ids, image_format):
+    with _Stage(batch, STAGE_IMAGE_URL):
+        return client.get_image_urls(batch.file_key, node_ids, image_format)
+
+
+def _fetch_batch_from_figma(client, batch, pending, image_format, cache=None):
+    """
+    One /nodes call and one /images call for every pending node, then concurrent downloads. A node with a stale
+    cache entry is rendered only if its node hash changed, as in _run_cached: it is left out of the first /images
+    call and, if it did change, rendered by a second one once /nodes has answered.
+    """
+    node_ids = [result.node_id for result, _, _, _ in pending]
+    eager_ids = [result.node_id for result, _, _, stale in pending if stale is None or not stale.image_blob]
+    image_urls_futures = []
+    if eager_ids:
+        image_urls_futures.append((set(eager_ids), _fetch_executor.submit(_batch_image_urls, client, batch, eager_ids,
+                                                                          image_format)))
+    batch.api_calls += 1 + len(image_urls_futures)
+
+    # Each requested entry is written to a file of its own during the single pass over the response.
+    entry_paths = {}
+    for result, json_output_path, _, _ in pending:
+        for node_key in _node_keys(result.node_id):
+            entry_paths[node_key] = f"{json_output_path}.entry.part"
+
+    fetched = []
+    try:
+        try:
+            with _Stage(batch, STAGE_NODES):
+                scan = _stream_nodes(client, batch.file_key, node_ids, entry_paths=entry_paths)
+        except Exception as e:
+            for result, _, _, _ in pending:
+                result.json_error = _describe_error(f"Error fetching node JSON for '{result.node_id}'", e)
+            scan = None
+
+        for result, json_output_path, image_output_path, stale in pending:
+            if scan is None:
+                continue
+            node_key = next((key for key in _node_keys(result.node_id) if key in scan.pruned_nodes), None)
+            if node_key is None or not scan.pruned_nodes[node_key]:
+                result.json_error = f"Error fetching node JSON for '{result.node_id}'. Node not found in file '{batch.file_key}'."
+                continue
+            # Each node gets a /nodes-shaped document of its own, as if it had been fetched alone.
+            try:
+                write_node_response(scan, result.node_id, entry_paths[node_key], json_output_path)
+                _record_scan(result, scan, node_key, json_output_path,
+                             dict(scan.fields, nodes={result.node_id: scan.pruned_nodes[node_key]}))
+            except Exception as e:
+                result.json_error = _describe_error(f"Error fetching/saving JSON for '{result.node_id}'", e)
+                continue
+            fetched.append((result, image_output_path, stale))
+    finally:
+        for path in set(entry_paths.values()):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Stale entries whose node subtree is unchanged keep their cached image.
+    changed_ids = []
+    for result, image_output_path, stale in fetched:
+        if stale is None or not stale.image_blob:
+            continue
+        if result.node_hash == stale.node_hash and cache.materialize(stale.image_blob, image_output_path):
+            result.image_path = image_output_path
+        else:
+            changed_ids.append(result.node_id)
+    if changed_ids:
+        batch.api_calls += 1
+        image_urls_futures.append((set(changed_ids), _fetch_executor.submit(_batch_image_urls, client, batch, changed_ids,
+                                                                            image_format)))
+
+    downloads = []
+    for node_id_set, image_urls_future in image_urls_futures:
+        targets = [(result, image_output_path) for result, image_output_path, _ in fetched
+                   if result.node_id in node_id_set and result.image_path is None]
+        try:
+            image_url_response_json = image_urls_future.result()
+        except Exception as e:
+            for result, _ in targets:
+                result.image_error = _describe_error(f"Error during {image_format.upper()} image API call for node '{result.node_id}'", e)
+            continue
+        image_dict = image_url_response_json.get("images") if isinstance(image_url_response_json, dict) else None
+        for result, image_output_path in targets:
+            result.image_url_response = image_url_response_json
+            actual_image_url = lookup_by_node_id(image_dict, result.node_id)
+            if not actual_image_url:
+                err_msg = image_url_response_json.get("err") if isinstance(image_url_response_json, dict) else "Image not found in API response."
+                result.image_warning = f"Could not find/fetch {image_format.upper()} image URL for '{result.node_id}'. API msg: {err_msg}."
+                continue
+            downloads.append((result, _fetch_executor.submit(_download_for, client, result, actual_image_url, image_output_path)))
+
+    with _Stage(batch, STAGE_IMAGE_DOWNLOAD):
+        for result, future in downloads:
+            try:
+                future.result()
+            except Exception as e:
+                result.image_error = _describe_error(f"Error fetching/saving {image_format.upper()} image for '{result.node_id}'", e)
+    return fetched
+
+
+def _batch_file_version(client, batch):
+    """The file's current version, or "" if the check failed (stale entries are then fetched again)."""
+    batch.api_calls += 1
+    try:
+        with _Stage(batch, STAGE_REVALIDATE):
+            return client.get_file_version(batch.file_key)
+    except FigmaAPIError as e:
+        print(f"Batch fetch pipeline: version check failed for {batch.file_key}: {e}")
+        return ""
+
+
+def run_batch_fetch_pipeline(client, file_key, targets, image_format, cache=None, svg_optimizer=None):
+    """
+    Fetches many nodes of one file with as few Figma calls as possible (`svg_optimizer` as in run_fetch_pipeline).
+    `targets` is a list of (node_id, json_output_path, image_output_path); returns a BatchFetchResult.
+    """
+    batch = BatchFetchResult(file_key)
+    started = time.perf_counter()
+    pending = []
+    file_version = None
+
+    for node_id, json_output_path, image_output_path in targets:
+        result = FetchResult(file_key, node_id)
+        batch.results.append(result)
+        if cache is not None:
+            entry = cache.lookup(file_key, node_id, image_format)
+            status = CACHE_STATUS_HIT
+            current = entry is not None
+            if entry and cache.needs_revalidation(entry):
+                # As in _run_cached, but one version check covers every node of the file.
+                if file_version is None:
+                    file_version = _batch_file_version(client, batch)
+                status = CACHE_STATUS_REVALIDATED
+                current = bool(file_version) and file_version == entry.version
+            if current and _serve_from_cache(cache, entry, result, json_output_path, image_output_path):
+                cache.mark_validated(entry)
+                result.cache_status = status
+                continue
+            stale = entry
+        else:
+            stale = None
+        pending.append((result, json_output_path, image_output_path, stale))
+
+    if pending:
+        for result, _, stale in _fetch_batch_from_figma(client, batch, pending, image_format, cache):
+            if cache is None:
+                continue
+            result.cache_status = CACHE_STATUS_MISS if stale is None else CACHE_STATUS_REFRESHED
+            image_blob = cache.add_blob(result.image_path) if result.image_path else None
+            cache.store(file_key, result.node_id, image_format, result.version,
+                        result.node_hash, cache.add_blob(result.json_path), image_blob)
+
+    if svg_optimizer is not None:
+        with _Stage(batch, STAGE_SVG_OPTIMIZE):
+            for result in batch.results:
+                _optimize_prompt_svg(result, svg_optimizer)
+
+    batch.total_seconds = time.perf_counter() - started
+    for result in batch.results:
+        if result.cache_status:
+            FIGMA_CACHE_REQUESTS.labels(status=result.cache_status).inc()
+    hits = sum(1 for result in batch.results if result.cache_status in (CACHE_STATUS_HIT, CACHE_STATUS_REVALIDATED))
+    print(f"Batch fetch pipeline: {file_key}: {len(targets)} node(s), {hits} from cache, "
+          f"{batch.api_calls} Figma API call(s): {batch.timing_summary()}")
+    return batch
+
+
+# --- Asset export ---
+
+
+class AssetExportResult:
+    """Files written by one asset export, per-rendition errors, and timings for its two stages."""
+
+    def __init__(self, file_key):
+        self.file_key = file_key
+        self.files = []
+        self.errors = []
+        self.bytes_written = 0
+        self.timings = {}
+        self.total_seconds = 0.0
+        self.api_calls = 0
+
+    timing_summary = FetchResult.timing_summary
+
+
+def run_asset_export_pipeline(client, file_key, renditions):
+    """
+    Renders and downloads asset renditions of one file. `renditions` is a list of (node_id, image_format, scale,
+    output_path), where scale is None for vector formats. One /images call per (format, scale) and chunk of
+    ASSET_IDS_PER_IMAGES_CALL ids, all in flight together, then every download streamed to disk concurrently.
+    """
+    export = AssetExportResult(file_key)
+    started = time.perf_counter()
+    groups = {}
+    for node_id, image_format, scale, output_path in renditions:
+        groups.setdefault((image_format, scale), []).append((node_id, output_path))
+
+    url_calls = []
+    for (image_format, scale), targets in groups.items():
+        node_ids = sorted({node_id for node_id, _ in targets})
+        for index in range(0, len(node_ids), ASSET_IDS_PER_IMAGES_CALL):
+            chunk = node_ids[index:index + ASSET_IDS_PER_IMAGES_CALL]
+            url_calls.append((image_format, scale, targets, chunk,
+                              _fetch_executor.submit(client.get_image_urls, file_key, chunk, image_format, scale)))
+    export.api_calls = len(url_calls)
+
+    downloads = []
+    with _Stage(export, STAGE_ASSET_URLS):
+        for image_format, scale, targets, chunk, future in url_calls:
+            label = image_format.upper() + (f" @{scale:g}x" if scale else "")
+            try:
+                image_dict = future.result().get("images")
+            except Exception as e:
+                export.errors.append(_describe_error(f"Error rendering {label} for {len(chunk)} node(s)", e))
+                continue
+            chunk_ids = set(chunk)
+            for node_id, output_path in targets:
+                if node_id not in chunk_ids:
+                    continue
+                url = lookup_by_node_id(image_dict, node_id)
+                if not url:
+                    export.errors.append(f"Figma returned no {label} render for '{node_id}'.")
+                    continue
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                downloads.append((node_id, output_path, _fetch_executor.submit(client.download_to_file, url, output_path)))
+
+    with _Stage(export, STAGE_ASSET_DOWNLOAD):
+        for node_id, output_path, future in downloads:
+            try:
+                export.bytes_written += future.result()
+            except Exception as e:
+                export.errors.append(_describe_error(f"Error downloading '{os.path.basename(output_path)}' for '{node_id}'", e))
+                continue
+            export.files.append(output_path)
+
+    export.total_seconds = time.perf_counter() - started
+    print(f"Asset export pipeline: {file_key}: {len(export.files)}/{len(renditions)} file(s), "
+          f"{export.api_calls} Figma API call(s): {export.timing_summary()}")
+    return export
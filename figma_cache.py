@@ -0,0 +1,167 @@
+"""Version-aware, content-addressed on-disk cache for fetched Figma artifacts.
+
+Entries are keyed by (file_key, node_id, image format) and remember the file
+version they were fetched at. Node JSON and rendered images are stored once
+as blobs named by their SHA-256, so a new file version whose node subtree did
+not change reuses the existing image instead of downloading it again. The
+index lives in SQLite so it can be shared by threads and worker processes;
+total blob size is bounded with LRU eviction.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+from sqlite_store import connect_sqlite
+
+# --- Configuration ---
+FIGMA_CACHE_DIR_ENV_VAR = "FIGMA_CACHE_DIR"
+FIGMA_CACHE_MAX_BYTES_ENV_VAR = "FIGMA_CACHE_MAX_BYTES"
+DEFAULT_FIGMA_CACHE_DIR = ".figma_cache"
+DEFAULT_FIGMA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Within this window a cached entry is served without asking Figma for the file version.
+CACHE_REVALIDATE_AFTER_SECONDS = 60
+HASH_CHUNK_SIZE = 64 * 1024
+
+CACHE_STATUS_HIT = "hit"
+CACHE_STATUS_REVALIDATED = "revalidated"
+CACHE_STATUS_REFRESHED = "refreshed"
+CACHE_STATUS_MISS = "miss"
+
+
+def node_content_hash(nodes_response):
+    """
+    Hashes the `nodes` part of a /nodes response; version/lastModified/thumbnail fields are ignored.
+    Keys stay in document order, so a one-node response hashes like nodes_stream's scan of its entry.
+    """
+    nodes = nodes_response.get("nodes") if isinstance(nodes_response, dict) else None
+    canonical = json.dumps(nodes, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def response_version(nodes_response):
+    """The file version a /nodes response was served at."""
+    if not isinstance(nodes_response, dict):
+        return ""
+    return str(nodes_response.get("version") or nodes_response.get("lastModified") or "")
+
+
+class CacheEntry:
+    def __init__(self, row):
+        (self.file_key, self.node_id, self.image_format, self.version, self.node_hash,
+         self.json_blob, self.image_blob, self.validated_at, self.last_access) = row
+
+
+class FigmaCache:
+    """SQLite-indexed blob cache. Safe to share between threads; each call opens its own connection."""
+
+    def __init__(self, cache_dir=None, max_bytes=None, revalidate_after=CACHE_REVALIDATE_AFTER_SECONDS):
+        self.cache_dir = cache_dir or os.environ.get(FIGMA_CACHE_DIR_ENV_VAR) or DEFAULT_FIGMA_CACHE_DIR
+        self.max_bytes = int(max_bytes or os.environ.get(FIGMA_CACHE_MAX_BYTES_ENV_VAR) or DEFAULT_FIGMA_CACHE_MAX_BYTES)
+        self.revalidate_after = revalidate_after
+        self.blob_dir = os.path.join(self.cache_dir, "blobs")
+        self.db_path = os.path.join(self.cache_dir, "index.sqlite3")
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        with connect_sqlite(self.db_path) as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                file_key TEXT, node_id TEXT, image_format TEXT, version TEXT, node_hash TEXT,
+                json_blob TEXT, image_blob TEXT, validated_at REAL, last_access REAL,
+                PRIMARY KEY (file_key, node_id, image_format))""")
+            db.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, size INTEGER)")
+
+    def _blob_path(self, blob_hash):
+        return os.path.join(self.blob_dir, blob_hash[:2], blob_hash)
+
+    # --- Lookup ---
+
+    def lookup(self, file_key, node_id, image_format):
+        with connect_sqlite(self.db_path) as db:
+            row = db.execute("""SELECT file_key, node_id, image_format, version, node_hash, json_blob, image_blob,
+                                validated_at, last_access FROM entries
+                                WHERE file_key=? AND node_id=? AND image_format=?""",
+                             (file_key, node_id, image_format)).fetchone()
+        return CacheEntry(row) if row else None
+
+    def needs_revalidation(self, entry):
+        return time.time() - entry.validated_at > self.revalidate_after
+
+    def mark_validated(self, entry):
+        now = time.time()
+        with connect_sqlite(self.db_path) as db:
+            db.execute("UPDATE entries SET validated_at=?, last_access=? WHERE file_key=? AND node_id=? AND image_format=?",
+                       (now, now, entry.file_key, entry.node_id, entry.image_format))
+
+    def has_blob(self, blob_hash):
+        return bool(blob_hash) and os.path.exists(self._blob_path(blob_hash))
+
+    def materialize(self, blob_hash, output_path):
+        """Copies a cached blob to `output_path`. Returns False if the blob has gone missing."""
+        if not self.has_blob(blob_hash):
+            return False
+        shutil.copyfile(self._blob_path(blob_hash), output_path)
+        return True
+
+    # --- Store ---
+
+    def add_blob(self, source_path):
+        """Copies a file into the blob store (if not already present) and returns its hash."""
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        blob_hash = digest.hexdigest()
+        blob_path = self._blob_path(blob_hash)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, blob_path)
+        with connect_sqlite(self.db_path) as db:
+            db.execute("INSERT OR REPLACE INTO blobs (hash, size) VALUES (?, ?)", (blob_hash, os.path.getsize(blob_path)))
+        return blob_hash
+
+    def store(self, file_key, node_id, image_format, version, node_hash, json_blob, image_blob):
+        now = time.time()
+        with connect_sqlite(self.db_path) as db:
+            db.execute("""INSERT OR REPLACE INTO entries
+                          (file_key, node_id, image_format, version, node_hash, json_blob, image_blob, validated_at, last_access)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                       (file_key, node_id, image_format, version, node_hash, json_blob, image_blob, now, now))
+        self.evict()
+
+    # --- Eviction ---
+
+    def total_bytes(self):
+        with connect_sqlite(self.db_path) as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self):
+        """Drops least-recently-used entries until the unreferenced-blob sweep brings us under max_bytes."""
+        with self._evict_lock, connect_sqlite(self.db_path) as db:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for file_key, node_id, image_format in db.execute(
+                    "SELECT file_key, node_id, image_format FROM entries ORDER BY last_access ASC").fetchall():
+                db.execute("DELETE FROM entries WHERE file_key=? AND node_id=? AND image_format=?",
+                           (file_key, node_id, image_format))
+                total -= self._sweep_unreferenced(db)
+                if total <= self.max_bytes:
+                    break
+
+    def _sweep_unreferenced(self, db):
+        freed = 0
+        orphans = db.execute("""SELECT hash, size FROM blobs WHERE hash NOT IN
+                                (SELECT json_blob FROM entries WHERE json_blob IS NOT NULL
+                                 UNION SELECT image_blob FROM entries WHERE image_blob IS NOT NULL)""").fetchall()
+        for blob_hash, size in orphans:
+            try:
+                os.remove(self._blob_path(blob_hash))
+            except FileNotFoundError:
+                pass
+            db.execute("DELETE FROM blobs WHERE hash=?", (blob_hash,))
+            freed += size
+        return freed
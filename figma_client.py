@@ -0,0 +1,324 @@
+"""Pooled, in-process HTTP client for the Figma REST API.
+
+Replaces the per-call `curl` subprocesses: connections are kept alive and
+reused across requests (and threads), timeouts are configurable, and response
+bodies can be streamed straight to disk. API calls draw from a shared
+per-token rate limit, and 429/5xx responses are retried with backoff,
+honoring Retry-After (see rate_limit.py).
+"""
+import os
+import json
+import ssl
+import time
+import threading
+import http.client
+import urllib.parse
+
+from rate_limit import (shared_rate_limiter, bucket_key, configured_rate, backoff_delay, parse_retry_after,
+                        UPSTREAM_FIGMA, MAX_RETRIES)
+
+# --- Configuration ---
+FIGMA_API_BASE_URL_ENV_VAR = "FIGMA_API_BASE_URL"
+DEFAULT_FIGMA_API_BASE_URL = "https://api.figma.com"
+FIGMA_CONNECT_TIMEOUT_ENV_VAR = "FIGMA_CONNECT_TIMEOUT"
+FIGMA_READ_TIMEOUT_ENV_VAR = "FIGMA_READ_TIMEOUT"
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+MAX_IDLE_CONNECTIONS_PER_HOST = 8
+MAX_REDIRECTS = 5
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+USER_AGENT = "figmaToCompose"
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+
+class FigmaAPIError(Exception):
+    """Raised for transport failures and non-2xx responses from Figma (or the image CDN)."""
+
+    def __init__(self, message, status=None, body=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+
+def extract_figma_error(body_text):
+    """Returns Figma's `err`/`message` from an error body, falling back to the raw text."""
+    text = (body_text or "").strip()
+    try:
+        details = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return text
+    if isinstance(details, dict):
+        return details.get('err') or details.get('message', text)
+    return text
+
+
+class ConnectionPool:
+    """Thread-safe pool of idle keep-alive connections, keyed by (scheme, host, port)."""
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_CONNECTIONS_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+
+    def acquire(self, scheme, host, port, connect_timeout):
+        """Returns (connection, reused) - an idle connection if one exists, else a new one."""
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=connect_timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=connect_timeout)
+        return conn, False
+
+    def release(self, scheme, host, port, conn):
+        """Returns a connection to the pool, closing it if the pool for that host is full."""
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle_lists, self._idle = list(self._idle.values()), {}
+        for idle in idle_lists:
+            for conn in idle:
+                conn.close()
+
+
+# Shared by every FigmaClient unless one is passed in explicitly.
+_shared_pool = ConnectionPool()
+
+
+class PooledResponse:
+    """Wraps an http.client response; hands the connection back to the pool once fully read."""
+
+    def __init__(self, pool, pool_key, conn, response):
+        self._pool = pool
+        self._pool_key = pool_key
+        self._conn = conn
+        self.response = response
+        self.status = response.status
+        self._released = False
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+    def iter_chunks(self, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        while True:
+            chunk = self.response.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        # read(amt) just stops when the connection drops early; `length` still counts the bytes that never came.
+        if self.response.length:
+            raise FigmaAPIError(f"Connection closed with {self.response.length} byte(s) of the response missing",
+                                status=self.status)
+
+    def text(self):
+        return self.read().decode('utf-8', errors='replace')
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        if self.response.isclosed() and not self.response.will_close:
+            self._pool.release(*self._pool_key, self._conn)
+        else:
+            # Unread body or server asked to close: the connection cannot be reused.
+            self.response.close()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class FigmaClient:
+    """Minimal Figma REST client built on a shared keep-alive connection pool."""
+
+    def __init__(self, token, base_url=None, connect_timeout=None, read_timeout=None, pool=None, rate_limiter=None,
+                 max_retries=MAX_RETRIES):
+        self.token = token
+        self.base_url = (base_url or os.environ.get(FIGMA_API_BASE_URL_ENV_VAR) or DEFAULT_FIGMA_API_BASE_URL).rstrip('/')
+        self.connect_timeout = float(connect_timeout or os.environ.get(FIGMA_CONNECT_TIMEOUT_ENV_VAR) or DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = float(read_timeout or os.environ.get(FIGMA_READ_TIMEOUT_ENV_VAR) or DEFAULT_READ_TIMEOUT)
+        self.pool = pool or _shared_pool
+        self.rate_limiter = rate_limiter or shared_rate_limiter()
+        self.max_retries = max_retries
+        self._bucket = bucket_key(UPSTREAM_FIGMA, token)
+        self._waits_lock = threading.Lock()
+        # Seconds this client spent waiting on the rate limit or retry backoff.
+        self.waited_seconds = 0.0
+
+    # --- Low-level transport ---
+
+    def _send(self, url, headers):
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme or "https"
+        port = parsed.port or (443 if scheme == "https" else 80)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        pool_key = (scheme, parsed.hostname, port)
+
+        # A reused connection may have been closed by the server while idle; retry once on a fresh one.
+        for attempt in range(2):
+            conn, reused = self.pool.acquire(scheme, parsed.hostname, port, self.connect_timeout)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(self.read_timeout)
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                return PooledResponse(self.pool, pool_key, conn, response)
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise FigmaAPIError(f"Connection to {parsed.hostname} failed: {e}") from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise FigmaAPIError(f"Request to {parsed.hostname} failed: {e}") from e
+
+    def _wait(self, seconds):
+        with self._waits_lock:
+            self.waited_seconds += seconds
+        time.sleep(seconds)
+
+    def open(self, url, authenticated=True):
+        """
+        GETs `url` and returns a PooledResponse for a 2xx status. Authenticated calls wait for a rate-limit
+        slot first; 429/5xx responses are retried with jittered exponential backoff or their Retry-After.
+        """
+        for attempt in range(self.max_retries + 1):
+            if authenticated:
+                reservation = self.rate_limiter.reserve(self._bucket, configured_rate(UPSTREAM_FIGMA))
+                if reservation.wait_seconds > 0:
+                    print(f"Figma client: {reservation.describe(UPSTREAM_FIGMA)}")
+                    self._wait(reservation.wait_seconds)
+            try:
+                return self._open_once(url, authenticated)
+            except FigmaAPIError as e:
+                if e.status not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                    raise
+                path = urllib.parse.urlsplit(url).path
+                if authenticated and e.retry_after is not None:
+                    # Every thread and process using this token waits out the Retry-After via the shared bucket.
+                    self.rate_limiter.pause(self._bucket, e.retry_after)
+                    print(f"Figma client: HTTP {e.status} for {path}, Retry-After {e.retry_after:.0f}s "
+                          f"(retry {attempt + 1}/{self.max_retries})")
+                else:
+                    delay = backoff_delay(attempt, e.retry_after)
+                    print(f"Figma client: HTTP {e.status} for {path}, retrying in {delay:.1f}s "
+                          f"(retry {attempt + 1}/{self.max_retries})")
+                    self._wait(delay)
+
+    def _open_once(self, url, authenticated):
+        """GETs `url`, following redirects, and returns a PooledResponse for a 2xx status."""
+        headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity"}
+        if authenticated:
+            headers["X-Figma-Token"] = self.token
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(url, headers)
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+                next_url = urllib.parse.urljoin(url, resp.getheader("Location"))
+                resp.read()
+                resp.close()
+                if urllib.parse.urlsplit(next_url).hostname != urllib.parse.urlsplit(url).hostname:
+                    headers.pop("X-Figma-Token", None)
+                url = next_url
+                continue
+            if not 200 <= resp.status < 300:
+                try:
+                    body = resp.text()
+                finally:
+                    resp.close()
+                raise FigmaAPIError(f"Figma API: {extract_figma_error(body)}", status=resp.status, body=body,
+                                    retry_after=parse_retry_after(resp.getheader("Retry-After")))
+            return resp
+        raise FigmaAPIError(f"Too many redirects while fetching {url}")
+
+    def api_url(self, path, params=None):
+        url = f"{self.base_url}{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params, safe=":,")
+        return url
+
+    def get_json(self, path, params=None):
+        """GETs a Figma API path and returns the decoded JSON body."""
+        with self.open(self.api_url(path, params)) as resp:
+            body = resp.read()
+        try:
+            return json.loads(body)
+        except json.JSONDecodeError as e:
+            raise FigmaAPIError(f"Error decoding JSON from Figma API: {e}. Response: {body[:200]!r}...",
+                                status=resp.status, body=body) from e
+
+    # --- Figma endpoints ---
+
+    def _file_nodes_params(self, node_ids):
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
+        return {"ids": ",".join(node_ids)}
+
+    def get_file_nodes(self, file_key, node_ids):
+        """Calls /v1/files/{key}/nodes for one node id or a list of them."""
+        return self.get_json(f"/v1/files/{file_key}/nodes", self._file_nodes_params(node_ids))
+
+    def open_file_nodes(self, file_key, node_ids):
+        """Like get_file_nodes, but returns the PooledResponse so a large body can be read in chunks."""
+        return self.open(self.api_url(f"/v1/files/{file_key}/nodes", self._file_nodes_params(node_ids)))
+
+    def get_image_urls(self, file_key, node_ids, image_format, scale=None):
+        """Calls /v1/images/{key} and returns the full response (the `images` dict maps id -> URL)."""
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
+        params = {"ids": ",".join(node_ids), "format": image_format}
+        if scale is not None:
+            params["scale"] = scale
+        return self.get_json(f"/v1/images/{file_key}", params)
+
+    def get_file_version(self, file_key):
+        """Cheap revalidation call: returns the file's current `version` id without fetching any nodes."""
+        try:
+            meta = self.get_json(f"/v1/files/{file_key}/meta")
+            file_meta = meta.get("file") if isinstance(meta, dict) else None
+            if isinstance(file_meta, dict) and file_meta.get("version"):
+                return str(file_meta["version"])
+        except FigmaAPIError as e:
+            # 403 is what a token without the file-metadata scope gets; it can still read the file itself.
+            if e.status not in (400, 403, 404):
+                raise
+        # Older deployments (and stub servers) may not expose /meta; depth=1 keeps the response small.
+        file_json = self.get_json(f"/v1/files/{file_key}", {"depth": 1})
+        return str(file_json.get("version") or file_json.get("lastModified") or "")
+
+    def download_to_file(self, url, output_path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Streams `url` to `output_path` in chunks (via a temp file + rename). Returns bytes written."""
+        tmp_path = f"{output_path}.part"
+        written = 0
+        try:
+            with self.open(url, authenticated=False) as resp, open(tmp_path, 'wb') as out:
+                for chunk in resp.iter_chunks(chunk_size):
+                    out.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return written
+
@@ -0,0 +1,403 @@
+"""Prunes and compacts Figma node JSON before it is inlined into a prompt.
+
+The raw /nodes response carries a lot that has no bearing on layout
+(plugin data, export settings, prototype interactions, component property
+metadata, full-precision floats). compact_figma_json strips those, drops
+hidden nodes and default values, rounds numbers, factors out repeated
+component instances and style objects into shared tables and minifies the
+result.
+
+Repeated INSTANCE nodes of the same component (list rows, chips, icons) are
+sent once: the richest instance becomes the component's definition in the
+top-level `componentDefinitions` table, and every instance becomes a
+`{"$component": "c1", ...}` reference that keeps its own id, name, box and
+layout plus only the properties it overrides, keyed by layer-name path.
+"""
+import copy
+import json
+
+import json_stream
+
+# --- Configuration ---
+DEFAULT_DROP_KEYS = frozenset([
+    # Plugin / export / prototyping metadata
+    "pluginData", "sharedPluginData", "exportSettings", "interactions", "reactions",
+    "transitionNodeID", "transitionDuration", "transitionEasing", "prototypeStartNodeID",
+    "flowStartingPoints", "prototypeDevice", "prototypeBackgrounds", "scrollBehavior",
+    # Component property metadata
+    "componentPropertyDefinitions", "componentPropertyReferences", "boundVariables",
+    "explicitVariableModes",
+    # Redundant with other fields
+    "background", "backgroundColor", "absoluteRenderBounds", "lineTypes", "lineIndentations",
+    "isMaskOutline",
+])
+# Top-level response fields that only describe the request, not the design.
+DEFAULT_DROP_RESPONSE_KEYS = frozenset(["thumbnailUrl", "lastModified", "version", "role", "editorType", "linkAccess"])
+DEFAULT_FLOAT_PRECISION = 2
+# Style-like values that are worth factoring out when they repeat.
+SHARED_STYLE_KEYS = frozenset(["fills", "strokes", "effects", "style"])
+SHARED_STYLE_MIN_BYTES = 40
+SHARED_STYLES_KEY = "sharedStyles"
+SHARED_STYLE_REF_KEY = "$style"
+COMPONENT_DEFINITIONS_KEY = "componentDefinitions"
+COMPONENT_REF_KEY = "$component"
+COMPONENT_OVERRIDES_KEY = "overrides"
+# Instance properties that place one instance in its parent rather than describe the component.
+INSTANCE_REF_KEYS = ("id", "name", "absoluteBoundingBox", "layoutAlign", "layoutGrow", "layoutPositioning",
+                     "layoutSizingHorizontal", "layoutSizingVertical", "constraints")
+# Figma's own per-instance override list only names node ids, which references do not keep.
+INSTANCE_DROP_KEYS = frozenset(["componentId", "overrides", "type"])
+INSTANCE_ROOT_PATH = "."
+BOX_KEYS = ("absoluteBoundingBox", "absoluteRenderBounds")
+DEFAULT_BLEND_MODES = ("PASS_THROUGH", "NORMAL")
+CHARS_PER_TOKEN = 4
+
+_DROP = object()
+
+
+def estimate_tokens(text_or_size):
+    """Rough token estimate (~4 characters per token) for a string or a byte count."""
+    size = text_or_size if isinstance(text_or_size, int) else len(text_or_size)
+    return (size + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _round_number(value, precision):
+    rounded = round(value, precision)
+    return int(rounded) if rounded == int(rounded) else rounded
+
+
+def _is_default_member(key, child):
+    """Members _prune leaves out: shown-by-default flags, default blend modes and anything emptied by pruning."""
+    if key == "visible" and child is True:
+        return True
+    if key == "blendMode" and child in DEFAULT_BLEND_MODES:
+        return True
+    return child is _DROP or child == {} or child == []
+
+
+def _is_hidden_node(value):
+    return value.get("visible") is False and "type" in value
+
+
+def _prune(value, drop_keys, precision, drop_hidden):
+    if isinstance(value, dict):
+        if drop_hidden and _is_hidden_node(value):
+            return _DROP
+        pruned = {}
+        for key, child in value.items():
+            if key in drop_keys:
+                continue
+            child = _prune(child, drop_keys, precision, drop_hidden)
+            if _is_default_member(key, child):
+                continue
+            pruned[key] = child
+        return pruned
+    if isinstance(value, list):
+        return [item for item in (_prune(v, drop_keys, precision, drop_hidden) for v in value) if item is not _DROP]
+    if isinstance(value, float) and precision is not None:
+        return _round_number(value, precision)
+    return value
+
+
+def prune_value(value, drop_keys=DEFAULT_DROP_KEYS, precision=DEFAULT_FLOAT_PRECISION, drop_hidden=True):
+    """_prune of an already-parsed value, with prune_events' result: a hidden root comes back as {}."""
+    pruned = _prune(value, drop_keys, precision, drop_hidden)
+    return {} if pruned is _DROP else pruned
+
+
+def prune_events(events, event, drop_keys=DEFAULT_DROP_KEYS, precision=DEFAULT_FLOAT_PRECISION, drop_hidden=True):
+    """
+    _prune applied while parsing (see json_stream.py): builds the pruned form of the value that starts
+    with `event` without building the dropped keys or hidden nodes. A hidden root comes back as {}.
+    """
+    pruned = _prune_events(events, event, drop_keys, precision, drop_hidden)
+    return {} if pruned is _DROP else pruned
+
+
+def _prune_events(events, event, drop_keys, precision, drop_hidden):
+    kind, value = event
+    if kind == json_stream.VALUE:
+        if isinstance(value, float) and precision is not None:
+            return _round_number(value, precision)
+        return value
+    if kind == json_stream.START_ARRAY:
+        items = []
+        for event in events:
+            if event[0] == json_stream.END_ARRAY:
+                return items
+            item = _prune_events(events, event, drop_keys, precision, drop_hidden)
+            if item is not _DROP:
+                items.append(item)
+    pruned = {}
+    for kind, key in events:
+        if kind == json_stream.END_MAP:
+            break
+        if key in drop_keys:
+            json_stream.skip_value(events, next(events))
+            continue
+        child = _prune_events(events, next(events), drop_keys, precision, drop_hidden)
+        if key == "visible" and child is False or key == "type":
+            if drop_hidden and _is_hidden_node(dict(pruned, **{key: child})):
+                # Figma writes visibility and type first, so the children are skipped unparsed.
+                json_stream.skip_value(events, (json_stream.START_MAP, None))
+                return _DROP
+        if not _is_default_member(key, child):
+            pruned[key] = child
+    return pruned
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def _count_styles(value, counts):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key in SHARED_STYLE_KEYS and isinstance(child, (dict, list)):
+                canonical = _canonical(child)
+                if len(canonical) >= SHARED_STYLE_MIN_BYTES:
+                    counts[canonical] = counts.get(canonical, 0) + 1
+            _count_styles(child, counts)
+    elif isinstance(value, list):
+        for child in value:
+            _count_styles(child, counts)
+
+
+def _replace_styles(value, refs):
+    if isinstance(value, dict):
+        replaced = {}
+        for key, child in value.items():
+            if key in SHARED_STYLE_KEYS and isinstance(child, (dict, list)):
+                ref = refs.get(_canonical(child))
+                if ref:
+                    replaced[key] = {SHARED_STYLE_REF_KEY: ref}
+                    continue
+            replaced[key] = _replace_styles(child, refs)
+        return replaced
+    if isinstance(value, list):
+        return [_replace_styles(child, refs) for child in value]
+    return value
+
+
+def factor_shared_styles(data):
+    """Moves style values that occur more than once into a top-level `sharedStyles` table."""
+    counts = {}
+    _count_styles(data, counts)
+    repeated = [canonical for canonical, count in counts.items() if count > 1]
+    if not repeated:
+        return data
+    refs = {canonical: f"s{i}" for i, canonical in enumerate(repeated, 1)}
+    compacted = _replace_styles(data, refs)
+    shared = {ref: json.loads(canonical) for canonical, ref in refs.items()}
+    if isinstance(compacted, dict):
+        return dict({SHARED_STYLES_KEY: shared}, **compacted)
+    return {SHARED_STYLES_KEY: shared, "document": compacted}
+
+
+# --- Component instances ---
+
+def _relative_boxes(node, origin):
+    """Copy of a subtree with its boxes relative to `origin` and its node ids dropped."""
+    if isinstance(node, list):
+        return [_relative_boxes(child, origin) for child in node]
+    if not isinstance(node, dict):
+        return node
+    relative = {}
+    for key, value in node.items():
+        if key == "id":
+            continue
+        if key in BOX_KEYS and isinstance(value, dict) and isinstance(value.get("x"), (int, float)) \
+                and isinstance(value.get("y"), (int, float)):
+            relative[key] = dict(value, x=_round_number(value["x"] - origin[0], 2), y=_round_number(value["y"] - origin[1], 2))
+        else:
+            relative[key] = _relative_boxes(value, origin)
+    return relative
+
+
+def _origin(node):
+    box = node.get("absoluteBoundingBox") or {}
+    return box.get("x") or 0, box.get("y") or 0
+
+
+def _count_nodes(node):
+    return 1 + sum(_count_nodes(child) for child in node.get("children") or [] if isinstance(child, dict))
+
+
+def _child_keys(children):
+    """(layer name, occurrence) for each child, so children are matched by name rather than by position or id."""
+    seen, keys = {}, []
+    for child in children:
+        name = child.get("name", "")
+        keys.append((name, seen.get(name, 0)))
+        seen[name] = seen.get(name, 0) + 1
+    return keys
+
+
+def _child_path(path, key):
+    name, occurrence = key
+    name = f"{name}[{occurrence}]" if occurrence else name
+    return name if path == INSTANCE_ROOT_PATH else f"{path}/{name}"
+
+
+def _diff_instance(definition, instance, path, overrides):
+    """Collects {layer path: {key: value}} where `instance` (boxes already relative) differs from `definition`."""
+    changed = {}
+    ignored = ("children",) + (INSTANCE_REF_KEYS if path == INSTANCE_ROOT_PATH else ())
+    for key in list(definition) + [key for key in instance if key not in definition]:
+        if key in ignored or (path == INSTANCE_ROOT_PATH and key in INSTANCE_DROP_KEYS):
+            continue
+        if _canonical(definition.get(key)) != _canonical(instance.get(key)):
+            changed[key] = instance.get(key)
+    definition_children = [child for child in definition.get("children") or [] if isinstance(child, dict)]
+    instance_children = [child for child in instance.get("children") or [] if isinstance(child, dict)]
+    definition_keys, instance_keys = _child_keys(definition_children), _child_keys(instance_children)
+    matched = [key for key in definition_keys if key in instance_keys]
+    if set(instance_keys) - set(definition_keys) or matched != instance_keys:
+        # Added or reordered layers: the instance's children replace the component's.
+        changed["children"] = instance_children
+    else:
+        by_key = dict(zip(instance_keys, instance_children))
+        for key, child in zip(definition_keys, definition_children):
+            if key in by_key:
+                _diff_instance(child, by_key[key], _child_path(path, key), overrides)
+            else:
+                # Hidden layers were pruned from the instance.
+                overrides[_child_path(path, key)] = {"visible": False}
+    if changed:
+        overrides[path] = changed
+    return overrides
+
+
+def _instance_ref(node, ref, definition_node):
+    reference = {COMPONENT_REF_KEY: ref}
+    reference.update({key: node[key] for key in INSTANCE_REF_KEYS if key in node})
+    overrides = _diff_instance(definition_node, _relative_boxes(node, _origin(node)), INSTANCE_ROOT_PATH, {})
+    if overrides:
+        reference[COMPONENT_OVERRIDES_KEY] = overrides
+    return reference
+
+
+def _collect_outermost_instances(value, found):
+    """{componentId: [(children list, index)]} for the instances in `value` that are not inside another instance."""
+    if isinstance(value, dict):
+        for child in value.values():
+            _collect_outermost_instances(child, found)
+    elif isinstance(value, list):
+        for index, child in enumerate(value):
+            if isinstance(child, dict) and child.get("type") == "INSTANCE" and child.get("componentId"):
+                found.setdefault(child["componentId"], []).append((value, index))
+            else:
+                _collect_outermost_instances(child, found)
+
+
+def _component_names(value, names):
+    """{componentId: name} from every `components` table of a /nodes response."""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == "components" and isinstance(child, dict):
+                names.update({cid: meta["name"] for cid, meta in child.items() if isinstance(meta, dict) and meta.get("name")})
+            else:
+                _component_names(child, names)
+    elif isinstance(value, list):
+        for child in value:
+            _component_names(child, names)
+    return names
+
+
+def factor_component_instances(data):
+    """
+    Moves components with more than one instance into a top-level `componentDefinitions` table and replaces
+    their instances with references plus overrides. An instance whose reference would not be smaller stays as is.
+    Instances nested inside a component are factored the same way, inside its definition.
+    """
+    names = _component_names(data, {})
+    definitions, refs, references = {}, {}, {}
+    # Instances are diffed against the component as fetched, before its own nested instances are factored.
+    sources = {}
+    pending = [data]
+    while pending:
+        found = {}
+        for value in pending:
+            _collect_outermost_instances(value, found)
+        pending = []
+        for component_id, sites in found.items():
+            nodes = [children[index] for children, index in sites]
+            if component_id not in refs:
+                if len(sites) < 2:
+                    pending.append(nodes[0].get("children") or [])
+                    continue
+                # The instance with the most visible layers, so the others mostly differ by overrides.
+                source = max(nodes, key=_count_nodes)
+                refs[component_id] = f"c{len(refs) + 1}"
+                sources[component_id] = {key: value for key, value in _relative_boxes(source, _origin(source)).items()
+                                         if key not in INSTANCE_REF_KEYS and key not in INSTANCE_DROP_KEYS}
+                definition_node = copy.deepcopy(sources[component_id])
+                definitions[component_id] = {"componentId": component_id, "name": names.get(component_id, source.get("name")),
+                                             "node": definition_node}
+                pending.append(definition_node.get("children") or [])
+            for (children, index), node in zip(sites, nodes):
+                reference = _instance_ref(node, refs[component_id], sources[component_id])
+                if len(_canonical(reference)) < len(_canonical(node)):
+                    children[index] = reference
+                    references.setdefault(component_id, []).append(reference)
+                else:
+                    pending.append(node.get("children") or [])
+    if not definitions:
+        return data
+    table = {}
+    for component_id, definition in definitions.items():
+        instances = references.get(component_id, [])
+        parameters = sorted({f"{path}.{key}" if path != INSTANCE_ROOT_PATH else key
+                             for reference in instances for path, changed in reference.get(COMPONENT_OVERRIDES_KEY, {}).items()
+                             for key in changed})
+        entry = dict(definition, instances=len(instances))
+        if parameters:
+            entry["parameters"] = parameters
+        table[refs[component_id]] = entry
+    if isinstance(data, dict):
+        return dict({COMPONENT_DEFINITIONS_KEY: table}, **data)
+    return {COMPONENT_DEFINITIONS_KEY: table, "document": data}
+
+
+def compact_figma_json(data, drop_keys=DEFAULT_DROP_KEYS, drop_response_keys=DEFAULT_DROP_RESPONSE_KEYS,
+                       float_precision=DEFAULT_FLOAT_PRECISION, drop_hidden=True, share_styles=True, dedupe_instances=True):
+    """
+    Returns (compact_json_str, uses_shared_styles, component_definitions) for a Figma /nodes response
+    (or any node subtree). `component_definitions` is the `componentDefinitions` table, empty if none.
+    """
+    if isinstance(data, dict):
+        data = {k: v for k, v in data.items() if k not in drop_response_keys}
+    pruned = _prune(data, drop_keys, float_precision, drop_hidden)
+    if pruned is _DROP:
+        pruned = {}
+    if dedupe_instances:
+        pruned = factor_component_instances(pruned)
+    if share_styles:
+        pruned = factor_shared_styles(pruned)
+    uses_shared_styles = isinstance(pruned, dict) and SHARED_STYLES_KEY in pruned
+    component_definitions = pruned.get(COMPONENT_DEFINITIONS_KEY, {}) if isinstance(pruned, dict) else {}
+    return json.dumps(pruned, separators=(',', ':'), ensure_ascii=False), uses_shared_styles, component_definitions
+
+
+def compaction_report(before_bytes, after_str):
+    """Before/after byte and estimated-token counts for an [INFO] message or log line."""
+    after_bytes = len(after_str.encode('utf-8'))
+    saved = 100.0 * (1 - after_bytes / before_bytes) if before_bytes else 0.0
+    return {
+        "before_bytes": before_bytes,
+        "after_bytes": after_bytes,
+        "before_tokens": estimate_tokens(before_bytes),
+        "after_tokens": estimate_tokens(after_bytes),
+        "saved_percent": saved,
+    }
+
+
+def format_compaction_report(report):
+    return (f"Figma JSON compacted: {report['before_bytes']:,} -> {report['after_bytes']:,} bytes "
+            f"(~{report['before_tokens']:,} -> ~{report['after_tokens']:,} tokens, {report['saved_percent']:.0f}% smaller)")
+
+
+def format_instance_report(component_definitions):
+    instances = sum(definition["instances"] for definition in component_definitions.values())
+    names = ", ".join(f"{definition['name']} x{definition['instances']}" for definition in component_definitions.values())
+    return f"Component instances deduplicated: {instances} instance(s) of {len(component_definitions)} component(s) sent as references ({names})"
@@ -1,11 +1,33 @@
 import os
-import subprocess
 import json
 import re
 import urllib.parse
-import glob 
 import time 
-from flask import Flask, request, render_template_string, redirect, url_for, flash, session, Response, jsonify
+import zipfile
+import tempfile
+from flask import Flask, request, render_template_string, redirect, url_for, flash, session, Response, jsonify, send_file
+
+from figma_client import FigmaClient, FigmaAPIError, FIGMA_API_BASE_URL_ENV_VAR
+from fetch_pipeline import run_fetch_pipeline, run_batch_fetch_pipeline
+from figma_cache import FigmaCache
+from artifact_store import ArtifactStore
+from figma_compact import compact_figma_json, compaction_report, format_compaction_report, format_instance_report
+from nodes_stream import load_prompt_json
+from svg_optimize import optimize_svg, format_svg_report
+from asset_export import export_assets, parse_export_spec, AssetExportError, format_asset_export_summary, DEFAULT_ASSET_EXPORT_SPEC, ASSET_MANIFEST_FILENAME
+from compose_prompt import build_compose_prompt
+from parallel_generation import plan_subtrees, parallel_generation_sse
+from generation_cache import GenerationCache, generation_cache_key, replay_sse, record_sse
+from incremental_generation import BaselineStore, apply_baseline, plan_baseline, baseline_context_key
+from kotlin_index import KotlinIndex
+from rule_based_compose import try_rule_based_compose, rule_based_sse
+from gemini_clients import GeminiClientPool, create_genai_model
+from result_store import create_result_store, ResultTooLargeError
+from rate_limit import open_gemini_stream, bucket_key, UPSTREAM_GEMINI
+from sse import sse_info_events, sse_error, sse_end
+from console_log import get_console_logger
+import metrics
+from generation_jobs import GenerationJobManager, job_events_sse, job_stream_headers, parse_last_event_id
 
 # Attempt to import the Gemini library
 try:
@@ -15,7 +37,23 @@ except ImportError:
 
 # Initialize Flask App
 app = Flask(__name__)
-app.secret_key = os.urandom(24) 
+
+# Shared on-disk cache of fetched node JSON / images (see figma_cache.py)
+figma_cache = FigmaCache()
+# Per-fetch job directories, so concurrent users/workers never share artifact paths (see artifact_store.py)
+artifact_store = ArtifactStore()
+# Finished generations, replayed instantly when the same inputs come back (see generation_cache.py)
+generation_cache = GenerationCache()
+# Per-node subtree code of the last incremental generation, so a small design edit only regenerates what changed (see incremental_generation.py)
+generation_baselines = BaselineStore()
+# Saved generated code; the session cookie only holds its id (see result_store.py)
+result_store = create_result_store()
+# Generations run as background jobs that viewers can attach to and resume (see generation_jobs.py)
+generation_jobs = GenerationJobManager()
+# Configured Gemini models per API key, so concurrent users never share or race on a key (see gemini_clients.py)
+gemini_clients = GeminiClientPool(lambda api_key, model_name: create_genai_model(genai, api_key, model_name))
+# Streamed model output echoed to the console without blocking the generation thread
+gemini_stream_log = get_console_logger("gemini_stream")
 
 # --- Configuration ---
 OUTPUT_JSON_FILENAME = "figma_node_data.json"
@@ -25,17 +63,51 @@ FIGMA_TOKEN_ENV_VAR = "FIGMA_ACCESS_TOKEN"
 GEMINI_API_KEY_ENV_VAR = "GEMINI_API_KEY" 
 DEFAULT_FLASK_PORT = 5000 
 FLASK_PORT_ENV_VAR = "FLASK_RUN_PORT"
+FLASK_SECRET_KEY_ENV_VAR = "FLASK_SECRET_KEY"
 GEMINI_MODEL_NAME = "gemini-2.5-pro-preview-05-06" 
 COMMON_CODE_DIR = "common"
+# Only send the common/ symbols (colors, text styles, dimens, composables) the node uses (see kotlin_index.py)
+COMMON_CODE_RELEVANT_SYMBOLS_ONLY = True
+# Prune/minify the node JSON before it goes into the prompt (see figma_compact.py)
+PROMPT_JSON_COMPACTION = True
+PROMPT_JSON_FLOAT_PRECISION = 2
+# Send each repeated component once and its instances as references plus overrides (see figma_compact.py)
+PROMPT_INSTANCE_DEDUP = True
+# Shrink the rendered SVG once at fetch time for the prompt (see svg_optimize.py); over the byte cap it is summarized
+PROMPT_SVG_OPTIMIZATION = True
+PROMPT_SVG_COORDINATE_PRECISION = 1
+PROMPT_SVG_MAX_BYTES = 100 * 1024
+# Icons and images of a fetched frame exported as drawables into the job's assets/ directory (see asset_export.py)
+ASSET_EXPORT_DIRNAME = "assets"
+# Emit simple nodes (text, rectangles, auto-layout frames) locally instead of calling Gemini (see rule_based_compose.py).
+# Only used without additional instructions; 'Force regenerate' always asks Gemini.
+RULE_BASED_FAST_PATH = True
+# Opt-in: start generating with default options as soon as /fetch succeeds, so "Generate" usually attaches to a job
+# already under way (see start_speculative_generation). Every fetch then costs a Gemini call, hence off by default.
+SPECULATIVE_GENERATION_ENV_VAR = "SPECULATIVE_GENERATION"
+SPECULATIVE_GENERATION = os.environ.get(SPECULATIVE_GENERATION_ENV_VAR) == "1"
+# Echo streamed Gemini output to the console (the batch CLI turns this off; see batch_cli.py).
+# The echo is written by a background thread at DEBUG level; CONSOLE_LOG_LEVEL=INFO disables it (see console_log.py).
+ECHO_GEMINI_STREAM = True
 
 # Session keys for UI-inputted tokens (used by Flask session)
 FIGMA_TOKEN_SESSION_KEY = 'figma_token_ui_session' 
 GEMINI_API_KEY_SESSION_KEY = 'gemini_api_key_ui_session' 
+# Id of the saved generated code in result_store; the code itself never goes into the cookie
+COMPOSE_OUTPUT_SESSION_KEY = 'compose_output_id'
+# Id of the generation job started speculatively for the last fetch, until it is claimed or cancelled
+SPECULATIVE_JOB_SESSION_KEY = 'speculative_generation_job_id'
 
 # localStorage keys (used by JavaScript)
 FIGMA_TOKEN_LOCALSTORAGE_KEY = 'figma_token_local'
 GEMINI_API_KEY_LOCALSTORAGE_KEY = 'gemini_api_key_local'
 
+# A shared secret is needed for sessions to survive across multiple worker processes.
+app.secret_key = os.environ.get(FLASK_SECRET_KEY_ENV_VAR) or os.urandom(24) 
+
+# Parsed common/*.kt files, re-read only when they change on disk
+kotlin_index = KotlinIndex(COMMON_CODE_DIR)
+
 
 # --- HTML Template with Material Design Lite ---
 HTML_TEMPLATE = """
@@ -131,7 +203,7 @@ HTML_TEMPLATE = """
             color: #90caf9; 
         }
 
-        textarea#final-compose-code, textarea#additional_gemini_instructions {
+        textarea#final-compose-code, textarea#additional_gemini_instructions, textarea#figma_urls {
             width: 100%;
             font-family: monospace;
             font-size: 0.85em;
@@ -145,7 +217,9 @@ HTML_TEMPLATE = """
             margin-top: 10px; 
         }
         textarea#final-compose-code { height: 500px; }
-        textarea#additional_gemini_instructions { height: 100px; margin-bottom: 10px; }
+        textarea#additional_gemini_instructions, textarea#figma_urls { height: 100px; margin-bottom: 10px; }
+        .batch-jobs { font-size: 0.9em; margin: 10px 0; }
+        .batch-jobs li.active { font-weight: bold; }
 
         .compose-section { margin-top: 20px; }
         .file-info { font-size: 0.9em; color: #555; margin-bottom:10px; }
@@ -203,6 +277,16 @@ HTML_TEMPLATE = """
                 </div>
             </form>
 
+            <form action="{{ url_for('fetch_figma_batch') }}" method="post">
+                <label class="custom-instructions-label" for="figma_urls">Batch fetch (several frames of the same file):</label>
+                <textarea id="figma_urls" name="figma_urls" placeholder="One Figma URL or node id (e.g. 12:34) per line. At least one full URL is needed for the file key."></textarea>
+                <div class="mdl-card__actions mdl-card--border">
+                    <button type="submit" class="mdl-button mdl-js-button mdl-button--raised mdl-button--colored mdl-js-ripple-effect">
+                        Batch Fetch
+                    </button>
+                </div>
+            </form>
+
             {% with messages = get_flashed_messages(with_categories=true) %}
                 {% if messages %}
                     {% for category, message in messages %}
@@ -211,18 +295,53 @@ HTML_TEMPLATE = """
                 {% endif %}
             {% endwith %}
 
-            {% if session.get('json_file_path') %}
+            {% if batch_jobs %}
+            <div class="batch-jobs">
+                Batch-fetched nodes (pick one to generate code for):
+                <ul>
+                    {% for batch_job in batch_jobs %}
+                    <li class="{{ 'active' if batch_job.active else '' }}">
+                        <a href="{{ url_for('select_job', job_id=batch_job.job_id) }}">{{ batch_job.node_id }}</a>{% if batch_job.active %} (selected){% endif %}
+                    </li>
+                    {% endfor %}
+                </ul>
+            </div>
+            {% endif %}
+
+            {% if json_file_path %}
             <div class="compose-section">
                 <p class="file-info">
-                    JSON: {{ session.get('json_file_path') }}
-                    {% if session.get('image_file_path') %}<br>{{ output_image_format.upper() }} Image: {{ session.get('image_file_path') }}{% endif %}
+                    JSON: {{ json_file_path }}
+                    {% if image_file_path %}<br>{{ output_image_format.upper() }} Image: {{ image_file_path }}{% endif %}
+                    {% if asset_export %}<br>Drawables: {{ asset_export.assets }} asset(s), {{ asset_export.files }} file(s) in {{ asset_export.dir }} (<a href="{{ url_for('download_assets') }}">download ZIP</a>){% endif %}
                 </p>
+
+                <form action="{{ url_for('export_figma_assets') }}" method="post">
+                    <label class="custom-instructions-label" for="asset_formats">Export icons and images as drawables (formats and scales):</label>
+                    <input class="mdl-textfield__input" type="text" id="asset_formats" name="asset_formats" value="{{ asset_export_spec }}">
+                    <button type="submit" class="mdl-button mdl-js-button mdl-button--raised mdl-js-ripple-effect" style="margin-top:10px;">
+                        Export Assets
+                    </button>
+                </form>
                 
                 <div>
                      <label class="custom-instructions-label" for="additional_gemini_instructions">Additional Instructions for Gemini (Optional):</label>
                      <textarea id="additional_gemini_instructions" placeholder="e.g., Focus on accessibility. Use Material 3 components. Ensure all text is internationalized."></textarea>
                 </div>
 
+                <label class="mdl-checkbox mdl-js-checkbox mdl-js-ripple-effect" for="split_subtrees">
+                    <input type="checkbox" id="split_subtrees" class="mdl-checkbox__input">
+                    <span class="mdl-checkbox__label">Large frame: generate top-level children in parallel and stitch them together</span>
+                </label>
+                <label class="mdl-checkbox mdl-js-checkbox mdl-js-ripple-effect" for="incremental">
+                    <input type="checkbox" id="incremental" class="mdl-checkbox__input">
+                    <span class="mdl-checkbox__label">Incremental: only regenerate subtrees changed since the last incremental generation of this node</span>
+                </label>
+                <label class="mdl-checkbox mdl-js-checkbox mdl-js-ripple-effect" for="force_regenerate">
+                    <input type="checkbox" id="force_regenerate" class="mdl-checkbox__input">
+                    <span class="mdl-checkbox__label">Force regenerate (ignore cached result)</span>
+                </label>
+
                 <button id="generate-compose-btn" class="mdl-button mdl-js-button mdl-button--raised mdl-button--accent mdl-js-ripple-effect" style="margin-top:10px;">
                     Generate Jetpack Compose with Gemini
                 </button>
@@ -237,19 +356,19 @@ HTML_TEMPLATE = """
             <div class="info-box">
                 <p><strong>Important Setup:</strong></p>
                 <ul>
-                    <li>Ensure <code>curl</code> is installed.</li>
+                    <li>Optionally, set <code>{{ figma_api_base_url_env_var }}</code> to point Figma API calls at another host (e.g. a local stub server).</li>
                     <li>Set API tokens via UI above or as environment variables (<code>{{ token_env_var }}</code>, <code>{{ gemini_api_key_env_var }}</code>). UI input (saved to session) takes precedence for server operations.</li>
                     <li>Install Python libraries: <code>pip install Flask google-generativeai</code>.</li>
                     <li>Optionally, set <code>{{ flask_port_env_var }}</code> to customize the run port (default: {{ default_flask_port }}).</li>
-                    <li>JSON saved to <code>{{ output_json_filename }}</code>.</li>
-                    <li>Image saved as <code>{{ output_image_prefix }}NODE-ID.{{ output_image_format }}</code>.</li>
-                    <li><strong>For Custom Code:</strong> Create a directory named <code>{{ common_code_dir }}</code> in the same location as this script. Place any relevant Kotlin files (<code>*.kt</code>) inside it.</li>
+                    <li>Each fetch gets its own job directory under <code>{{ job_artifacts_dir }}</code>: JSON saved to <code>{{ output_json_filename }}</code>, image saved as <code>{{ output_image_prefix }}NODE-ID.{{ output_image_format }}</code>.</li>
+                    <li>Fetched JSON and images are cached in <code>{{ figma_cache_dir }}</code> and reused while the Figma file version is unchanged.</li>
+                    <li><strong>For Custom Code:</strong> Create a directory named <code>{{ common_code_dir }}</code> in the same location as this script. Place any relevant Kotlin files (<code>*.kt</code>) inside it. Colors, text styles, dimensions and composables matching the fetched node are picked out and sent to Gemini; if nothing matches, the whole files are sent.</li>
                 </ul>
             </div>
         </div>
     </div>
 
-    {% if session.get('json_file_path') %} 
+    {% if json_file_path %} 
     <div class="mdl-card mdl-shadow--6dp">
         <div class="mdl-card__title" style="background-color: #009688;"> 
             <h2 class="mdl-card__title-text">Final Generated Jetpack Compose Code</h2>
@@ -257,7 +376,7 @@ HTML_TEMPLATE = """
         <div class="mdl-card__supporting-text">
             <p>The complete code generated by Gemini API (<code>{{ gemini_model_name }}</code>) will appear here after streaming finishes. <strong>Always review and test thoroughly.</strong></p>
             <p class="file-info">Based on Figma data for Node ID: {{ session.get('last_node_id', 'N/A') }}</p>
-            <textarea id="final-compose-code" readonly class="compose-code" placeholder="Generated code will appear here...">{{ session.get('compose_code_output', '') }}</textarea>
+            <textarea id="final-compose-code" readonly class="compose-code" placeholder="Generated code will appear here...">{{ compose_code_output }}</textarea>
         </div>
     </div>
     {% endif %}
@@ -300,6 +419,9 @@ HTML_TEMPLATE = """
             const streamLog = document.getElementById('gemini-stream-log');
             const finalCodeTextarea = document.getElementById('final-compose-code');
             const additionalInstructionsTextarea = document.getElementById('additional_gemini_instructions');
+            const splitSubtreesCheckbox = document.getElementById('split_subtrees');
+            const forceRegenerateCheckbox = document.getElementById('force_regenerate');
+            const incrementalCheckbox = document.getElementById('incremental');
 
 
             if (generateBtn && finalCodeTextarea && additionalInstructionsTextarea) { 
@@ -321,55 +443,107 @@ HTML_TEMPLATE = """
                     const messagesDivs = document.querySelectorAll('.messages');
                     messagesDivs.forEach(div => div.style.display = 'none');
 
-                    const additionalInstructions = encodeURIComponent(additionalInstructionsTextarea.value);
-                    const eventSourceUrl = "{{ url_for('stream_compose_generation') }}?additional_instructions=" + additionalInstructions;
-                    const eventSource = new EventSource(eventSourceUrl);
-
+                    // Log text is appended once per animation frame rather than on every event,
+                    // so a fast stream of small chunks does not re-layout the page each time.
+                    let pendingLog = [];
+                    let logFlushScheduled = false;
+
+                    function flushLog() {
+                        logFlushScheduled = false;
+                        if (pendingLog.length === 0) return;
+                        streamLog.appendChild(document.createTextNode(pendingLog.join('')));
+                        pendingLog = [];
+                        streamContainer.scrollTop = streamContainer.scrollHeight;
+                    }
 
-                    eventSource.onmessage = function (event) {
-                        if (event.data === "[STREAM_END]") {
-                            streamLog.textContent += '\\n\\n--- Generation Complete ---';
-                            eventSource.close();
-                            finalCodeTextarea.value = accumulatedCode; 
-                            generateBtn.disabled = false; 
-                            generateBtn.textContent = 'Generate Jetpack Compose with Gemini';
-
-                            fetch("{{ url_for('save_generated_code') }}", {
-                                method: 'POST',
-                                headers: { 'Content-Type': 'application/json', },
-                                body: JSON.stringify({ code: accumulatedCode })
-                            })
-                            .then(response => response.json())
-                            .then(data => console.log('Save to session response:', data))
-                            .catch(error => console.error('Error saving code to session:', error));
-
-                        } else if (event.data.startsWith("[ERROR]")) {
-                            let errorMessage = event.data.substring("[ERROR]".length).trim();
-                            streamLog.textContent += '\\n\\n--- ERROR --- \\n' + errorMessage;
-                            eventSource.close();
-                            finalCodeTextarea.value = "Error during generation. See log above.";
-                            generateBtn.disabled = false;
-                            generateBtn.textContent = 'Generate Jetpack Compose with Gemini';
-                        } else if (event.data.startsWith("[INFO]")) {
-                            let infoMessage = event.data.substring("[INFO]".length).trim();
-                            streamLog.textContent += '\\n[INFO] ' + infoMessage + '\\n';
-                        }
-                        else {
-                            let textChunk = event.data.replace(/\\\\n/g, '\\n'); 
-                            streamLog.textContent += textChunk;
-                            accumulatedCode += textChunk; 
-                            streamContainer.scrollTop = streamContainer.scrollHeight; 
+                    function appendLog(text) {
+                        pendingLog.push(text);
+                        if (!logFlushScheduled) {
+                            logFlushScheduled = true;
+                            requestAnimationFrame(flushLog);
                         }
-                    };
+                    }
 
-                    eventSource.onerror = function (error) {
-                        console.error("EventSource failed:", error);
-                        streamLog.textContent += '\\n\\n--- Connection Error with Server. Streaming stopped. ---';
-                        eventSource.close();
-                        finalCodeTextarea.value = "Error connecting to the server for streaming. Check console.";
+                    function resetGenerateButton() {
                         generateBtn.disabled = false;
                         generateBtn.textContent = 'Generate Jetpack Compose with Gemini';
-                    };
+                    }
+
+                    function showError(errorMessage) {
+                        appendLog('\\n\\n--- ERROR --- \\n' + errorMessage);
+                        finalCodeTextarea.value = "Error during generation. See log above.";
+                        resetGenerateButton();
+                    }
+
+                    // The generation runs as a server-side job; the EventSource only watches it.
+                    // If the connection drops, the browser reconnects with Last-Event-ID and resumes.
+                    function attachToJob(eventsUrl) {
+                        const eventSource = new EventSource(eventsUrl);
+
+                        eventSource.onmessage = function (event) {
+                            if (event.data === "[STREAM_END]") {
+                                eventSource.close();
+                                appendLog('\\n\\n--- Generation Complete ---');
+                                flushLog();
+                                finalCodeTextarea.value = accumulatedCode; 
+                                resetGenerateButton();
+
+                                fetch("{{ url_for('save_generated_code') }}", {
+                                    method: 'POST',
+                                    headers: { 'Content-Type': 'application/json', },
+                                    body: JSON.stringify({ code: accumulatedCode })
+                                })
+                                .then(response => response.json())
+                                .then(data => console.log('Save to session response:', data))
+                                .catch(error => console.error('Error saving code to session:', error));
+
+                            } else if (event.data.startsWith("[ERROR]")) {
+                                eventSource.close();
+                                showError(event.data.substring("[ERROR]".length).trim());
+                            } else if (event.data.startsWith("[INFO]")) {
+                                let infoMessage = event.data.substring("[INFO]".length).trim();
+                                appendLog('\\n[INFO] ' + infoMessage + '\\n');
+                            } else if (event.data === "[RESYNC]") {
+                                accumulatedCode = '';
+                                appendLog('\\n--- Missed part of the stream; re-sending the code generated so far ---\\n');
+                            }
+                            else {
+                                let textChunk = event.data.replace(/\\\\n/g, '\\n'); 
+                                appendLog(textChunk);
+                                accumulatedCode += textChunk; 
+                            }
+                        };
+
+                        eventSource.onerror = function (error) {
+                            console.error("EventSource failed:", error);
+                            if (eventSource.readyState === EventSource.CONNECTING) {
+                                appendLog('\\n--- Connection lost, reconnecting. The generation keeps running on the server. ---\\n');
+                                return;
+                            }
+                            eventSource.close();
+                            appendLog('\\n\\n--- Connection Error with Server. Streaming stopped. ---');
+                            finalCodeTextarea.value = "Error connecting to the server for streaming. Check console.";
+                            resetGenerateButton();
+                        };
+                    }
+
+                    const jobParams = new URLSearchParams();
+                    jobParams.append('additional_instructions', additionalInstructionsTextarea.value);
+                    jobParams.append('split_subtrees', splitSubtreesCheckbox && splitSubtreesCheckbox.checked ? '1' : '0');
+                    jobParams.append('force_regenerate', forceRegenerateCheckbox && forceRegenerateCheckbox.checked ? '1' : '0');
+                    jobParams.append('incremental', incrementalCheckbox && incrementalCheckbox.checked ? '1' : '0');
+
+                    fetch("{{ url_for('start_generation_job') }}", { method: 'POST', body: jobParams })
+                    .then(response => response.json())
+                    .then(data => {
+                        if (data.status !== 'success') {
+                            showError(data.message);
+                            return;
+                        }
+                        appendLog('[INFO] Generation job ' + data.job_id + ' started.\\n');
+                        attachToJob(data.events_url);
+                    })
+                    .catch(error => showError('Could not start generation: ' + error));
                 });
             }
         });
@@ -412,8 +586,42 @@ def parse_figma_url(url):
             return file_key, node_id_decoded
     return None, None
 
+
+def parse_figma_batch_input(text):
+    """
+    Parses many Figma URLs and/or bare node ids (separated by whitespace, commas or newlines) for one file.
+    Returns (file_key, node_ids, error_message).
+    """
+    file_key = None
+    node_ids = []
+    seen = set()
+    for token in re.split(r"[\s,]+", text or ""):
+        if not token:
+            continue
+        if "figma.com" in token:
+            url_file_key, node_id = parse_figma_url(token)
+            if not url_file_key or not node_id:
+                return None, [], f"Could not parse File Key or Node ID from URL: {token}"
+            if file_key and url_file_key != file_key:
+                return None, [], f"All URLs in a batch must point to the same Figma file ({file_key} vs {url_file_key})."
+            file_key = url_file_key
+        elif re.fullmatch(r"I?\d+[:-]\d+(?:;I?\d+[:-]\d+)*", token):
+            node_id = token
+        else:
+            return None, [], f"Not a Figma URL or node id: {token}"
+        normalized = node_id.replace("-", ":")
+        if normalized not in seen:
+            seen.add(normalized)
+            node_ids.append(node_id)
+    if not file_key:
+        return None, [], "At least one full Figma URL is needed so the file key is known."
+    if not node_ids:
+        return None, [], "No node ids found."
+    return file_key, node_ids, None
+
 # Modified to accept api_key and additional_instructions as parameters
-def call_gemini_api_sse_generator(api_key_param, figma_json_str, figma_svg_str=None, custom_kotlin_files_content=None, additional_instructions=None):
+def call_gemini_api_sse_generator(api_key_param, figma_json_str, figma_svg_str=None, custom_kotlin_files_content=None, additional_instructions=None, json_uses_shared_styles=False,
+                                  json_uses_component_definitions=False):
     """
     Calls the Gemini API and yields chunks for SSE.
     Uses the provided api_key_param and incorporates additional_instructions.
@@ -430,96 +638,42 @@ def call_gemini_api_sse_generator(api_key_param, figma_json_str, figma_svg_str=N
         return
 
     try:
-        genai.configure(api_key=api_key_param) 
-        print(f"SSE Generator: Configured Gemini API with key. Model: {GEMINI_MODEL_NAME}")
-        
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME) 
-
-        prompt = f"""
-        You are an expert Android Jetpack Compose developer. Your primary task is to generate high-quality, production-ready, and syntactically correct Jetpack Compose (Kotlin) code.
-        This code must be based on the provided Figma design data (JSON and SVG if available) and MUST preferentially use any custom Kotlin definitions (colors, typography, utilities) also provided.
-
-        Figma Node JSON:
-        ```json
-        {figma_json_str}
-        ```
-        """
-
-        if figma_svg_str:
-            prompt += f"""
-        Figma Node SVG Content (if applicable, for VECTOR nodes or image fills):
-        ```svg
-        {figma_svg_str}
-        ```
-        """
-        else:
-            prompt += "\nNo SVG content was provided for this node.\n"
-
-        if custom_kotlin_files_content:
-            prompt += "\nIMPORTANT CONTEXT: You MUST use the following existing custom Kotlin code from the project. Prioritize these definitions over generating new ones. If a Figma property (e.g., a color hex code, a font style) matches a definition in this custom code, YOU MUST use the custom definition (e.g., `AppColors.PrimaryBlue`, `AppTypography.h1`). Do NOT redefine these variables or styles.\n"
-            for file_info in custom_kotlin_files_content:
-                prompt += f"""
-                --- Start of content from '{file_info['filename']}' ---
-                ```kotlin
-                {file_info['content']}
-                ```
-                --- End of content from '{file_info['filename']}' ---
-                """
-        else:
-            prompt += "\nNo custom Kotlin files were provided. Generate standard Jetpack Compose code using standard Color objects and TextStyle configurations as needed.\n"
-        
-        if additional_instructions:
-            prompt += f"""
-        CRITICAL USER INSTRUCTIONS: Please strictly adhere to the following additional user-provided instructions for this specific component:
-        --- Start of Additional User Instructions ---
-        {additional_instructions}
-        --- End of Additional User Instructions ---
-        """
-
-        prompt += """
-        Key Instructions for Jetpack Compose Code Generation:
-        1.  **PRIORITIZE CUSTOM CODE**: This is the most important instruction. If custom Kotlin code (colors, typography, utilities from the files listed above) is provided, YOU ABSOLUTELY MUST use those definitions. For example, if a Figma color is `#FF0000` and the custom code has `val ErrorRed = Color(0xFFFF0000)`, you must use `ErrorRed`. Do not generate `Color(0xFFFF0000)` directly.
-        2.  **Accuracy and Pixel Perfection**: Strive for the closest possible visual match to the Figma design. Pay close attention to dimensions (width, height, `absoluteBoundingBox`), padding, margins, colors, fonts (family, weight, size, letterSpacing, lineHeight), corner radii, and layout (auto-layout properties like `layoutMode`, `itemSpacing`, `primaryAxisSizingMode`, `counterAxisSizingMode`).
-        3.  **Error-Free and Runnable Code**: The generated Kotlin code MUST be syntactically correct and immediately runnable within a standard Jetpack Compose project. Include ALL necessary import statements.
-        4.  **Standard Composables**: Use standard Jetpack Compose functions and Modifiers (`Box`, `Column`, `Row`, `Text`, `Image`, `Surface`, `Modifier.padding`, `Modifier.size`, `Modifier.background`, etc.).
-        5.  **SVG Handling**: If SVG content is provided, generate code to render it, preferably using a common library like Coil-SVG for Compose (`rememberAsyncImagePainter` with an SVG decoder). If the SVG is extremely simple, you may note that it could be converted to an Android VectorDrawable, but still provide the Coil-SVG based solution.
-        6.  **Interactivity**: For elements that appear interactive (buttons, input fields), include a placeholder `onClick` lambda (e.g., `onClick = {{ /* TODO: Implement action */ }}`). For input-like elements, suggest `remember {{ mutableStateOf("") }}`.
-        7.  **Previews**: ALWAYS include a `@Preview` Composable function. Ensure it's self-contained or uses easily mockable data.
-        8.  **Comments for Ambiguity**: If a Figma property is ambiguous or its direct translation is overly complex and might lead to errors, use a simpler, standard Jetpack Compose equivalent and add a clear comment in the code explaining the original Figma property or the intended behavior (e.g., `// Figma 'complex-gradient': Using solid color as fallback. Original: ...`).
-        9.  **Color Mapping (Fallback)**: If a Figma color does NOT have a clear match in the provided custom color definitions, then (and only then) generate a standard Compose `Color(red, green, blue, alpha)` object based on the RGBA values from Figma.
-        10. **Typography Mapping (Fallback)**: If Figma typography does NOT have a clear match in the provided custom typography definitions, then (and only then) create new `TextStyle` objects using Figma properties.
-        11. **Layout Translation**: Carefully translate Figma's auto-layout properties to Compose `Row`/`Column` arrangements, `Arrangement` parameters, and `Alignment` modifiers.
-        12. **Clarity and Readability**: Generate clean, well-formatted, and readable Kotlin code.
-
-        Output ONLY the complete, runnable Kotlin code block. Do not include any explanatory text, greetings, or apologies before or after the code block. Start directly with the package statement or imports.
-        """
+        # The lease keeps this key's client alive until the stream has been read (see gemini_clients.py).
+        with gemini_clients.lease(api_key_param, GEMINI_MODEL_NAME) as model:
+            print(f"SSE Generator: Using pooled Gemini client. Model: {GEMINI_MODEL_NAME}")
+
+            prompt = build_compose_prompt(figma_json_str, figma_svg_str, custom_kotlin_files_content,
+                                          additional_instructions, json_uses_shared_styles=json_uses_shared_styles,
+                                          json_uses_component_definitions=json_uses_component_definitions)
         
-        print(f"SSE Generator: --- Sending Prompt to Gemini API ({GEMINI_MODEL_NAME}) ---") 
+            print(f"SSE Generator: --- Sending Prompt to Gemini API ({GEMINI_MODEL_NAME}) ---") 
         
-        response_stream = model.generate_content(prompt, stream=True)
+            response_stream = yield from sse_info_events(
+                open_gemini_stream(model, prompt, bucket_key(UPSTREAM_GEMINI, api_key_param)))
         
-        print("SSE Generator: --- Receiving Streamed Response from Gemini API: ---")
-        chunk_count = 0
-        for chunk in response_stream:
-            chunk_count += 1
-            if chunk.text: 
-                sse_data = chunk.text.replace('\n', '\\n') 
-                yield f"data: {sse_data}\n\n"
-                print(chunk.text, end='', flush=True) 
-            # else: 
-            #     print(f"\n[Stream chunk {chunk_count} had no text content. Parts: {chunk.parts}]", end='', flush=True)
-
-
-        if chunk_count == 0:
-            print("SSE Generator: [No chunks received from stream.]")
-            yield "data: [ERROR] No content received from Gemini stream.\n\n"
+            print("SSE Generator: --- Receiving Streamed Response from Gemini API: ---")
+            chunk_count = 0
+            for chunk in response_stream:
+                chunk_count += 1
+                if chunk.text: 
+                    sse_data = chunk.text.replace('\n', '\\n') 
+                    yield f"data: {sse_data}\n\n"
+                    if ECHO_GEMINI_STREAM:
+                        gemini_stream_log.debug(chunk.text)
+                # else: 
+                #     print(f"\n[Stream chunk {chunk_count} had no text content. Parts: {chunk.parts}]", end='', flush=True)
+
+
+            if chunk_count == 0:
+                print("SSE Generator: [No chunks received from stream.]")
+                yield "data: [ERROR] No content received from Gemini stream.\n\n"
         
-        print("\nSSE Generator: --- End of Streamed Response ---")
+            print("\nSSE Generator: --- End of Streamed Response ---")
         
-        if hasattr(response_stream, 'prompt_feedback') and response_stream.prompt_feedback and response_stream.prompt_feedback.block_reason:
-             yield f"data: [ERROR] Gemini API request was blocked. Reason: {response_stream.prompt_feedback.block_reason_message or response_stream.prompt_feedback.block_reason}\n\n"
+            if hasattr(response_stream, 'prompt_feedback') and response_stream.prompt_feedback and response_stream.prompt_feedback.block_reason:
+                 yield f"data: [ERROR] Gemini API request was blocked. Reason: {response_stream.prompt_feedback.block_reason_message or response_stream.prompt_feedback.block_reason}\n\n"
         
-        yield f"data: [STREAM_END]\n\n"
+            yield f"data: [STREAM_END]\n\n"
 
 
     except Exception as e:
@@ -531,10 +685,198 @@ def call_gemini_api_sse_generator(api_key_param, figma_json_str, figma_svg_str=N
         yield f"data: [STREAM_END]\n\n" 
 
 
+def call_gemini_parallel_sse_generator(api_key_param, plan, figma_svg_str=None, custom_kotlin_files_content=None, additional_instructions=None):
+    """
+    Generates each subtree of `plan` (and the parent skeleton) concurrently and yields SSE events.
+    See parallel_generation.py for how the frame is split and stitched back together.
+    """
+    print(f"SSE Generator: Split generation with {len(plan.subtrees)} subtrees...")
+    if not genai:
+        yield sse_error("The 'google-generativeai' library is not installed.")
+        yield sse_end()
+        return
+
+    if not api_key_param:
+        yield sse_error("Gemini API Key was not provided to the generator.")
+        yield sse_end()
+        return
+
+    float_precision = PROMPT_JSON_FLOAT_PRECISION if PROMPT_JSON_COMPACTION else None
+    try:
+        with gemini_clients.lease(api_key_param, GEMINI_MODEL_NAME) as model:
+            yield from parallel_generation_sse(model, plan, figma_svg_str, custom_kotlin_files_content,
+                                               additional_instructions, float_precision=float_precision,
+                                               dedupe_instances=PROMPT_INSTANCE_DEDUP,
+                                               rate_limit_bucket=bucket_key(UPSTREAM_GEMINI, api_key_param))
+    except Exception as e:
+        error_message = f"Error calling Gemini API ({GEMINI_MODEL_NAME}): {str(e)}"
+        print(f"SSE Generator: {error_message}") 
+        yield sse_error(error_message)
+        yield sse_end()
+
+
+def sse_info_then(info_messages, sse_generator):
+    """Emits the given [INFO] events before the events of another SSE generator."""
+    for message in info_messages:
+        yield f"data: [INFO] {message}\n\n"
+    yield from sse_generator
+
+
+class GenerationInputs:
+    """Prompt inputs prepared from a fetched job, plus [INFO] notes about how they were prepared."""
+
+    def __init__(self, loaded_json, figma_json_str, json_uses_shared_styles, figma_svg_str, custom_kotlin_files, info_messages,
+                 json_uses_component_definitions=False):
+        self.loaded_json = loaded_json
+        self.figma_json_str = figma_json_str
+        self.json_uses_shared_styles = json_uses_shared_styles
+        self.json_uses_component_definitions = json_uses_component_definitions
+        self.figma_svg_str = figma_svg_str
+        self.custom_kotlin_files = custom_kotlin_files
+        self.info_messages = info_messages
+
+
+def load_generation_inputs(json_path, svg_path=None, prompt_json_path=None):
+    """
+    Reads a job's JSON (compacted if enabled), SVG and the relevant common/ Kotlin. Raises if the JSON cannot be read.
+    With compaction on, only the pruned form is loaded: `prompt_json_path` if the fetch wrote it, else one
+    streaming pass over the raw JSON (see nodes_stream.py).
+    """
+    started = time.perf_counter()
+    info_messages = []
+    if PROMPT_JSON_COMPACTION:
+        loaded_json = load_prompt_json(json_path, prompt_json_path)
+        figma_json_str, json_uses_shared_styles, component_definitions = compact_figma_json(
+            loaded_json, float_precision=PROMPT_JSON_FLOAT_PRECISION, dedupe_instances=PROMPT_INSTANCE_DEDUP)
+        compaction_message = format_compaction_report(compaction_report(os.path.getsize(json_path), figma_json_str))
+        print(compaction_message)
+        info_messages.append(compaction_message)
+        if component_definitions:
+            instance_message = format_instance_report(component_definitions)
+            print(instance_message)
+            info_messages.append(instance_message)
+    else:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            loaded_json = json.load(f)
+        figma_json_str, json_uses_shared_styles, component_definitions = json.dumps(loaded_json, indent=4), False, {}
+
+    figma_svg_str = None
+    if svg_path and os.path.exists(svg_path): 
+        try:
+            with open(svg_path, 'r', encoding='utf-8') as f: 
+                figma_svg_str = f.read() 
+        except Exception as e:
+            print(f"Warning: Error reading SVG file {svg_path}: {e}")
+
+    custom_kotlin_files, custom_kotlin_summary = kotlin_index.prompt_files(loaded_json, relevant_only=COMMON_CODE_RELEVANT_SYMBOLS_ONLY)
+    if custom_kotlin_summary:
+        print(custom_kotlin_summary)
+        info_messages.append(custom_kotlin_summary)
+    metrics.PROMPT_ASSEMBLY_SECONDS.observe(time.perf_counter() - started)
+    return GenerationInputs(loaded_json, figma_json_str, json_uses_shared_styles, figma_svg_str, custom_kotlin_files, info_messages,
+                            json_uses_component_definitions=bool(component_definitions))
+
+
+def compose_generation_sse(api_key, inputs, additional_instructions=None, split_subtrees=False, force_regenerate=False,
+                           incremental_node=None):
+    """
+    SSE events for one generation: locally emitted code for a simple node (see rule_based_compose.py),
+    a generation-cache replay on a hit, otherwise a live single or split Gemini run whose result is
+    cached if it finishes without an error.
+    With `incremental_node` = (file_key, node_id), the run is split and only subtrees changed since that
+    node's last incremental generation are sent to Gemini (see incremental_generation.py).
+    """
+    info_messages = list(inputs.info_messages)
+    if RULE_BASED_FAST_PATH and not additional_instructions and not force_regenerate:
+        try:
+            code, reason = try_rule_based_compose(inputs.loaded_json, kotlin_index.symbols())
+        except Exception as e:
+            # An emitter bug must not cost the user their generation; Gemini handles the node instead.
+            code, reason = None, f"rule-based emitter failed: {e!r}"
+        metrics.RULE_BASED_GENERATIONS.labels(result="fallback" if code is None else "emitted").inc()
+        if code is not None:
+            print(f"SSE Generator: rule-based fast path emitted {len(code)} chars.")
+            return sse_info_then(info_messages, rule_based_sse(code))
+        print(f"SSE Generator: rule-based fast path not used: {reason}.")
+
+    split_subtrees = split_subtrees or incremental_node is not None
+    plan = plan_subtrees(inputs.loaded_json) if split_subtrees else None
+    if split_subtrees and not plan:
+        info_messages.append("Frame has too few top-level children to split; generating it in one pass.")
+
+    cache_key = generation_cache_key(inputs.figma_json_str, inputs.figma_svg_str, inputs.custom_kotlin_files,
+                                     additional_instructions, GEMINI_MODEL_NAME, "split" if plan else "single")
+    if force_regenerate:
+        metrics.GENERATION_CACHE_REQUESTS.labels(result="bypass").inc()
+    else:
+        cached_code = generation_cache.get(cache_key)
+        metrics.GENERATION_CACHE_REQUESTS.labels(result="miss" if cached_code is None else "hit").inc()
+        if cached_code is not None:
+            print(f"SSE Generator: generation cache hit ({cache_key[:12]}), replaying {len(cached_code)} chars.")
+            return sse_info_then(info_messages, replay_sse(cached_code))
+
+    incremental = bool(plan and incremental_node)
+    if incremental:
+        context_key = baseline_context_key(inputs.custom_kotlin_files, additional_instructions, GEMINI_MODEL_NAME)
+        if force_regenerate:
+            info_messages.append("Incremental: force regenerate, so every subtree is generated again.")
+        else:
+            diff = apply_baseline(plan, generation_baselines.get(*incremental_node), context_key)
+            info_messages.append(diff.summary() if diff else
+                                 "Incremental: no previous generation of this node under the same instructions; generating every subtree.")
+
+    def on_complete(code):
+        generation_cache.put(cache_key, code)
+        if incremental:
+            generation_baselines.put(*incremental_node, plan_baseline(plan, context_key))
+
+    if plan:
+        sse_generator = call_gemini_parallel_sse_generator(
+            api_key,
+            plan,
+            inputs.figma_svg_str,
+            custom_kotlin_files_content=inputs.custom_kotlin_files,
+            additional_instructions=additional_instructions
+        )
+    else:
+        sse_generator = call_gemini_api_sse_generator(
+            api_key, 
+            inputs.figma_json_str, 
+            inputs.figma_svg_str,
+            custom_kotlin_files_content=inputs.custom_kotlin_files,
+            additional_instructions=additional_instructions,
+            json_uses_shared_styles=inputs.json_uses_shared_styles,
+            json_uses_component_definitions=inputs.json_uses_component_definitions
+        )
+    return sse_info_then(info_messages, record_sse(sse_generator, on_complete))
+
+
+def saved_compose_output():
+    """The generated code saved for this session, or '' (see /save_generated_code)."""
+    result_id = session.get(COMPOSE_OUTPUT_SESSION_KEY)
+    return (result_store.get(result_id) or '') if result_id else ''
+
+
+def clear_saved_compose_output():
+    result_id = session.pop(COMPOSE_OUTPUT_SESSION_KEY, None)
+    if result_id:
+        result_store.delete(result_id)
+
+
 @app.route('/', methods=['GET'])
 def index():
     """Renders the main page."""
-    compose_output = session.get('compose_code_output', '')
+    compose_output = saved_compose_output()
+    job = artifact_store.get_job(session.get('job_id'))
+    json_file_path = job.artifact_path('json') if job else None
+    image_file_path = job.artifact_path('image') if job else None
+    asset_export = job.meta.get('asset_export') if job and job.artifact_path('assets') else None
+    batch_jobs = []
+    for batch_job_id in session.get('batch_job_ids', []):
+        batch_job = artifact_store.get_job(batch_job_id)
+        if batch_job:
+            batch_jobs.append({"job_id": batch_job_id, "node_id": batch_job.meta.get('node_id'),
+                               "active": batch_job_id == session.get('job_id')})
     figma_token_env_set = True if os.environ.get(FIGMA_TOKEN_ENV_VAR) else False
     gemini_api_key_env_set = True if os.environ.get(GEMINI_API_KEY_ENV_VAR) else False
 
@@ -551,9 +893,17 @@ def index():
                                   figma_token_env_set=figma_token_env_set,
                                   gemini_api_key_env_set=gemini_api_key_env_set,
                                   flask_port_env_var=FLASK_PORT_ENV_VAR, 
+                                  figma_api_base_url_env_var=FIGMA_API_BASE_URL_ENV_VAR,
+                                  figma_cache_dir=figma_cache.cache_dir,
                                   default_flask_port=DEFAULT_FLASK_PORT, 
                                   gemini_model_name=GEMINI_MODEL_NAME,
                                   common_code_dir=COMMON_CODE_DIR, 
+                                  job_artifacts_dir=artifact_store.root_dir,
+                                  json_file_path=json_file_path,
+                                  image_file_path=image_file_path,
+                                  asset_export=asset_export,
+                                  asset_export_spec=(asset_export or {}).get('spec') or DEFAULT_ASSET_EXPORT_SPEC,
+                                  batch_jobs=batch_jobs,
                                   compose_code_output=compose_output)
 
 @app.route('/configure_tokens', methods=['POST'])
@@ -578,11 +928,42 @@ def configure_tokens():
     return redirect(url_for('index'))
 
 
+def optimize_prompt_svg(svg_text):
+    return optimize_svg(svg_text, precision=PROMPT_SVG_COORDINATE_PRECISION, max_bytes=PROMPT_SVG_MAX_BYTES)
+
+
+def prompt_svg_optimizer():
+    """The svg_optimizer passed to the fetch pipelines, or None when PROMPT_SVG_OPTIMIZATION is off."""
+    return optimize_prompt_svg if PROMPT_SVG_OPTIMIZATION else None
+
+
+def record_prompt_svg(job, result):
+    """Registers the optimized SVG of a fetch and its size savings on the job. Returns the report message, if any."""
+    if not result.prompt_svg_path:
+        return None
+    artifact_store.record_artifact(job, 'prompt_svg', result.prompt_svg_path)
+    artifact_store.update_meta(job, svg_optimization=result.svg_report)
+    message = format_svg_report(result.svg_report)
+    print(message)
+    return message
+
+
+def prompt_svg_path(job):
+    """The SVG to inline into the prompt: the optimized one if the fetch produced it, else the raw export."""
+    return (job.artifact_path('prompt_svg') or job.artifact_path('image')) if job else None
+
+
+def image_filename_for(node_id):
+    safe_node_id_for_filename = node_id.replace(":", "-").replace("/", "-").replace("\\", "-").replace(";", "_")
+    return f"{OUTPUT_IMAGE_FILE_PREFIX}{safe_node_id_for_filename}.{OUTPUT_IMAGE_FORMAT}" 
+
+
 @app.route('/fetch', methods=['POST'])
 def fetch_figma_data():
-    session.pop('compose_code_output', None) 
-    session.pop('json_file_path', None)
-    session.pop('image_file_path', None)
+    clear_saved_compose_output()
+    cancel_speculative_generation("a new node is being fetched")
+    session.pop('job_id', None)
+    session.pop('batch_job_ids', None)
     session.pop('last_node_id', None)
     
     figma_url = request.form.get('figma_url')
@@ -601,142 +982,323 @@ def fetch_figma_data():
         flash(f"Error: Figma Access Token is not set. Please set it via UI or the {FIGMA_TOKEN_ENV_VAR} environment variable.", "error")
         return redirect(url_for('index'))
 
-    encoded_node_id_for_api = urllib.parse.quote(node_id)
-    json_api_url = f"https://api.figma.com/v1/files/{file_key}/nodes?ids={encoded_node_id_for_api}"
-    curl_json_command = ["curl", "-s", "-H", f"X-Figma-Token: {figma_token}", json_api_url]
+    figma_client = FigmaClient(figma_token)
+
+    job = artifact_store.create_job(file_key=file_key, node_id=node_id)
+    output_json_path = job.path(OUTPUT_JSON_FILENAME)
+    image_output_path = job.path(image_filename_for(node_id))
+
+    result = run_fetch_pipeline(figma_client, file_key, node_id, output_json_path, image_output_path, OUTPUT_IMAGE_FORMAT,
+                                cache=figma_cache, svg_optimizer=prompt_svg_optimizer())
+
+    if result.json_error:
+        flash(result.json_error, "error")
+        return redirect(url_for('index'))
+    flash(f"JSON for '{node_id}' saved to '{result.json_path}'.", "success")
+    artifact_store.record_artifact(job, 'json', result.json_path)
+    if result.prompt_json_path:
+        artifact_store.record_artifact(job, 'prompt_json', result.prompt_json_path)
+    session['job_id'] = job.job_id
+
+    if result.image_path:
+        flash(f"{OUTPUT_IMAGE_FORMAT.upper()} image for '{node_id}' saved to '{result.image_path}'.", "success")
+        artifact_store.record_artifact(job, 'image', result.image_path)
+        svg_message = record_prompt_svg(job, result)
+        if svg_message:
+            flash(f"{svg_message}.", "info")
+    elif result.image_error:
+        flash(result.image_error, "error")
+    elif result.image_warning:
+        flash(result.image_warning, "warning")
+
+    cache_note = f" Cache: {result.cache_status}." if result.cache_status else ""
+    wait_note = f" Waited {figma_client.waited_seconds:.1f}s for Figma rate limits/retries." if figma_client.waited_seconds else ""
+    flash(f"Fetch timings: {result.timing_summary()}.{cache_note}{wait_note}", "info")
+    if start_speculative_generation(job):
+        flash("Started generating with the default options in the background; \"Generate\" without changes picks it up.", "info")
+
+    return redirect(url_for('index'))
+
+
+@app.route('/fetch_batch', methods=['POST'])
+def fetch_figma_batch():
+    clear_saved_compose_output()
+    cancel_speculative_generation("a new batch is being fetched")
+    session.pop('job_id', None)
+    session.pop('batch_job_ids', None)
+    session.pop('last_node_id', None)
+
+    file_key, node_ids, parse_error = parse_figma_batch_input(request.form.get('figma_urls', ''))
+    if parse_error:
+        flash(parse_error, "error")
+        return redirect(url_for('index'))
+
+    figma_token = get_figma_token() 
+    if not figma_token:
+        flash(f"Error: Figma Access Token is not set. Please set it via UI or the {FIGMA_TOKEN_ENV_VAR} environment variable.", "error")
+        return redirect(url_for('index'))
+
+    jobs = {}
+    targets = []
+    for node_id in node_ids:
+        job = artifact_store.create_job(file_key=file_key, node_id=node_id)
+        jobs[node_id] = job
+        targets.append((node_id, job.path(OUTPUT_JSON_FILENAME), job.path(image_filename_for(node_id))))
+
+    figma_client = FigmaClient(figma_token)
+    batch = run_batch_fetch_pipeline(figma_client, file_key, targets, OUTPUT_IMAGE_FORMAT, cache=figma_cache,
+                                     svg_optimizer=prompt_svg_optimizer())
+
+    fetched_job_ids = []
+    fetched_node_ids = []
+    for result in batch.results:
+        job = jobs[result.node_id]
+        if result.json_error:
+            flash(result.json_error, "error")
+            continue
+        artifact_store.record_artifact(job, 'json', result.json_path)
+        if result.prompt_json_path:
+            artifact_store.record_artifact(job, 'prompt_json', result.prompt_json_path)
+        if result.image_path:
+            artifact_store.record_artifact(job, 'image', result.image_path)
+            record_prompt_svg(job, result)
+        elif result.image_error:
+            flash(result.image_error, "error")
+        elif result.image_warning:
+            flash(result.image_warning, "warning")
+        fetched_job_ids.append(job.job_id)
+        fetched_node_ids.append(result.node_id)
+
+    if fetched_job_ids:
+        session['batch_job_ids'] = fetched_job_ids
+        session['job_id'] = fetched_job_ids[0]
+        session['last_node_id'] = fetched_node_ids[0]
+        flash(f"Fetched {len(fetched_job_ids)} of {len(node_ids)} node(s) from '{file_key}' "
+              f"with {batch.api_calls} Figma API call(s).", "success")
+    wait_note = f" Waited {figma_client.waited_seconds:.1f}s for Figma rate limits/retries." if figma_client.waited_seconds else ""
+    flash(f"Batch fetch timings: {batch.timing_summary()}.{wait_note}", "info")
+    return redirect(url_for('index'))
+
 
-    output_json_path = os.path.join(os.getcwd(), OUTPUT_JSON_FILENAME)
+@app.route('/export_assets', methods=['POST'])
+def export_figma_assets():
+    """Renders the current job's icons and images as a drawable set (see asset_export.py)."""
+    job = artifact_store.get_job(session.get('job_id'))
+    json_path = job.artifact_path('json') if job else None
+    if not json_path:
+        flash("Figma JSON data not found in session. Please fetch data first.", "error")
+        return redirect(url_for('index'))
+    figma_token = get_figma_token()
+    if not figma_token:
+        flash(f"Error: Figma Access Token is not set. Please set it via UI or the {FIGMA_TOKEN_ENV_VAR} environment variable.", "error")
+        return redirect(url_for('index'))
+
+    spec = request.form.get('asset_formats') or DEFAULT_ASSET_EXPORT_SPEC
     try:
-        process_json = subprocess.run(curl_json_command, capture_output=True, text=True, check=True)
-        loaded_json = json.loads(process_json.stdout)
-        with open(output_json_path, 'w') as f:
-            json.dump(loaded_json, f, indent=4)
-        flash(f"JSON for '{node_id}' saved to '{output_json_path}'.", "success")
-        session['json_file_path'] = output_json_path 
-    except subprocess.CalledProcessError as e:
-        error_message = f"Error fetching node JSON for '{node_id}'. Curl Return code: {e.returncode}. "
-        try:
-            error_details = json.loads(e.stdout.strip()) 
-            error_message += f"Figma API: {error_details.get('err') or error_details.get('message', e.stdout.strip())}"
-        except (json.JSONDecodeError, AttributeError):
-            error_message += f"Stderr: {e.stderr.strip() if e.stderr else ''} Stdout: {e.stdout.strip() if e.stdout else ''}"
-        flash(error_message, "error")
+        parse_export_spec(spec)
+    except ValueError as e:
+        flash(f"Invalid asset formats: {e}", "error")
+        return redirect(url_for('index'))
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            nodes_response = json.load(f)
+    except (OSError, ValueError) as e:
+        flash(f"Error reading the fetched Figma JSON: {e}. Please fetch the frame again.", "error")
         return redirect(url_for('index'))
-    except json.JSONDecodeError as e_json:
-        flash(f"Error decoding JSON from Figma API for node '{node_id}': {e_json}. Response: {process_json.stdout[:200]}...", "error")
+    output_dir = job.path(ASSET_EXPORT_DIRNAME)
+    try:
+        assets, export, warnings = export_assets(FigmaClient(figma_token), job.meta.get('file_key'), nodes_response, output_dir, spec)
+    except (AssetExportError, FigmaAPIError) as e:
+        flash(f"Asset export failed: {e}. Any earlier export was kept.", "error")
         return redirect(url_for('index'))
     except Exception as e:
-        flash(f"Error fetching/saving JSON for '{node_id}': {str(e)}", "error")
+        print(f"Error in /export_assets: {e}")
+        flash(f"Unexpected error while exporting assets: {e}. Any earlier export was kept.", "error")
         return redirect(url_for('index'))
 
-    safe_node_id_for_filename = node_id.replace(":", "-").replace("/", "-").replace("\\", "-")
-    image_filename = f"{OUTPUT_IMAGE_FILE_PREFIX}{safe_node_id_for_filename}.{OUTPUT_IMAGE_FORMAT}" 
-    image_output_path = os.path.join(os.getcwd(), image_filename)
-    image_api_url = f"https://api.figma.com/v1/images/{file_key}?ids={encoded_node_id_for_api}&format={OUTPUT_IMAGE_FORMAT}"
-    curl_image_url_command = ["curl", "-s", "-H", f"X-Figma-Token: {figma_token}", image_api_url]
-    
-    try:
-        process_image_url = subprocess.run(curl_image_url_command, capture_output=True, text=True, check=True)
-        image_url_response_json = json.loads(process_image_url.stdout)
-        actual_image_url = None
-        image_dict = image_url_response_json.get("images")
-
-        if isinstance(image_dict, dict) and image_dict:
-            if node_id in image_dict: actual_image_url = image_dict[node_id]
-            else: 
-                node_id_parts = node_id.split('-', 1)
-                if len(node_id_parts) == 2:
-                    node_id_colon_variant = f"{node_id_parts[0]}:{node_id_parts[1]}"
-                    if node_id_colon_variant in image_dict: actual_image_url = image_dict[node_id_colon_variant]
-                if actual_image_url is None and ',' not in node_id and len(image_dict) == 1: 
-                    actual_image_url = list(image_dict.values())[0]
-        
-        if actual_image_url:
-            curl_download_image_command = ["curl", "-sL", actual_image_url] 
-            process_download = subprocess.run(curl_download_image_command, capture_output=True, check=True) 
-            with open(image_output_path, 'wb') as img_file: img_file.write(process_download.stdout)
-            flash(f"{OUTPUT_IMAGE_FORMAT.upper()} image for '{node_id}' saved to '{image_output_path}'.", "success")
-            session['image_file_path'] = image_output_path 
-        else:
-            err_msg = image_url_response_json.get("err") if isinstance(image_url_response_json, dict) else "Image not found in API response."
-            flash(f"Could not find/fetch {OUTPUT_IMAGE_FORMAT.upper()} image URL for '{node_id}'. API msg: {err_msg}. Response: {str(image_url_response_json)[:100]}...", "warning")
-    except subprocess.CalledProcessError as e_img_url:
-        error_message = f"Error during {OUTPUT_IMAGE_FORMAT.upper()} image API call for node '{node_id}'. Curl Return code: {e_img_url.returncode}. "
-        try:
-            error_details = json.loads(e_img_url.stdout.strip())
-            error_message += f"Figma API: {error_details.get('err') or error_details.get('message', e_img_url.stdout.strip())}"
-        except (json.JSONDecodeError, AttributeError): 
-             error_message += f"Stderr: {e_img_url.stderr.strip() if e_img_url.stderr else ''} Stdout: {e_img_url.stdout.strip() if e_img_url.stdout else ''}"
-        flash(error_message, "error") 
-    except Exception as e_img: 
-        flash(f"Error fetching/saving {OUTPUT_IMAGE_FORMAT.upper()} image for '{node_id}': {str(e_img)}", "error")
+    artifact_store.record_artifact(job, 'assets', os.path.join(output_dir, ASSET_MANIFEST_FILENAME))
+    artifact_store.update_meta(job, asset_export={"spec": spec, "assets": len(assets), "files": len(export.files),
+                                                  "bytes": export.bytes_written, "dir": output_dir})
+    if not assets:
+        flash("No icons or images found in this frame.", "warning")
+    else:
+        flash(f"{format_asset_export_summary(assets, export)}.", "success" if not export.errors else "warning")
+    for warning in warnings[:5]:
+        flash(warning, "warning")
+    if len(warnings) > 5:
+        flash(f"... and {len(warnings) - 5} more asset export error(s).", "warning")
+    return redirect(url_for('index'))
 
+
+@app.route('/download_assets')
+def download_assets():
+    """The current job's exported drawables as a ZIP, spooled to disk once it grows past a few MiB."""
+    job = artifact_store.get_job(session.get('job_id'))
+    manifest_path = job.artifact_path('assets') if job else None
+    if not manifest_path or not os.path.exists(manifest_path):
+        flash("No exported assets for this frame. Please export them first.", "error")
+        return redirect(url_for('index'))
+    assets_dir = os.path.dirname(manifest_path)
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    # Only what this export wrote, as listed in its manifest.
+    paths = sorted({path for asset in manifest.get("assets", []) for path in asset.get("files", [])})
+    archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.write(manifest_path, ASSET_MANIFEST_FILENAME)
+        for path in paths:
+            zf.write(os.path.join(assets_dir, *path.split("/")), path)
+    archive.seek(0)
+    node_id = (job.meta.get('node_id') or 'frame').replace(':', '-')
+    return send_file(archive, mimetype='application/zip', as_attachment=True, download_name=f"drawables_{node_id}.zip")
+
+
+@app.route('/select_job/<job_id>')
+def select_job(job_id):
+    """Makes one of the batch-fetched nodes the input for generation."""
+    job = artifact_store.get_job(job_id) if job_id in session.get('batch_job_ids', []) else None
+    if not job:
+        flash("That fetched node is no longer available. Please fetch it again.", "error")
+        return redirect(url_for('index'))
+    clear_saved_compose_output()
+    session['job_id'] = job_id
+    session['last_node_id'] = job.meta.get('node_id')
     return redirect(url_for('index'))
 
 
-@app.route('/stream_compose_generation') 
-def stream_compose_generation():
-    session.pop('compose_code_output', None) 
+def generation_dedupe_key(job_id, additional_instructions='', split_subtrees=False, incremental=False):
+    """Requests with the same key for the same fetched job share one generation; the defaults are a plain "Generate"."""
+    return (job_id, additional_instructions, split_subtrees, incremental)
+
+
+def start_speculative_generation(job):
+    """
+    With SPECULATIVE_GENERATION, starts generating a freshly fetched job with default options in the background.
+    submit_generation_job hands it to the user if they ask for exactly that, and cancels it otherwise.
+    Returns the generation job, or None if none was started.
+    """
+    retrieved_gemini_api_key = get_gemini_api_key_from_session_or_env()
+    if not SPECULATIVE_GENERATION or not retrieved_gemini_api_key:
+        return None
+    json_path, svg_path, prompt_json_path = job.artifact_path('json'), prompt_svg_path(job), job.artifact_path('prompt_json')
+    generation_job = generation_jobs.submit(
+        lambda: compose_generation_sse(retrieved_gemini_api_key, load_generation_inputs(json_path, svg_path, prompt_json_path)),
+        dedupe_key=generation_dedupe_key(job.job_id), speculative=True
+    )
+    if generation_job is None:
+        metrics.SPECULATIVE_GENERATIONS.labels(result="skipped").inc()
+        print(f"SSE Generator: speculative generation for fetch job {job.job_id} skipped, too many already running.")
+        return None
+    metrics.SPECULATIVE_GENERATIONS.labels(result="started").inc()
+    print(f"SSE Generator: speculative generation job {generation_job.job_id} for fetch job {job.job_id}")
+    session[SPECULATIVE_JOB_SESSION_KEY] = generation_job.job_id
+    return generation_job
+
+
+def cancel_speculative_generation(reason):
+    """Cancels the session's speculative generation job unless it has finished or been claimed."""
+    generation_job = generation_jobs.get(session.pop(SPECULATIVE_JOB_SESSION_KEY, None))
+    if generation_job is not None and generation_jobs.cancel_speculative(generation_job, reason):
+        metrics.SPECULATIVE_GENERATIONS.labels(result="cancelled").inc()
+        print(f"SSE Generator: speculative generation job {generation_job.job_id} cancelled: {reason}.")
+
+
+def claim_speculative_generation(dedupe_key):
+    """
+    The session's speculative generation job, in flight or finished, if it was started for `dedupe_key` and has
+    not failed. Otherwise it is cancelled and None is returned.
+    """
+    generation_job = generation_jobs.get(session.get(SPECULATIVE_JOB_SESSION_KEY))
+    if generation_job is None or dedupe_key is None or generation_job.dedupe_key != dedupe_key or generation_job.has_error:
+        cancel_speculative_generation("generation was requested with other options")
+        return None
+    session.pop(SPECULATIVE_JOB_SESSION_KEY, None)
+    if not generation_jobs.claim(generation_job):
+        return None  # cancelled or claimed by another request meanwhile
+    metrics.SPECULATIVE_GENERATIONS.labels(result="attached").inc()
+    return generation_job
+
+
+def submit_generation_job():
+    """
+    Validates the current request/session and starts a background generation job (see generation_jobs.py).
+    Returns (job, error_message).
+    """
+    clear_saved_compose_output()
 
     retrieved_gemini_api_key = get_gemini_api_key_from_session_or_env() 
     if not retrieved_gemini_api_key:
-        def error_stream():
-            yield f"data: [ERROR] Gemini API Key is not set. Please set it via UI or the {GEMINI_API_KEY_ENV_VAR} environment variable.\n\n"
-            yield f"data: [STREAM_END]\n\n"
-        return Response(error_stream(), mimetype='text/event-stream')
+        return None, f"Gemini API Key is not set. Please set it via UI or the {GEMINI_API_KEY_ENV_VAR} environment variable."
 
-    additional_instructions = request.args.get('additional_instructions', '') 
+    additional_instructions = request.values.get('additional_instructions', '') 
+    split_subtrees = request.values.get('split_subtrees') == '1'
+    force_regenerate = request.values.get('force_regenerate') == '1'
+    incremental = request.values.get('incremental') == '1'
 
-    json_path = session.get('json_file_path')
-    svg_path = session.get('image_file_path') 
+    job = artifact_store.get_job(session.get('job_id'))
+    json_path = job.artifact_path('json') if job else None
+    svg_path = prompt_svg_path(job)
 
     if not json_path or not os.path.exists(json_path):
-        def error_stream():
-            yield "data: [ERROR] Figma JSON data not found in session. Please fetch data first.\n\n"
-            yield "data: [STREAM_END]\n\n"
-        return Response(error_stream(), mimetype='text/event-stream')
-    
-    figma_json_content_str = None
-    figma_svg_content_str = None 
+        return None, "Figma JSON data not found in session. Please fetch data first."
+
+    # Identical requests for the same fetched job attach to the generation already in flight.
+    dedupe_key = None if force_regenerate else generation_dedupe_key(job.job_id, additional_instructions, split_subtrees, incremental)
+    speculative_job = claim_speculative_generation(dedupe_key)
+    if speculative_job is not None:
+        print(f"SSE Generator: attaching to speculative generation job {speculative_job.job_id} for fetch job {job.job_id}")
+        return speculative_job, None
 
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            loaded_json = json.load(f)
-            figma_json_content_str = json.dumps(loaded_json, indent=4) 
+        inputs = load_generation_inputs(json_path, svg_path, job.artifact_path('prompt_json'))
     except Exception as e:
+        return None, f"Error reading JSON file {json_path}: {e}"
+
+    incremental_node = (job.meta.get('file_key'), job.meta.get('node_id')) if incremental else None
+    generation_job = generation_jobs.submit(
+        lambda: compose_generation_sse(retrieved_gemini_api_key, inputs, additional_instructions,
+                                       split_subtrees=split_subtrees, force_regenerate=force_regenerate,
+                                       incremental_node=incremental_node),
+        dedupe_key=dedupe_key
+    )
+    print(f"SSE Generator: generation job {generation_job.job_id} for fetch job {job.job_id}")
+    return generation_job, None
+
+
+@app.route('/stream_compose_generation') 
+def stream_compose_generation():
+    generation_job, error_message = submit_generation_job()
+    if error_message:
         def error_stream():
-            yield f"data: [ERROR] Error reading JSON file {json_path}: {e}\n\n"
-            yield f"data: [STREAM_END]\n\n"
+            yield sse_error(error_message)
+            yield sse_end()
         return Response(error_stream(), mimetype='text/event-stream')
+    return Response(job_events_sse(generation_job), mimetype='text/event-stream', headers=job_stream_headers(generation_job))
 
 
-    if svg_path and os.path.exists(svg_path): 
-        try:
-            with open(svg_path, 'r', encoding='utf-8') as f: 
-                figma_svg_content_str = f.read() 
-        except Exception as e:
-            print(f"Warning: Error reading SVG file {svg_path}: {e}")
+@app.route('/generation_jobs', methods=['POST'])
+def start_generation_job():
+    generation_job, error_message = submit_generation_job()
+    if error_message:
+        return jsonify(status="error", message=error_message), 400
+    return jsonify(status="success", job_id=generation_job.job_id,
+                   events_url=url_for('generation_job_events', job_id=generation_job.job_id)), 202
+
+
+@app.route('/generation_jobs/<job_id>/events')
+def generation_job_events(job_id):
+    generation_job = generation_jobs.get(job_id)
+    if generation_job is None:
+        return Response("Unknown or expired generation job.", status=404, mimetype='text/plain')
+    # EventSource sends Last-Event-ID by itself when it reconnects.
+    last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    return Response(job_events_sse(generation_job, last_event_id), mimetype='text/event-stream',
+                    headers=job_stream_headers(generation_job, last_event_id))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-    custom_kotlin_files = []
-    if os.path.exists(COMMON_CODE_DIR):
-        kotlin_files_pattern = os.path.join(COMMON_CODE_DIR, "*.kt")
-        for kt_file_path in glob.glob(kotlin_files_pattern):
-            try:
-                with open(kt_file_path, 'r', encoding='utf-8') as f_kt:
-                    custom_kotlin_files.append({
-                        "filename": os.path.basename(kt_file_path),
-                        "content": f_kt.read()
-                    })
-            except Exception as e:
-                print(f"Warning: Error reading custom Kotlin file '{kt_file_path}': {e}")
-    
-    return Response(call_gemini_api_sse_generator(
-        retrieved_gemini_api_key, 
-        figma_json_content_str, 
-        figma_svg_content_str,
-        custom_kotlin_files_content=custom_kotlin_files,
-        additional_instructions=additional_instructions 
-    ), mimetype='text/event-stream')
 
 @app.route('/save_generated_code', methods=['POST'])
 def save_generated_code():
@@ -744,10 +1306,13 @@ def save_generated_code():
         data = request.get_json()
         code_to_save = data.get('code')
         if code_to_save is not None:
-            session['compose_code_output'] = code_to_save
+            clear_saved_compose_output()
+            session[COMPOSE_OUTPUT_SESSION_KEY] = result_store.put(code_to_save)
             return jsonify(status="success", message="Code saved to session."), 200
         else:
             return jsonify(status="error", message="No code provided."), 400
+    except ResultTooLargeError as e:
+        return jsonify(status="error", message=str(e)), 413
     except Exception as e:
         print(f"Error in /save_generated_code: {e}")
         return jsonify(status="error", message=str(e)), 500
@@ -771,7 +1336,6 @@ if __name__ == '__main__':
     print(f"Set API tokens via UI or as environment variables: '{FIGMA_TOKEN_ENV_VAR}' and '{GEMINI_API_KEY_ENV_VAR}'.")
     print(f"Optionally, set '{FLASK_PORT_ENV_VAR}' to change the port (default: {DEFAULT_FLASK_PORT}).")
     print(f"Place your custom Kotlin files (ending with .kt) in the '{COMMON_CODE_DIR}/' directory.")
-    print("Ensure 'curl' is installed and in your system PATH.")
     print("Streaming output from Gemini will appear in this console and in the web UI log.") 
     
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,111 @@
+"""Pool of Gemini models, one per (API key, model name), shared by all requests.
+
+genai.configure() sets process-global state. Two concurrent requests with
+different keys could therefore race, and one would run on the other's key.
+Instead, each pooled model is bound to its own GenerativeServiceClient for
+its key. That client is created once and reused with its connection until
+it has been idle for GEMINI_CLIENT_IDLE_SECONDS. A lease covers the whole
+stream, so a client is never closed while a response is still being read.
+Keys are only held by the clients themselves; the pool indexes them by hash.
+"""
+import time
+import hashlib
+import threading
+import contextlib
+
+from metrics import GEMINI_CLIENTS_POOLED, GEMINI_CLIENT_POOL_REQUESTS
+
+# --- Configuration ---
+GEMINI_CLIENT_IDLE_SECONDS = 10 * 60
+GEMINI_CLIENT_POOL_MAX = 64
+
+
+def create_genai_model(genai_module, api_key, model_name):
+    """
+    Builds (model, service_client) with the key bound to the model rather than set globally. This sets
+    GenerativeModel's private _client, so it relies on the google-generativeai version pinned in requirements.txt.
+    """
+    # Ships with google-generativeai (as its google-ai-generativelanguage dependency).
+    from google.ai import generativelanguage as glm
+    model = genai_module.GenerativeModel(model_name)
+    if not hasattr(model, "_client"):
+        raise RuntimeError("google.generativeai.GenerativeModel has no _client to bind a per-key client to; "
+                           "install the google-generativeai version pinned in requirements.txt")
+    # GenerativeModel only falls back to the global default client when _client is unset.
+    service_client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    model._client = service_client
+    return model, service_client
+
+
+class _PooledModel:
+    def __init__(self, model, service_client):
+        self.model = model
+        self.service_client = service_client
+        self.leases = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        transport = getattr(self.service_client, "transport", None)
+        if transport is not None and hasattr(transport, "close"):
+            try:
+                transport.close()
+            except Exception as e:
+                print(f"Gemini client pool: error closing client: {e}")
+
+
+class GeminiClientPool:
+    """Thread-safe pool of configured models keyed by (API key hash, model name), with idle eviction."""
+
+    def __init__(self, factory, idle_seconds=GEMINI_CLIENT_IDLE_SECONDS, max_clients=GEMINI_CLIENT_POOL_MAX):
+        self._factory = factory
+        self.idle_seconds = idle_seconds
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @staticmethod
+    def _key(api_key, model_name):
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest(), model_name
+
+    @contextlib.contextmanager
+    def lease(self, api_key, model_name):
+        """Yields the pooled model for this key and model name; hold the lease until its stream is drained."""
+        key = self._key(api_key, model_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            GEMINI_CLIENT_POOL_REQUESTS.labels(result="hit" if entry else "miss").inc()
+            if entry is None:
+                entry = self._entries[key] = _PooledModel(*self._factory(api_key, model_name))
+            entry.leases += 1
+            closing = self._evict_locked(keep=key)
+        self._close(closing)
+        try:
+            yield entry.model
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                entry.last_used = time.monotonic()
+
+    def _evict_locked(self, keep):
+        """Drops idle entries, then the least recently used unleased ones over max_clients. Returns them for closing."""
+        now = time.monotonic()
+        evicted = [key for key, entry in self._entries.items()
+                   if key != keep and not entry.leases and now - entry.last_used > self.idle_seconds]
+        idle_by_age = sorted((entry.last_used, key) for key, entry in self._entries.items()
+                             if key != keep and not entry.leases and key not in evicted)
+        overflow = len(self._entries) - len(evicted) - self.max_clients
+        evicted.extend(key for _, key in idle_by_age[:max(0, overflow)])
+        closing = [self._entries.pop(key) for key in evicted]
+        GEMINI_CLIENTS_POOLED.set(len(self._entries))
+        return closing
+
+    @staticmethod
+    def _close(entries):
+        for entry in entries:
+            entry.close()
+
+    def close(self):
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+            GEMINI_CLIENTS_POOLED.set(0)
+        self._close(entries)
@@ -0,0 +1,108 @@
+"""Persistent cache of finished generations, replayed over SSE on a hit.
+
+The key is a hash of everything that shapes the model output: the (compacted)
+node JSON, the SVG, the common/*.kt contents, the additional instructions,
+the model name and the generation mode. Outputs are stored zlib-compressed
+in SQLite and evicted least-recently-used once either the entry or byte
+limit is exceeded.
+"""
+import os
+import time
+import zlib
+import hashlib
+import threading
+
+from sqlite_store import connect_sqlite
+from sse import sse_info, sse_end, sse_code_chunks, event_payload, decode_code_chunk, is_control_payload, ERROR_PREFIX, STREAM_END
+
+# --- Configuration ---
+GENERATION_CACHE_PATH_ENV_VAR = "GENERATION_CACHE_PATH"
+DEFAULT_GENERATION_CACHE_PATH = os.path.join(".figma_cache", "generations.sqlite3")
+GENERATION_CACHE_MAX_ENTRIES = 500
+GENERATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def generation_cache_key(figma_json_str, figma_svg_str, custom_kotlin_files_content, additional_instructions, model_name, mode):
+    """SHA-256 over every prompt input; length-prefixed so field boundaries cannot collide."""
+    digest = hashlib.sha256()
+
+    def add(value):
+        data = (value or "").encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+
+    for value in (mode, model_name, figma_json_str, figma_svg_str, additional_instructions):
+        add(value)
+    for file_info in sorted(custom_kotlin_files_content or [], key=lambda info: info['filename']):
+        add(file_info['filename'])
+        add(file_info['content'])
+    return digest.hexdigest()
+
+
+class GenerationCache:
+    """SQLite-backed LRU of generated Kotlin, shared by threads and worker processes."""
+
+    def __init__(self, db_path=None, max_entries=GENERATION_CACHE_MAX_ENTRIES, max_bytes=GENERATION_CACHE_MAX_BYTES):
+        self.db_path = db_path or os.environ.get(GENERATION_CACHE_PATH_ENV_VAR) or DEFAULT_GENERATION_CACHE_PATH
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with connect_sqlite(self.db_path) as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY, code BLOB, size INTEGER, created_at REAL, last_access REAL)""")
+
+    def get(self, key):
+        with connect_sqlite(self.db_path) as db:
+            row = db.execute("SELECT code FROM generations WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE generations SET last_access=? WHERE key=?", (time.time(), key))
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, key, code):
+        compressed = zlib.compress(code.encode('utf-8'))
+        now = time.time()
+        with connect_sqlite(self.db_path) as db:
+            db.execute("INSERT OR REPLACE INTO generations (key, code, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                       (key, compressed, len(compressed), now, now))
+        self.evict()
+
+    def evict(self):
+        with self._evict_lock, connect_sqlite(self.db_path) as db:
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+            if count <= self.max_entries and total <= self.max_bytes:
+                return
+            for key, size in db.execute("SELECT key, size FROM generations ORDER BY last_access ASC").fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM generations WHERE key=?", (key,))
+                count -= 1
+                total -= size
+
+
+def replay_sse(code):
+    """Replays a cached generation using the same event protocol as a live one."""
+    yield sse_info(f"Served from generation cache ({len(code):,} chars). Use 'Force regenerate' to call Gemini again.")
+    yield from sse_code_chunks(code)
+    yield sse_end()
+
+
+def record_sse(sse_generator, on_complete):
+    """Passes SSE events through untouched and calls on_complete(code) if the stream ends without an error."""
+    parts, failed = [], False
+    for event in sse_generator:
+        payload = event_payload(event)
+        if payload.startswith(ERROR_PREFIX):
+            failed = True
+        elif payload == STREAM_END:
+            if not failed and parts:
+                try:
+                    on_complete("".join(parts))
+                except Exception as e:
+                    print(f"Generation cache: could not store result: {e}")
+        elif not is_control_payload(payload):
+            parts.append(decode_code_chunk(payload))
+        yield event
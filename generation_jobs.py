@@ -0,0 +1,309 @@
+"""Server-side generation jobs that outlive the SSE connection that started them.
+
+A generation runs on a bounded worker pool and appends its SSE events to a
+per-job ring buffer with sequential event ids. Any number of viewers can
+stream a job; a viewer that reconnects sends `Last-Event-ID` and resumes
+after that event without the model being called again. If the events it
+missed have already fallen out of the ring buffer, it gets a [RESYNC] event
+followed by all code generated so far, then continues live. Viewers take
+events in batches and are written to according to an EmissionPolicy (see
+sse.py): chunks are coalesced, and heartbeats are sent while the stream is idle.
+
+A job can also be started speculatively, before anyone has asked for it
+(see figma_to_jetpack.start_speculative_generation). At most
+GENERATION_JOB_MAX_SPECULATIVE such jobs run at once, and one that nobody
+claims can be cancelled.
+
+Jobs live in process memory, so with several gunicorn workers a reconnect
+must reach the same worker (e.g. a single worker with threads, or sticky
+routing).
+"""
+import time
+import uuid
+import asyncio
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import GENERATION_JOBS_QUEUED, GENERATIONS_IN_FLIGHT, GENERATION_JOB_SECONDS, SSE_VIEWERS
+from sse import (sse_info, sse_error, sse_end, sse_resync, sse_code_chunks, event_payload, decode_code_chunk, is_control_payload,
+                 coalesce_events, EmissionPolicy, STREAM_END, HEARTBEAT, ERROR_PREFIX)
+
+# --- Configuration ---
+GENERATION_JOB_WORKERS = 8
+GENERATION_JOB_BUFFER_EVENTS = 2048
+GENERATION_JOB_RETENTION_SECONDS = 10 * 60
+# Speculative jobs nobody has claimed yet; more are simply not started, so they never crowd out requested ones.
+GENERATION_JOB_MAX_SPECULATIVE = 2
+SSE_RETRY_MILLISECONDS = 2000
+# Set on responses that stream a job, so an async server can take the stream over (see asgi_app.py).
+GENERATION_JOB_HEADER = "X-Generation-Job"
+GENERATION_JOB_RESUME_HEADER = "X-Generation-Job-Resume-From"
+
+
+class GenerationJob:
+    """One generation's event log: a ring buffer of (event_id, event) plus the code seen so far."""
+
+    def __init__(self, job_id, dedupe_key=None, buffer_events=GENERATION_JOB_BUFFER_EVENTS, speculative=False):
+        self.job_id = job_id
+        self.dedupe_key = dedupe_key
+        # Started before anyone asked for it and not claimed yet.
+        self.speculative = speculative
+        self.created_at = time.time()
+        self.finished_at = None
+        self.has_error = False
+        self._events = collections.deque(maxlen=buffer_events)
+        self._last_id = 0
+        self._code_parts = []
+        self._code_event_id = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def append(self, *events):
+        """Appends `events` as one step. Returns False, appending nothing, once the job has finished."""
+        with self._cond:
+            if self.finished:
+                return False
+            for event in events:
+                self._append_locked(event)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, wakeup in waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # the viewer's event loop has already shut down
+        return True
+
+    def _append_locked(self, event):
+        payload = event_payload(event)
+        self._last_id += 1
+        self._events.append((self._last_id, event))
+        if not is_control_payload(payload):
+            self._code_parts.append(decode_code_chunk(payload))
+            self._code_event_id = self._last_id
+        elif payload.startswith(ERROR_PREFIX):
+            self.has_error = True
+        if payload == STREAM_END:
+            self.finished_at = time.time()
+
+    def cancel(self, reason):
+        """Ends an unfinished job; run() stops at the generator's next event. Returns False if it had already finished."""
+        return self.append(sse_info(f"Generation cancelled: {reason}."), sse_end())
+
+    def run(self, sse_generator):
+        """Drains `sse_generator` into the buffer. Always ends the job with [STREAM_END]."""
+        try:
+            for event in sse_generator:
+                if not self.append(event):
+                    # Cancelled: closing the generator also closes its model stream.
+                    sse_generator.close()
+                    return
+        except Exception as e:
+            print(f"Generation job {self.job_id}: failed: {e}")
+            self.append(sse_error(f"Generation failed: {e}"), sse_end())
+            return
+        self.append(sse_end())
+
+    def _take(self, next_id):
+        """Called with the lock held: (resync, pending, finished) for a viewer that wants events from next_id on."""
+        resync = None
+        first_id = self._events[0][0] if self._events else self._last_id + 1
+        if next_id < first_id:
+            # The viewer missed events that were evicted; send the code so far instead.
+            resync = ("".join(self._code_parts), self._code_event_id)
+            next_id = max(self._code_event_id + 1, first_id)
+        pending = [(event_id, event) for event_id, event in self._events if event_id >= next_id]
+        return resync, pending, self.finished
+
+    @staticmethod
+    def _expand(resync, pending):
+        if resync is not None:
+            code, event_id = resync
+            yield event_id, sse_resync()
+            for chunk in sse_code_chunks(code):
+                yield event_id, chunk
+        yield from pending
+
+    def batches_after(self, last_event_id=0, window_seconds=0.0, heartbeat_seconds=None):
+        """
+        Yields lists of (event_id, event) covering every event after `last_event_id`, blocking until the job
+        finishes. Each list holds everything that arrived since the previous one; after a list the caller waits
+        `window_seconds` so events accumulate. An empty list means nothing arrived for `heartbeat_seconds`.
+        """
+        next_id = last_event_id + 1
+        while True:
+            with self._cond:
+                ready = self._cond.wait_for(lambda: next_id <= self._last_id or self.finished, heartbeat_seconds)
+                if ready:
+                    resync, pending, done = self._take(next_id)
+            if not ready:
+                yield []
+                continue
+            batch = list(self._expand(resync, pending))
+            if batch:
+                next_id = batch[-1][0] + 1
+                yield batch
+            if done:
+                return
+            if window_seconds > 0:
+                time.sleep(window_seconds)
+
+    def events_after(self, last_event_id=0):
+        """Yields (event_id, event) for every event after `last_event_id`, blocking until the job finishes."""
+        for batch in self.batches_after(last_event_id):
+            yield from batch
+
+    async def abatches_after(self, last_event_id=0, window_seconds=0.0, heartbeat_seconds=None):
+        """Async version of batches_after: waiting viewers hold no thread (see asgi_app.py)."""
+        loop = asyncio.get_running_loop()
+        next_id = last_event_id + 1
+        while True:
+            wakeup = None
+            with self._cond:
+                if next_id > self._last_id and not self.finished:
+                    wakeup = asyncio.Event()
+                    self._async_waiters.append((loop, wakeup))
+                else:
+                    resync, pending, done = self._take(next_id)
+            if wakeup is not None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield []
+                continue
+            batch = list(self._expand(resync, pending))
+            if batch:
+                next_id = batch[-1][0] + 1
+                yield batch
+            if done:
+                return
+            if window_seconds > 0:
+                await asyncio.sleep(window_seconds)
+
+
+class GenerationJobManager:
+    """Bounded pool of generation jobs, looked up by id and optionally shared by dedupe key."""
+
+    def __init__(self, max_workers=GENERATION_JOB_WORKERS, buffer_events=GENERATION_JOB_BUFFER_EVENTS,
+                 retention_seconds=GENERATION_JOB_RETENTION_SECONDS, max_speculative=GENERATION_JOB_MAX_SPECULATIVE):
+        self.buffer_events = buffer_events
+        self.retention_seconds = retention_seconds
+        self.max_speculative = max_speculative
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active_by_key = {}
+
+    def submit(self, sse_generator_factory, dedupe_key=None, speculative=False):
+        """
+        Starts sse_generator_factory() on the pool and returns its GenerationJob. If a job with the
+        same dedupe_key is still running, returns that job instead, so its viewers share one model call.
+        A `speculative` job is not started (None is returned) while max_speculative unclaimed ones are running.
+        """
+        with self._lock:
+            self._purge_expired()
+            if dedupe_key is not None:
+                active = self._jobs.get(self._active_by_key.get(dedupe_key))
+                if active is not None and not active.finished:
+                    return active
+            if speculative and self._running_speculative() >= self.max_speculative:
+                return None
+            job = GenerationJob(uuid.uuid4().hex, dedupe_key, self.buffer_events, speculative)
+            self._jobs[job.job_id] = job
+            if dedupe_key is not None:
+                self._active_by_key[dedupe_key] = job.job_id
+        GENERATION_JOBS_QUEUED.inc()
+        self._executor.submit(self._run, job, sse_generator_factory)
+        return job
+
+    def claim(self, job):
+        """Marks a speculative job as requested, so it no longer counts or can be cancelled as one. False if it cannot be."""
+        with self._lock:
+            if not job.speculative:
+                return False
+            job.speculative = False
+            return True
+
+    def cancel_speculative(self, job, reason):
+        """Cancels `job` if it is still speculative and unfinished; returns whether it was cancelled."""
+        with self._lock:
+            if not job.speculative or not job.cancel(reason):
+                return False
+            job.speculative = False  # so it cannot be claimed either
+            return True
+
+    def _running_speculative(self):
+        return sum(1 for job in self._jobs.values() if job.speculative and not job.finished)
+
+    def _run(self, job, sse_generator_factory):
+        GENERATION_JOBS_QUEUED.dec()
+        if job.finished:
+            return  # cancelled while queued
+        GENERATIONS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            job.run(sse_generator_factory())
+        except Exception as e:
+            print(f"Generation job {job.job_id}: could not start: {e}")
+            job.append(sse_error(f"Generation failed: {e}"), sse_end())
+        finally:
+            GENERATIONS_IN_FLIGHT.dec()
+            GENERATION_JOB_SECONDS.observe(time.perf_counter() - started)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _purge_expired(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > self.retention_seconds:
+                del self._jobs[job_id]
+                if self._active_by_key.get(job.dedupe_key) == job_id:
+                    del self._active_by_key[job.dedupe_key]
+
+
+def _sse_frames(batch, policy):
+    """SSE frames for one batch of job events: coalesced, with ids so EventSource can resume; a heartbeat if empty."""
+    if not batch:
+        return HEARTBEAT
+    return "".join(f"id: {event_id}\n{event}" for event_id, event in coalesce_events(batch, policy.max_bytes))
+
+
+def job_events_sse(job, last_event_id=0, policy=None):
+    """SSE stream of a job from `last_event_id` on, written according to `policy` (an EmissionPolicy)."""
+    policy = policy or EmissionPolicy()
+    yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n"
+    SSE_VIEWERS.inc()
+    try:
+        for batch in job.batches_after(last_event_id, policy.window_seconds, policy.heartbeat_timeout):
+            yield _sse_frames(batch, policy)
+    finally:
+        SSE_VIEWERS.dec()
+
+
+async def job_events_sse_async(job, last_event_id=0, policy=None):
+    policy = policy or EmissionPolicy()
+    yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n"
+    SSE_VIEWERS.inc()
+    try:
+        async for batch in job.abatches_after(last_event_id, policy.window_seconds, policy.heartbeat_timeout):
+            yield _sse_frames(batch, policy)
+    finally:
+        SSE_VIEWERS.dec()
+
+
+def job_stream_headers(job, last_event_id=0):
+    return {GENERATION_JOB_HEADER: job.job_id, GENERATION_JOB_RESUME_HEADER: str(last_event_id)}
+
+
+def parse_last_event_id(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
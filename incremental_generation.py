@@ -0,0 +1,202 @@
+"""Incremental regeneration: regenerate only the subtrees of a frame that changed.
+
+After an incremental run, its split plan is kept as a baseline per
+(file_key, node_id) (see parallel_generation.py). For each top-level
+subtree the baseline stores the generated code and a hash of every node's
+own properties, keyed by node id. For the parent it stores the code and a
+hash of the skeleton. On the next run the new fetch is diffed against the
+baseline:
+  - A subtree whose node hashes and composable name are unchanged reuses
+    its previous code. Boxes are hashed relative to the subtree root, so a
+    subtree that only moved is reused and only the parent is regenerated.
+  - Changed or new subtrees are regenerated.
+  - The parent is regenerated only if the skeleton changed (children
+    added, removed, renamed or re-laid out, or the root's own properties).
+The units are then stitched as usual, so a small edit costs one subtree
+prompt instead of the whole screen. A baseline only applies under the same
+instructions, common/ code, model and component/style tables; otherwise
+every unit is regenerated.
+"""
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+
+from sqlite_store import connect_sqlite
+from generation_cache import generation_cache_key
+from parallel_generation import root_document
+
+# --- Configuration ---
+GENERATION_BASELINE_PATH_ENV_VAR = "GENERATION_BASELINE_PATH"
+DEFAULT_GENERATION_BASELINE_PATH = os.path.join(".figma_cache", "baselines.sqlite3")
+GENERATION_BASELINE_MAX_ENTRIES = 500
+NODE_HASH_CHARS = 16
+SHARED_TABLE_KEYS = ("components", "componentSets", "styles")
+BOX_KEYS = ("absoluteBoundingBox", "absoluteRenderBounds")
+BASELINE_FORMAT_VERSION = 1
+
+
+def _hash(value):
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:NODE_HASH_CHARS]
+
+
+def _relative_box(box, origin):
+    if not isinstance(box, dict) or not isinstance(box.get("x"), (int, float)) or not isinstance(box.get("y"), (int, float)):
+        return box
+    return dict(box, x=box["x"] - origin[0], y=box["y"] - origin[1])
+
+
+def node_property_hashes(node, hashes=None, origin=None):
+    """
+    {node id: hash of the node's own properties} for a subtree; children are hashed as nodes of their own.
+    Bounding boxes are taken relative to the subtree root, so moving a whole subtree does not change its hashes.
+    """
+    hashes = {} if hashes is None else hashes
+    if not isinstance(node, dict):
+        return hashes
+    if origin is None:
+        box = node.get("absoluteBoundingBox") or {}
+        origin = (box.get("x") or 0, box.get("y") or 0)
+    properties = {key: value for key, value in node.items() if key != "children"}
+    for key in BOX_KEYS:
+        if key in properties:
+            properties[key] = _relative_box(properties[key], origin)
+    # Child order is part of the parent's layout, so it belongs to the parent's hash.
+    properties["children"] = [child.get("id") for child in node.get("children") or [] if isinstance(child, dict)]
+    hashes[str(node.get("id"))] = _hash(properties)
+    for child in node.get("children") or []:
+        node_property_hashes(child, hashes, origin)
+    return hashes
+
+
+def _root_entry(plan):
+    _, entry = root_document(plan.parent.node_json)
+    return entry or {}
+
+
+def skeleton_hash(plan):
+    return _hash(_root_entry(plan).get("document"))
+
+
+def shared_tables_hash(plan):
+    entry = _root_entry(plan)
+    return _hash({key: entry.get(key) for key in SHARED_TABLE_KEYS})
+
+
+def baseline_context_key(custom_kotlin_files_content, additional_instructions, model_name):
+    """Everything besides the node JSON that shapes generated code; a baseline only applies under the same context."""
+    return generation_cache_key(None, None, custom_kotlin_files_content, additional_instructions, model_name, "baseline")
+
+
+def plan_baseline(plan, context_key):
+    """The baseline to store once every unit of `plan` has its code."""
+    return {
+        "format_version": BASELINE_FORMAT_VERSION,
+        "context": context_key,
+        "tables": shared_tables_hash(plan),
+        "parent": {"name": plan.parent.name, "skeleton": skeleton_hash(plan), "code": plan.parent.code},
+        "units": [{"node_id": unit.node_id, "name": unit.name, "code": unit.code,
+                   "node_hashes": node_property_hashes(unit.node_json.get("document"))} for unit in plan.subtrees],
+    }
+
+
+class IncrementalDiff:
+    """What an incremental run reuses and regenerates, for the [INFO] summary."""
+
+    def __init__(self):
+        self.reused = []
+        self.regenerated = []  # (composable name, reason)
+        self.removed = []
+        self.parent_reused = False
+
+    def summary(self):
+        changes = "; ".join(f"{name}: {reason}" for name, reason in self.regenerated) or "no subtree changed"
+        removed = f", {len(self.removed)} removed ({', '.join(self.removed)})" if self.removed else ""
+        parent = "reused" if self.parent_reused else "regenerated"
+        return (f"Incremental: regenerating {len(self.regenerated)} of {len(self.regenerated) + len(self.reused)} "
+                f"subtree(s) ({changes}){removed}; parent {parent}.")
+
+
+def _describe_change(old_hashes, new_hashes):
+    added = len(new_hashes.keys() - old_hashes.keys())
+    removed = len(old_hashes.keys() - new_hashes.keys())
+    changed = sum(1 for node_id in new_hashes.keys() & old_hashes.keys() if new_hashes[node_id] != old_hashes[node_id])
+    parts = [f"{count} node(s) {label}" for count, label in ((changed, "changed"), (added, "added"), (removed, "removed")) if count]
+    return ", ".join(parts) or "renamed"
+
+
+def apply_baseline(plan, baseline, context_key):
+    """
+    Fills in the code of every unit of `plan` that is unchanged since `baseline` and marks it reused.
+    Returns an IncrementalDiff, or None if the baseline does not apply (so every unit is generated).
+    """
+    if not baseline or baseline.get("format_version") != BASELINE_FORMAT_VERSION or \
+            baseline.get("context") != context_key or baseline.get("tables") != shared_tables_hash(plan):
+        return None
+    diff = IncrementalDiff()
+    old_units = {unit["node_id"]: unit for unit in baseline["units"]}
+    for unit in plan.subtrees:
+        new_hashes = node_property_hashes(unit.node_json.get("document"))
+        old = old_units.pop(unit.node_id, None)
+        if old is None:
+            diff.regenerated.append((unit.name, "new"))
+        elif old["name"] == unit.name and old["node_hashes"] == new_hashes:
+            unit.code = old["code"]
+            unit.reused = True
+            diff.reused.append(unit.name)
+        else:
+            diff.regenerated.append((unit.name, _describe_change(old["node_hashes"], new_hashes)))
+    diff.removed = [unit["name"] for unit in old_units.values()]
+    parent = baseline["parent"]
+    if parent["name"] == plan.parent.name and parent["skeleton"] == skeleton_hash(plan):
+        plan.parent.code = parent["code"]
+        plan.parent.reused = True
+        diff.parent_reused = True
+    return diff
+
+
+class BaselineStore:
+    """The latest incremental baseline per (file_key, node_id), zlib-compressed JSON in SQLite, evicted LRU."""
+
+    def __init__(self, db_path=None, max_entries=GENERATION_BASELINE_MAX_ENTRIES):
+        self.db_path = db_path or os.environ.get(GENERATION_BASELINE_PATH_ENV_VAR) or DEFAULT_GENERATION_BASELINE_PATH
+        self.max_entries = max_entries
+        self._evict_lock = threading.Lock()
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with connect_sqlite(self.db_path) as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS baselines (
+                file_key TEXT, node_id TEXT, baseline BLOB, last_access REAL, PRIMARY KEY (file_key, node_id))""")
+
+    @staticmethod
+    def _node_key(node_id):
+        # Node ids appear as '1-2' in URLs and '1:2' in the API.
+        return node_id.replace("-", ":")
+
+    def get(self, file_key, node_id):
+        with connect_sqlite(self.db_path) as db:
+            row = db.execute("SELECT baseline FROM baselines WHERE file_key=? AND node_id=?",
+                             (file_key, self._node_key(node_id))).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE baselines SET last_access=? WHERE file_key=? AND node_id=?",
+                       (time.time(), file_key, self._node_key(node_id)))
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def put(self, file_key, node_id, baseline):
+        data = zlib.compress(json.dumps(baseline, separators=(',', ':')).encode('utf-8'))
+        with connect_sqlite(self.db_path) as db:
+            db.execute("INSERT OR REPLACE INTO baselines (file_key, node_id, baseline, last_access) VALUES (?, ?, ?, ?)",
+                       (file_key, self._node_key(node_id), data, time.time()))
+        self.evict()
+
+    def evict(self):
+        with self._evict_lock, connect_sqlite(self.db_path) as db:
+            count = db.execute("SELECT COUNT(*) FROM baselines").fetchone()[0]
+            if count > self.max_entries:
+                db.execute("DELETE FROM baselines WHERE rowid IN (SELECT rowid FROM baselines ORDER BY last_access ASC LIMIT ?)",
+                           (count - self.max_entries,))
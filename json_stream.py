@@ -0,0 +1,243 @@
+"""Incremental JSON parsing, for documents too large to hold more than once.
+
+iter_events turns an iterable of byte chunks into a flat stream of parse
+events. Only the current chunk and the token being read are ever in memory:
+  (START_MAP, None) (KEY, name) ... (END_MAP, None)
+  (START_ARRAY, None) ... (END_ARRAY, None)
+  (VALUE, scalar)
+Strings go through the json module's C scanner, and numbers are parsed the
+way json.loads parses them, so a value rebuilt from events equals the
+json.loads result, and write_value reproduces json.dumps(value,
+separators=(',', ':')).
+
+Consumers take the events iterator plus the first event of a value, which
+they have already pulled: build_value keeps the value, skip_value discards
+it, and write_value re-serializes it compactly without building it
+(JsonWriter does the same for events fed to it one at a time).
+"""
+import re
+import json
+import math
+import codecs
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
+
+START_MAP = "start_map"
+END_MAP = "end_map"
+START_ARRAY = "start_array"
+END_ARRAY = "end_array"
+KEY = "key"
+VALUE = "value"
+
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?")
+_LITERALS = (("true", True), ("false", False), ("null", None))
+# What may follow a number or literal; anything else may be the rest of it, still in the next chunk.
+_TOKEN_DELIMITERS = " \t\n\r,]}"
+
+# What may come next: a value, a key, or the separator after one.
+_EXPECT_VALUE = "value"
+_EXPECT_VALUE_OR_END = "value or ']'"
+_EXPECT_KEY = "key"
+_EXPECT_KEY_OR_END = "key or '}'"
+_EXPECT_COLON = "':'"
+_EXPECT_COMMA_OR_END = "',' or a closing bracket"
+_EXPECT_NOTHING = "end of data"
+
+
+def iter_events(chunks):
+    """Yields (event, value) pairs for one JSON document read from byte chunks. Raises json.JSONDecodeError."""
+    chunks = iter(chunks)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    stack = []  # START_MAP / START_ARRAY of each open container
+    expect = _EXPECT_VALUE
+
+    def refill():
+        """Drops what has been consumed and appends the next chunk."""
+        nonlocal buf, pos, eof
+        chunk = next(chunks, None)
+        eof = chunk is None
+        buf, pos = buf[pos:] + decoder.decode(b"" if eof else chunk, eof), 0
+
+    def error(message):
+        return json.JSONDecodeError(f"{message} (expecting {expect})", buf, pos)
+
+    while True:
+        pos = _WHITESPACE_RE.match(buf, pos).end()
+        if pos >= len(buf):
+            if eof:
+                if expect != _EXPECT_NOTHING:
+                    raise error("Unexpected end of data")
+                return
+            refill()
+            continue
+        char = buf[pos]
+
+        if expect == _EXPECT_NOTHING:
+            raise error("Extra data")
+        if expect == _EXPECT_COLON:
+            if char != ":":
+                raise error("Unexpected character")
+            pos += 1
+            expect = _EXPECT_VALUE
+            continue
+        if expect == _EXPECT_COMMA_OR_END:
+            if char == ",":
+                pos += 1
+                expect = _EXPECT_KEY if stack[-1] == START_MAP else _EXPECT_VALUE
+                continue
+            if char not in "]}" or (char == "}") != (stack[-1] == START_MAP):
+                raise error("Unexpected character")
+        if char in "]}":
+            closes_map = char == "}"
+            if not stack or (closes_map and expect not in (_EXPECT_KEY_OR_END, _EXPECT_COMMA_OR_END)) or \
+                    (not closes_map and expect not in (_EXPECT_VALUE_OR_END, _EXPECT_COMMA_OR_END)) or \
+                    (stack[-1] == START_MAP) != closes_map:
+                raise error("Unexpected closing bracket")
+            stack.pop()
+            pos += 1
+            expect = _EXPECT_COMMA_OR_END if stack else _EXPECT_NOTHING
+            yield (END_MAP if closes_map else END_ARRAY), None
+            continue
+
+        if char == '"':
+            try:
+                text, end = scanstring(buf, pos + 1, True)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The string (or an escape in it) continues in the next chunk.
+                refill()
+                continue
+            pos = end
+            if expect in (_EXPECT_KEY, _EXPECT_KEY_OR_END):
+                expect = _EXPECT_COLON
+                yield KEY, text
+                continue
+            if expect not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_END):
+                raise error("Unexpected string")
+            expect = _EXPECT_COMMA_OR_END if stack else _EXPECT_NOTHING
+            yield VALUE, text
+            continue
+
+        if expect not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_END):
+            raise error("Unexpected character")
+        if char in "{[":
+            pos += 1
+            stack.append(START_MAP if char == "{" else START_ARRAY)
+            expect = _EXPECT_KEY_OR_END if char == "{" else _EXPECT_VALUE_OR_END
+            yield stack[-1], None
+            continue
+
+        if char in "-0123456789tfn":
+            # A token that touches the end of the buffer may continue in the next chunk.
+            match = _NUMBER_RE.match(buf, pos) if char not in "tfn" else None
+            literal = None if match else next(((text, value) for text, value in _LITERALS if buf.startswith(text, pos)), None)
+            end = match.end() if match else (pos + len(literal[0]) if literal else len(buf))
+            if not eof and (end >= len(buf) or buf[end] not in _TOKEN_DELIMITERS):
+                refill()
+                continue
+            if match:
+                number = match.group()
+                value = float(number) if match.group(1) or match.group(2) else int(number)
+            elif literal:
+                value = literal[1]
+            else:
+                raise error("Invalid literal")
+            pos = end
+            expect = _EXPECT_COMMA_OR_END if stack else _EXPECT_NOTHING
+            yield VALUE, value
+            continue
+        raise error("Unexpected character")
+
+
+def build_value(events, event):
+    """The value that starts with `event`, built from the following events."""
+    kind, value = event
+    if kind == VALUE:
+        return value
+    if kind == START_MAP:
+        result = {}
+        for kind, key in events:
+            if kind == END_MAP:
+                return result
+            result[key] = build_value(events, next(events))
+    items = []
+    for event in events:
+        if event[0] == END_ARRAY:
+            return items
+        items.append(build_value(events, event))
+    raise ValueError("Truncated event stream")
+
+
+def skip_value(events, event):
+    """Consumes the events of the value that starts with `event`."""
+    if event[0] == VALUE:
+        return
+    depth = 1
+    for kind, _ in events:
+        if kind in (START_MAP, START_ARRAY):
+            depth += 1
+        elif kind in (END_MAP, END_ARRAY):
+            depth -= 1
+            if depth == 0:
+                return
+
+
+_SCALAR_TEXT = {True: "true", False: "false", None: "null"}
+
+
+def _scalar_json(value):
+    """json.dumps(value) for a scalar, without its per-call overhead."""
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None or isinstance(value, bool):
+        return _SCALAR_TEXT[value]
+    if isinstance(value, int):
+        return int.__repr__(value)
+    return float.__repr__(value) if math.isfinite(value) else json.dumps(value)
+
+
+class JsonWriter:
+    """Re-serializes events as compact JSON (json.dumps with separators=(',', ':')) as they are fed in."""
+
+    def __init__(self, write):
+        self.write = write
+        # Per open container: whether its next member needs a leading comma.
+        self._needs_comma = []
+        self._after_key = False
+
+    @property
+    def depth(self):
+        return len(self._needs_comma)
+
+    def feed(self, event):
+        kind, value = event
+        if kind in (END_MAP, END_ARRAY):
+            self._needs_comma.pop()
+            self.write("}" if kind == END_MAP else "]")
+            return
+        if kind == KEY:
+            self.write(("," if self._needs_comma[-1] else "") + encode_basestring_ascii(value) + ":")
+            self._needs_comma[-1] = True
+            self._after_key = True
+            return
+        if self._needs_comma and not self._after_key:
+            if self._needs_comma[-1]:
+                self.write(",")
+            self._needs_comma[-1] = True
+        self._after_key = False
+        if kind == VALUE:
+            self.write(_scalar_json(value))
+        else:
+            self.write("{" if kind == START_MAP else "[")
+            self._needs_comma.append(False)
+
+
+def write_value(events, event, write):
+    """Writes the value that starts with `event` as compact JSON without building it."""
+    writer = JsonWriter(write)
+    writer.feed(event)
+    while writer.depth:
+        writer.feed(next(events))
@@ -0,0 +1,330 @@
+"""In-process, change-aware index of the common/ Kotlin design-system files.
+
+Files are re-read and re-parsed only when their mtime or size changes. Each
+file yields color, typography, dimension and composable symbols. For a given
+Figma node, prompt_files() picks only the symbols whose values or names match
+what the node actually uses. When nothing can be matched it falls back to
+pasting the whole files, as before.
+"""
+import os
+import re
+import glob
+import threading
+
+# --- Configuration ---
+COLOR_CHANNEL_TOLERANCE = 1
+DIMENSION_TOLERANCE = 0.01
+
+SYMBOL_COLOR = "color"
+SYMBOL_TYPOGRAPHY = "typography"
+SYMBOL_DIMENSION = "dimension"
+SYMBOL_COMPOSABLE = "composable"
+
+_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)", re.MULTILINE)
+_OBJECT_RE = re.compile(r"^\s*(?:(?:private|internal|public|data)\s+)*object\s+(\w+)")
+_VAL_RE = re.compile(r"^\s*(?:(?:private|internal|public|const)\s+)*val\s+(\w+)\s*(?::\s*[\w.<>?]+\s*)?=\s*(.+)$")
+_COMPOSABLE_FUN_RE = re.compile(r"^\s*(?:(?:private|internal|public|inline)\s+)*fun\s+(\w+)\s*\(")
+_HEX_COLOR_RE = re.compile(r"Color\(\s*0[xX]([0-9A-Fa-f]{6,8})\s*\)")
+_INT_COLOR_RE = re.compile(r"Color\(\s*(\d{1,3})\s*,\s*(\d{1,3})\s*,\s*(\d{1,3})\s*(?:,\s*(\d{1,3})\s*)?\)")
+_DIMENSION_RE = re.compile(r"^(-?\d+(?:\.\d+)?)f?\s*\.\s*(dp|sp)\b")
+_FONT_SIZE_RE = re.compile(r"fontSize\s*=\s*(\d+(?:\.\d+)?)\s*\.sp")
+_FONT_WEIGHT_NAMED_RE = re.compile(r"fontWeight\s*=\s*FontWeight\.(\w+)")
+_FONT_WEIGHT_NUM_RE = re.compile(r"fontWeight\s*=\s*FontWeight\(\s*(\d+)\s*\)")
+_FONT_FAMILY_RE = re.compile(r"fontFamily\s*=\s*([\w.]+)")
+
+_FONT_WEIGHT_NAMES = {
+    "Thin": 100, "ExtraLight": 200, "Light": 300, "Normal": 400, "Medium": 500,
+    "SemiBold": 600, "Bold": 700, "ExtraBold": 800, "Black": 900,
+}
+
+
+def _balanced_expression(lines, start_index, start_text):
+    """Returns the text of an expression that may span lines until its parentheses balance."""
+    text = start_text
+    depth = text.count("(") - text.count(")")
+    index = start_index
+    while depth > 0 and index + 1 < len(lines):
+        index += 1
+        text += "\n" + lines[index]
+        depth += lines[index].count("(") - lines[index].count(")")
+    return text, index
+
+
+def _parameter_list(text):
+    """Cuts a function header down to `fun Name(...)`, keeping default values inside the parentheses."""
+    start = text.find("(")
+    depth = 0
+    for position in range(start, len(text)):
+        depth += {"(": 1, ")": -1}.get(text[position], 0)
+        if depth == 0:
+            return text[:position + 1].strip()
+    return text.strip()
+
+
+def _parse_color(expression):
+    match = _HEX_COLOR_RE.search(expression)
+    if match:
+        hex_value = match.group(1).upper()
+        return hex_value if len(hex_value) == 8 else "FF" + hex_value
+    match = _INT_COLOR_RE.search(expression)
+    if match:
+        r, g, b = (int(match.group(i)) for i in (1, 2, 3))
+        a = int(match.group(4)) if match.group(4) else 255
+        return f"{a:02X}{r:02X}{g:02X}{b:02X}"
+    return None
+
+
+def _parse_typography(expression):
+    style = {}
+    match = _FONT_SIZE_RE.search(expression)
+    if match:
+        style["fontSize"] = float(match.group(1))
+    match = _FONT_WEIGHT_NUM_RE.search(expression)
+    if match:
+        style["fontWeight"] = int(match.group(1))
+    else:
+        match = _FONT_WEIGHT_NAMED_RE.search(expression)
+        if match and match.group(1) in _FONT_WEIGHT_NAMES:
+            style["fontWeight"] = _FONT_WEIGHT_NAMES[match.group(1)]
+    match = _FONT_FAMILY_RE.search(expression)
+    if match:
+        style["fontFamily"] = match.group(1)
+    return style
+
+
+def parse_kotlin_symbols(content, filename):
+    """Extracts color/typography/dimension/composable definitions from one Kotlin file."""
+    symbols = []
+    lines = content.splitlines()
+    object_stack = []  # (name, brace depth at which the object body opened)
+    depth = 0
+    pending_composable = False
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        stripped = line.strip()
+        qualifier = ".".join(name for name, _ in object_stack)
+
+        object_match = _OBJECT_RE.match(line)
+        val_match = _VAL_RE.match(line)
+        fun_match = _COMPOSABLE_FUN_RE.match(line)
+        end_index = index
+
+        if stripped.startswith("@Composable"):
+            pending_composable = True
+            fun_match = _COMPOSABLE_FUN_RE.match(stripped[len("@Composable"):])
+        if object_match and "{" in line:
+            object_stack.append((object_match.group(1), depth + 1))
+        elif val_match and depth == (object_stack[-1][1] if object_stack else 0):
+            name, expression = val_match.groups()
+            expression, end_index = _balanced_expression(lines, index, expression)
+            qualified = f"{qualifier}.{name}" if qualifier else name
+            snippet = "\n".join(lines[index:end_index + 1])
+            color = _parse_color(expression) if "Color(" in expression else None
+            dimension = _DIMENSION_RE.match(expression.strip())
+            if color:
+                symbols.append({"kind": SYMBOL_COLOR, "name": qualified, "value": color, "file": filename, "snippet": snippet})
+            elif "TextStyle(" in expression:
+                symbols.append({"kind": SYMBOL_TYPOGRAPHY, "name": qualified, "value": _parse_typography(expression),
+                                "file": filename, "snippet": snippet})
+            elif dimension:
+                symbols.append({"kind": SYMBOL_DIMENSION, "name": qualified,
+                                "value": {"amount": float(dimension.group(1)), "unit": dimension.group(2)},
+                                "file": filename, "snippet": snippet})
+        if fun_match and pending_composable and "private " not in line:
+            signature = _parameter_list(_balanced_expression(lines, index, line)[0])
+            qualified = f"{qualifier}.{fun_match.group(1)}" if qualifier else fun_match.group(1)
+            symbols.append({"kind": SYMBOL_COMPOSABLE, "name": qualified, "value": signature, "file": filename,
+                            "snippet": "@Composable\n" + signature.replace("@Composable", "").strip()})
+            pending_composable = False
+        elif stripped and not stripped.startswith(("@", "//")):
+            pending_composable = False
+
+        for consumed in lines[index:end_index + 1]:
+            depth += consumed.count("{") - consumed.count("}")
+        while object_stack and depth < object_stack[-1][1]:
+            object_stack.pop()
+        index = end_index + 1
+    return symbols
+
+
+class _IndexedFile:
+    def __init__(self, path, mtime, size, content):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.mtime = mtime
+        self.size = size
+        self.content = content
+        package = _PACKAGE_RE.search(content)
+        self.package = package.group(1) if package else None
+        self.symbols = parse_kotlin_symbols(content, self.filename)
+        for symbol in self.symbols:
+            symbol["package"] = self.package
+
+
+# --- What the Figma node uses ---
+
+def figma_color_hex(color, opacity=1.0):
+    """A Figma RGBA color (0-1 channels) as an AARRGGBB hex string, with a paint's opacity applied."""
+    alpha = color.get("a", 1.0) * (opacity if opacity is not None else 1.0)
+    return "".join(f"{round(max(0.0, min(1.0, channel)) * 255):02X}"
+                   for channel in (alpha, color.get("r", 0), color.get("g", 0), color.get("b", 0)))
+
+
+def _name_tokens(name):
+    return {token.lower() for token in re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", name or "")}
+
+
+def collect_design_usage(value, usage=None):
+    """Walks Figma JSON and collects colors, text styles, dimensions and component names it uses."""
+    if usage is None:
+        usage = {"colors": set(), "text_styles": [], "dimensions": set(), "component_tokens": set()}
+    if isinstance(value, dict):
+        for paint_key in ("fills", "strokes"):
+            for paint in value.get(paint_key) or []:
+                if isinstance(paint, dict) and paint.get("type") == "SOLID" and isinstance(paint.get("color"), dict):
+                    usage["colors"].add(figma_color_hex(paint["color"], paint.get("opacity")))
+        style = value.get("style")
+        if value.get("type") == "TEXT" and isinstance(style, dict):
+            usage["text_styles"].append({"fontSize": style.get("fontSize"), "fontWeight": style.get("fontWeight"),
+                                         "fontFamily": style.get("fontFamily")})
+        for key in ("cornerRadius", "itemSpacing", "paddingLeft", "paddingRight", "paddingTop", "paddingBottom", "strokeWeight"):
+            if isinstance(value.get(key), (int, float)):
+                usage["dimensions"].add(float(value[key]))
+        if value.get("type") in ("INSTANCE", "COMPONENT", "COMPONENT_SET"):
+            usage["component_tokens"].update(_name_tokens(value.get("name")))
+        if isinstance(value.get("components"), dict):
+            for component in value["components"].values():
+                if isinstance(component, dict):
+                    usage["component_tokens"].update(_name_tokens(component.get("name")))
+        for child in value.values():
+            if isinstance(child, (dict, list)):
+                collect_design_usage(child, usage)
+    elif isinstance(value, list):
+        for child in value:
+            collect_design_usage(child, usage)
+    return usage
+
+
+def _colors_match(a, b):
+    return all(abs(int(a[i:i + 2], 16) - int(b[i:i + 2], 16)) <= COLOR_CHANNEL_TOLERANCE for i in range(0, 8, 2))
+
+
+def _symbol_is_relevant(symbol, usage):
+    kind, value = symbol["kind"], symbol["value"]
+    if kind == SYMBOL_COLOR:
+        return any(_colors_match(value, used) for used in usage["colors"])
+    if kind == SYMBOL_TYPOGRAPHY:
+        for used in usage["text_styles"]:
+            if used.get("fontSize") is None or value.get("fontSize") is None:
+                continue
+            if abs(value["fontSize"] - used["fontSize"]) > DIMENSION_TOLERANCE:
+                continue
+            if value.get("fontWeight") and used.get("fontWeight") and value["fontWeight"] != used["fontWeight"]:
+                continue
+            return True
+        return False
+    if kind == SYMBOL_DIMENSION:
+        return any(abs(value["amount"] - used) <= DIMENSION_TOLERANCE for used in usage["dimensions"])
+    if kind == SYMBOL_COMPOSABLE:
+        tokens = _name_tokens(symbol["name"].split(".")[-1])
+        return bool(tokens) and tokens <= usage["component_tokens"]
+    return False
+
+
+def _symbol_matches(symbol, kind, value):
+    if symbol["kind"] != kind:
+        return False
+    if kind == SYMBOL_COLOR:
+        return _colors_match(symbol["value"], value)
+    if kind == SYMBOL_TYPOGRAPHY:
+        return symbol["value"].get("fontSize") is not None and value.get("fontSize") is not None \
+            and abs(symbol["value"]["fontSize"] - value["fontSize"]) <= DIMENSION_TOLERANCE \
+            and (symbol["value"].get("fontWeight") or 400) == (value.get("fontWeight") or 400)
+    if kind == SYMBOL_DIMENSION:
+        return symbol["value"]["unit"] == "dp" and abs(symbol["value"]["amount"] - value) <= DIMENSION_TOLERANCE
+    return False
+
+
+def matching_symbols(symbols, kind, value):
+    """
+    The symbols of `kind` that are exactly what the node uses, in file order: an AARRGGBB color,
+    a {fontSize, fontWeight} text style (a missing weight counts as Normal) or a dp amount.
+    """
+    return [symbol for symbol in symbols if _symbol_matches(symbol, kind, value)]
+
+
+class KotlinIndex:
+    """Thread-safe index of a directory of .kt files; refresh() re-parses only files that changed."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Brings the index in line with the directory. Returns the number of files (re)parsed."""
+        paths = set(glob.glob(os.path.join(self.directory, "*.kt"))) if os.path.isdir(self.directory) else set()
+        reparsed = 0
+        with self._lock:
+            for path in list(self._files):
+                if path not in paths:
+                    del self._files[path]
+            for path in sorted(paths):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                indexed = self._files.get(path)
+                if indexed and indexed.mtime == stat.st_mtime and indexed.size == stat.st_size:
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                except Exception as e:
+                    print(f"Warning: Error reading custom Kotlin file '{path}': {e}")
+                    continue
+                self._files[path] = _IndexedFile(path, stat.st_mtime, stat.st_size, content)
+                reparsed += 1
+            return reparsed
+
+    def files(self):
+        with self._lock:
+            return list(self._files.values())
+
+    def symbols(self):
+        return [symbol for indexed in self.files() for symbol in indexed.symbols]
+
+    def full_files(self):
+        """The old behavior: every file's whole content."""
+        return [{"filename": indexed.filename, "content": indexed.content} for indexed in self.files()]
+
+    def prompt_files(self, figma_json, relevant_only=True):
+        """Returns (custom_kotlin_files_content, summary) for the prompt, narrowed to symbols the node uses."""
+        self.refresh()
+        indexed_files = self.files()
+        if not indexed_files:
+            return [], None
+        full = [{"filename": indexed.filename, "content": indexed.content} for indexed in indexed_files]
+        full_bytes = sum(len(info["content"]) for info in full)
+        if not relevant_only:
+            return full, f"Custom Kotlin: {len(full)} file(s), {full_bytes:,} bytes (full files)."
+
+        usage = collect_design_usage(figma_json)
+        selected, total_symbols = [], 0
+        for indexed in indexed_files:
+            total_symbols += len(indexed.symbols)
+            relevant = [symbol for symbol in indexed.symbols if _symbol_is_relevant(symbol, usage)]
+            if not relevant:
+                continue
+            header = f"package {indexed.package}\n\n" if indexed.package else ""
+            body = "\n\n".join(f"// Use as: {symbol['name']}\n{symbol['snippet'].strip()}" for symbol in relevant)
+            selected.append({"filename": f"{indexed.filename} (relevant symbols only)", "content": header + body,
+                             "symbol_count": len(relevant)})
+
+        if not selected:
+            return full, f"Custom Kotlin: no matching symbols found, sending {len(full)} full file(s) ({full_bytes:,} bytes)."
+        selected_bytes = sum(len(info["content"]) for info in selected)
+        selected_symbols = sum(info.pop("symbol_count") for info in selected)
+        return selected, (f"Custom Kotlin: {selected_symbols} of {total_symbols} symbols from {len(selected)} file(s) "
+                          f"({selected_bytes:,} of {full_bytes:,} bytes).")
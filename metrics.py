@@ -0,0 +1,246 @@
+"""In-process metrics rendered in the Prometheus text exposition format (served at /metrics).
+
+A small stdlib implementation of counters, gauges and histograms with labels.
+Every metric this app records is defined at the bottom of this module. The
+values are per process: with several gunicorn workers, scrape each worker or
+run a single worker with threads.
+"""
+import math
+import time
+import threading
+
+# --- Configuration ---
+METRIC_PREFIX = "figma_to_compose_"
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return "".join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()  # export unlabelled metrics as 0 before their first update
+        registry.register(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _unlabelled(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(child.samples(self.name, list(zip(self.labelnames, key))))
+        return "\n".join(lines) + "\n"
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def samples(self, name, label_pairs):
+        return [f"{name}{_format_labels(label_pairs)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._unlabelled().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1.0):
+        self._unlabelled().dec(amount)
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.total += value
+            self.count += 1
+
+    def samples(self, name, label_pairs):
+        with self._lock:
+            counts, total, count = list(self.counts), self.total, self.count
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(label_pairs + [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(label_pairs + [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(label_pairs)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(label_pairs)} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+
+class InstrumentedStream:
+    """Wraps a Gemini response stream and records time-to-first-chunk, duration and throughput once it is drained."""
+
+    def __init__(self, response_stream, started_at, mode):
+        self._response_stream = response_stream
+        self._started_at = started_at
+        self._mode = mode
+
+    def __getattr__(self, name):
+        return getattr(self._response_stream, name)
+
+    def __iter__(self):
+        chunks, size, first_chunk_at = 0, 0, None
+        GEMINI_STREAMS_IN_FLIGHT.inc()
+        try:
+            for chunk in self._response_stream:
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    GEMINI_TIME_TO_FIRST_CHUNK.labels(mode=self._mode).observe(first_chunk_at - self._started_at)
+                chunks += 1
+                size += len((getattr(chunk, "text", None) or "").encode('utf-8'))
+                yield chunk
+        finally:
+            GEMINI_STREAMS_IN_FLIGHT.dec()
+        duration = time.perf_counter() - self._started_at
+        GEMINI_STREAM_SECONDS.labels(mode=self._mode).observe(duration)
+        if duration > 0 and chunks:
+            GEMINI_CHUNKS_PER_SECOND.labels(mode=self._mode).observe(chunks / duration)
+            GEMINI_BYTES_PER_SECOND.labels(mode=self._mode).observe(size / duration)
+
+
+def render():
+    return REGISTRY.render()
+
+
+# --- Metrics ---
+
+FIGMA_STAGE_SECONDS = Histogram("figma_fetch_stage_seconds", "Duration of Figma fetch stages (nodes, image_url, image_download, revalidate, cache_read, svg_optimize).",
+                                ["stage"])
+FIGMA_CACHE_REQUESTS = Counter("figma_cache_requests_total", "Figma node cache lookups by outcome (hit, revalidated, refreshed, miss).",
+                               ["status"])
+PROMPT_SVG_BYTES = Histogram("prompt_svg_bytes", "Rendered SVG size at fetch time, before (raw) and after (optimized) svg_optimize.py.",
+                             ["stage"], buckets=BYTES_BUCKETS)
+PROMPT_ASSEMBLY_SECONDS = Histogram("prompt_assembly_seconds", "Time to prepare prompt inputs: read artifacts, compact JSON, select common/ code.")
+PROMPT_SIZE_BYTES = Histogram("prompt_size_bytes", "Size of each prompt sent to Gemini.", ["mode"], buckets=BYTES_BUCKETS)
+GEMINI_TIME_TO_FIRST_CHUNK = Histogram("gemini_time_to_first_chunk_seconds", "Time from the Gemini call to its first streamed chunk.", ["mode"])
+GEMINI_STREAM_SECONDS = Histogram("gemini_stream_duration_seconds", "Total duration of a Gemini stream.", ["mode"])
+GEMINI_CHUNKS_PER_SECOND = Histogram("gemini_stream_chunks_per_second", "Chunks per second of a finished Gemini stream.", ["mode"],
+                                     buckets=(0.5, 1, 2, 5, 10, 20, 50))
+GEMINI_BYTES_PER_SECOND = Histogram("gemini_stream_bytes_per_second", "Bytes per second of a finished Gemini stream.", ["mode"],
+                                    buckets=RATE_BUCKETS)
+GEMINI_STREAMS_IN_FLIGHT = Gauge("gemini_streams_in_flight", "Gemini streams currently being read.")
+GENERATION_CACHE_REQUESTS = Counter("generation_cache_requests_total", "Generation cache lookups by outcome (hit, miss, bypass).",
+                                    ["result"])
+RULE_BASED_GENERATIONS = Counter("rule_based_generations_total", "Rule-based fast path attempts by outcome (emitted, fallback).",
+                                 ["result"])
+SPECULATIVE_GENERATIONS = Counter("speculative_generations_total",
+                                  "Speculative generations started at fetch time by outcome (started, skipped, attached, cancelled).",
+                                  ["result"])
+GENERATION_JOBS_QUEUED = Gauge("generation_jobs_queued", "Generation jobs waiting for a worker.")
+GENERATIONS_IN_FLIGHT = Gauge("generations_in_flight", "Generation jobs currently running.")
+GENERATION_JOB_SECONDS = Histogram("generation_job_duration_seconds", "Wall time of a generation job, including cache replays.")
+SSE_VIEWERS = Gauge("sse_viewers", "Open SSE connections streaming a generation job.")
+GEMINI_CLIENTS_POOLED = Gauge("gemini_clients_pooled", "Configured Gemini clients held by the per-key client pool.")
+GEMINI_CLIENT_POOL_REQUESTS = Counter("gemini_client_pool_requests_total", "Gemini client pool lookups by outcome (hit, miss).",
+                                      ["result"])
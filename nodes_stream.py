@@ -0,0 +1,249 @@
+"""Single-pass handling of Figma /nodes responses (see json_stream.py).
+
+A big frame's /nodes body runs to many megabytes. Decoding it into a dict,
+writing it back out and decoding it again for the prompt kept several full
+copies of it alive per request. scan_nodes_response instead reads the body
+chunk by chunk and, in one pass:
+  - keeps the small top-level fields (name, version, lastModified, ...),
+  - hashes each node entry (see figma_cache.node_content_hash),
+  - builds the pruned form the prompt needs, with figma_compact's rules
+    applied while parsing, so dropped metadata and hidden layers are never
+    built at all,
+  - and, for a batch, writes each requested entry to a file of its own.
+stream_nodes_response also tees the raw body to the job's JSON file as it
+arrives. Only the pruned form is held in memory; it is saved next to the raw
+JSON as `*.prompt.json`, which generation reads instead of the raw response.
+Floats are not rounded here, so the prompt's precision stays a generation
+setting.
+
+The event parser is slower than json.loads, so only bodies of at least
+streaming_min_bytes() are streamed. Smaller ones are read whole and given
+the same treatment by scan_nodes_body.
+"""
+import os
+import json
+import shutil
+import hashlib
+
+import json_stream
+from figma_compact import prune_events, prune_value
+
+# --- Configuration ---
+PROMPT_JSON_SUFFIX = ".prompt.json"
+FILE_CHUNK_SIZE = 64 * 1024
+# Serialized entry text is hashed and written in batches of this many pieces.
+ENTRY_FLUSH_PIECES = 8192
+# Bodies smaller than this are decoded with json.loads; "0" streams every body.
+STREAMING_NODES_MIN_BYTES_ENV_VAR = "STREAMING_NODES_MIN_BYTES"
+DEFAULT_STREAMING_NODES_MIN_BYTES = 16 * 1024 * 1024
+
+
+def streaming_min_bytes():
+    try:
+        return int(os.environ.get(STREAMING_NODES_MIN_BYTES_ENV_VAR) or DEFAULT_STREAMING_NODES_MIN_BYTES)
+    except ValueError:
+        return DEFAULT_STREAMING_NODES_MIN_BYTES
+
+
+class NodesScan:
+    """What one pass over a /nodes response keeps: top-level fields, per-entry hashes and pruned entries."""
+
+    def __init__(self):
+        self.fields = {}
+        self.node_hashes = {}
+        self.pruned_nodes = {}
+        self.raw_bytes = 0
+
+    @property
+    def version(self):
+        """The file version the response was served at (as figma_cache.response_version)."""
+        return str(self.fields.get("version") or self.fields.get("lastModified") or "")
+
+    def pruned_response(self, node_key=None):
+        """The pruned /nodes-shaped document, for every entry or only `node_key`'s."""
+        nodes = self.pruned_nodes if node_key is None else {node_key: self.pruned_nodes.get(node_key)}
+        return dict(self.fields, nodes=nodes)
+
+
+class _EntrySink:
+    """Hashes the compact text of one node entry and optionally writes it to a file, in batches."""
+
+    def __init__(self, node_key, out=None):
+        self.hasher = hashlib.sha256()
+        self.out = out
+        self.parts = []
+        # Hashed as the one-entry `nodes` dict figma_cache.node_content_hash would see.
+        self.hasher.update(("{" + json.dumps(node_key) + ":").encode('utf-8'))
+
+    def flush(self):
+        text = "".join(self.parts)
+        self.parts.clear()
+        self.hasher.update(text.encode('utf-8'))
+        if self.out is not None:
+            self.out.write(text)
+
+    def hexdigest(self):
+        self.flush()
+        self.hasher.update(b"}")
+        return self.hasher.hexdigest()
+
+
+class _Tap:
+    """Passes events through, re-serializing each one into `sink` while it is set."""
+
+    def __init__(self, events):
+        self.events = events
+        self.sink = None
+        self._feed = None
+
+    def attach(self, sink):
+        self.sink = sink
+        self._feed = json_stream.JsonWriter(sink.parts.append).feed
+
+    def detach(self):
+        self.sink = self._feed = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = next(self.events)
+        if self._feed is not None:
+            self._feed(event)
+            if len(self.sink.parts) >= ENTRY_FLUSH_PIECES:
+                self.sink.flush()
+        return event
+
+
+def _scan_entry(tap, scan, node_key, entry_path):
+    out = open(entry_path, 'w', encoding='utf-8') if entry_path else None
+    try:
+        sink = _EntrySink(node_key, out)
+        tap.attach(sink)
+        pruned = prune_events(tap, next(tap), precision=None)
+        tap.detach()
+        scan.node_hashes[node_key] = sink.hexdigest()
+        scan.pruned_nodes[node_key] = pruned
+    finally:
+        if out is not None:
+            out.close()
+
+
+def _counted(chunks, scan, raw_out=None):
+    for chunk in chunks:
+        scan.raw_bytes += len(chunk)
+        if raw_out is not None:
+            raw_out.write(chunk)
+        yield chunk
+
+
+def scan_nodes_response(chunks, entry_paths=None, raw_out=None):
+    """
+    One pass over a /nodes body given as byte chunks; returns a NodesScan. `entry_paths` maps node keys
+    (as they appear in the response) to files that receive that entry as compact JSON, and `raw_out`,
+    if given, receives the body itself. Raises ValueError (json.JSONDecodeError) on malformed JSON.
+    """
+    scan = NodesScan()
+    entry_paths = entry_paths or {}
+    tap = _Tap(json_stream.iter_events(_counted(chunks, scan, raw_out)))
+    if next(tap)[0] != json_stream.START_MAP:
+        raise ValueError("Figma /nodes response is not a JSON object")
+    for kind, key in tap:
+        if kind == json_stream.END_MAP:
+            break
+        event = next(tap)
+        if key != "nodes" or event[0] != json_stream.START_MAP:
+            scan.fields[key] = json_stream.build_value(tap, event)
+            continue
+        for kind, node_key in tap:
+            if kind == json_stream.END_MAP:
+                break
+            _scan_entry(tap, scan, node_key, entry_paths.get(node_key))
+    for _ in tap:
+        pass  # Lets the parser reject trailing data.
+    return scan
+
+
+def scan_nodes_body(body, entry_paths=None):
+    """scan_nodes_response for a body already read into memory (bytes), decoded with json.loads instead."""
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Figma /nodes response is not a JSON object")
+    scan = NodesScan()
+    scan.raw_bytes = len(body)
+    entry_paths = entry_paths or {}
+    nodes = data.get("nodes")
+    scan.fields = {key: value for key, value in data.items() if key != "nodes" or not isinstance(nodes, dict)}
+    for node_key, entry in (nodes.items() if isinstance(nodes, dict) else ()):
+        text = json.dumps(entry, separators=(',', ':'))
+        wrapped = "{" + json.dumps(node_key) + ":" + text + "}"
+        scan.node_hashes[node_key] = hashlib.sha256(wrapped.encode('utf-8')).hexdigest()
+        scan.pruned_nodes[node_key] = prune_value(entry, precision=None)
+        if node_key in entry_paths:
+            with open(entry_paths[node_key], 'w', encoding='utf-8') as out:
+                out.write(text)
+    return scan
+
+
+def _write_via_part(path, write):
+    tmp_path = f"{path}.part"
+    try:
+        with open(tmp_path, 'wb') as out:
+            result = write(out)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return result
+
+
+def stream_nodes_response(chunks, json_output_path, entry_paths=None):
+    """scan_nodes_response that also writes the raw body to `json_output_path` (via a temp file + rename)."""
+    return _write_via_part(json_output_path, lambda raw_out: scan_nodes_response(chunks, entry_paths, raw_out))
+
+
+def save_nodes_body(body, json_output_path, entry_paths=None):
+    """scan_nodes_body that also writes the body to `json_output_path` once it has been decoded."""
+    scan = scan_nodes_body(body, entry_paths)
+    _write_via_part(json_output_path, lambda out: out.write(body))
+    return scan
+
+
+def iter_file_chunks(path, chunk_size=FILE_CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def write_node_response(scan, node_key, entry_path, output_path):
+    """Writes a /nodes-shaped document for one node of a batch: the response's top-level fields plus its entry."""
+    fields = json.dumps(scan.fields, separators=(',', ':'))
+    head = fields[:-1] + ("," if scan.fields else "") + '"nodes":{' + json.dumps(node_key) + ':'
+    with open(output_path, 'wb') as out, open(entry_path, 'rb') as entry:
+        out.write(head.encode('utf-8'))
+        shutil.copyfileobj(entry, out, FILE_CHUNK_SIZE)
+        out.write(b"}}")
+
+
+def prompt_json_path_for(json_path):
+    return os.path.splitext(json_path)[0] + PROMPT_JSON_SUFFIX
+
+
+def write_prompt_json(pruned_response, prompt_json_path):
+    with open(prompt_json_path, 'w', encoding='utf-8') as f:
+        json.dump(pruned_response, f, separators=(',', ':'), ensure_ascii=False)
+
+
+def load_prompt_json(json_path, prompt_json_path=None):
+    """The pruned form of a job's /nodes JSON: read from `prompt_json_path` if it exists, else one pass over the raw file."""
+    if prompt_json_path and os.path.exists(prompt_json_path):
+        with open(prompt_json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if os.path.getsize(json_path) < streaming_min_bytes():
+        with open(json_path, 'rb') as f:
+            return scan_nodes_body(f.read()).pruned_response()
+    return scan_nodes_response(iter_file_chunks(json_path)).pruned_response()
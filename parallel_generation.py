@@ -0,0 +1,280 @@
+"""Subtree-split parallel generation for large Figma frames.
+
+A big frame is split into its top-level children. Each child is generated as
+its own composable, and at the same time the parent is generated from a
+skeleton in which those children are references. All prompts run on a
+bounded worker pool, so wall-clock time follows the largest subtree instead
+of the whole screen. The units are then stitched into one Kotlin file. Per-unit
+progress is multiplexed onto the SSE stream as [INFO] events.
+"""
+import re
+import copy
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from compose_prompt import build_compose_prompt
+from figma_compact import compact_figma_json
+from sse import sse_info, sse_error, sse_end, sse_code_chunks
+from rate_limit import open_gemini_stream
+
+# --- Configuration ---
+PARALLEL_GENERATION_WORKERS = 4
+MIN_SUBTREES = 2
+PROGRESS_EVERY_CHARS = 2000
+SUBTREE_REF_TYPE = "SUBTREE_REF"
+# Layer names that would shadow Compose/Kotlin functions get a "Section" suffix.
+RESERVED_COMPOSABLE_NAMES = frozenset(["Box", "Row", "Column", "Text", "Image", "Icon", "Button", "Card", "Surface",
+                                       "Spacer", "Divider", "Scaffold", "List", "Map", "Set", "Array", "String"])
+# Child properties the parent still needs to size and place a referenced subtree.
+SUBTREE_REF_LAYOUT_KEYS = ("absoluteBoundingBox", "layoutAlign", "layoutGrow", "layoutPositioning",
+                           "layoutSizingHorizontal", "layoutSizingVertical", "constraints")
+
+_generation_executor = ThreadPoolExecutor(max_workers=PARALLEL_GENERATION_WORKERS, thread_name_prefix="gemini-subtree")
+
+
+class GenerationUnit:
+    """One prompt in a split generation: either a subtree composable or the parent skeleton."""
+
+    def __init__(self, name, node_json, is_parent=False, node_id=None):
+        self.name = name
+        self.node_json = node_json
+        self.is_parent = is_parent
+        self.node_id = node_id
+        self.code = ""
+        # Set when the code was carried over from a previous generation (see incremental_generation.py).
+        self.reused = False
+
+
+class SubtreePlan:
+    def __init__(self, parent, subtrees):
+        self.parent = parent
+        self.subtrees = subtrees
+
+    @property
+    def units(self):
+        return self.subtrees + [self.parent]
+
+
+def composable_name(figma_name, used_names, fallback="Node"):
+    """Turns a Figma layer name into a unique PascalCase Kotlin identifier."""
+    words = re.findall(r"[A-Za-z0-9]+", figma_name or "")
+    name = "".join(word[:1].upper() + word[1:] for word in words) or fallback
+    if name[0].isdigit():
+        name = fallback + name
+    if name in RESERVED_COMPOSABLE_NAMES:
+        name += "Section"
+    candidate, suffix = name, 2
+    while candidate in used_names:
+        candidate = f"{name}{suffix}"
+        suffix += 1
+    used_names.add(candidate)
+    return candidate
+
+
+def root_document(nodes_response):
+    """Returns (node_id, node_entry) for the first node in a /nodes response, or (None, None)."""
+    nodes = nodes_response.get("nodes") if isinstance(nodes_response, dict) else None
+    if not isinstance(nodes, dict):
+        return None, None
+    for node_id, entry in nodes.items():
+        if isinstance(entry, dict) and isinstance(entry.get("document"), dict):
+            return node_id, entry
+    return None, None
+
+
+def plan_subtrees(nodes_response, min_subtrees=MIN_SUBTREES):
+    """Splits the root frame into its visible top-level children. Returns None if it is not worth splitting."""
+    node_id, entry = root_document(nodes_response)
+    if entry is None:
+        return None
+    document = entry["document"]
+    children = [child for child in document.get("children", []) if isinstance(child, dict) and child.get("visible", True)]
+    if len(children) < min_subtrees:
+        return None
+
+    used_names = set()
+    parent_name = composable_name(document.get("name"), used_names, fallback="Screen")
+    subtrees, refs = [], []
+    for child in children:
+        unit = GenerationUnit(composable_name(child.get("name"), used_names), child, node_id=child.get("id"))
+        subtrees.append(unit)
+        ref = {"id": child.get("id"), "name": child.get("name"), "type": SUBTREE_REF_TYPE, "composable": unit.name}
+        ref.update({key: child[key] for key in SUBTREE_REF_LAYOUT_KEYS if key in child})
+        refs.append(ref)
+
+    skeleton_document = {key: value for key, value in document.items() if key != "children"}
+    skeleton_document["children"] = refs
+    skeleton_entry = dict(entry, document=skeleton_document)
+    skeleton = dict(nodes_response, nodes={node_id: skeleton_entry})
+    # Component/style tables are shared by every unit, so they go to each subtree prompt too.
+    shared_tables = {key: copy.deepcopy(entry[key]) for key in ("components", "componentSets", "styles") if key in entry}
+    for unit in subtrees:
+        unit.node_json = dict(shared_tables, document=unit.node_json)
+    parent = GenerationUnit(parent_name, skeleton, is_parent=True, node_id=node_id)
+    return SubtreePlan(parent, subtrees)
+
+
+def subtree_task_instructions(unit):
+    return (f"Generate ONLY a single top-level `@Composable fun {unit.name}(modifier: Modifier = Modifier)` for the Figma subtree above, "
+            f"plus any private helper composables it needs (prefix their names with `{unit.name}`). "
+            f"It will be called from a parent composable defined elsewhere in the same file: apply `modifier` to the root layout, "
+            f"do NOT include a package statement and do NOT include a @Preview. Include all imports it needs.")
+
+
+def parent_task_instructions(plan):
+    names = ", ".join(f"`{unit.name}`" for unit in plan.subtrees)
+    return (f"Generate the parent `@Composable fun {plan.parent.name}()` for the Figma node above. "
+            f"Children with type `{SUBTREE_REF_TYPE}` are ALREADY implemented elsewhere in the same file as "
+            f"`@Composable fun <composable>(modifier: Modifier = Modifier)` ({names}). Call them by their `composable` name, passing "
+            f"layout modifiers based on their `absoluteBoundingBox`/layout properties, and do NOT define them yourself. "
+            f"Include a @Preview for `{plan.parent.name}`.")
+
+
+def unit_prompt(unit, plan, figma_svg_str, custom_kotlin_files_content, additional_instructions, float_precision,
+                dedupe_instances=True):
+    if float_precision is None:
+        json_str, uses_shared_styles, component_definitions = json.dumps(unit.node_json, indent=4), False, {}
+    else:
+        json_str, uses_shared_styles, component_definitions = compact_figma_json(unit.node_json, float_precision=float_precision,
+                                                                                  dedupe_instances=dedupe_instances)
+    task = parent_task_instructions(plan) if unit.is_parent else subtree_task_instructions(unit)
+    # The rendered SVG covers the whole frame, so it only helps the parent prompt.
+    svg = figma_svg_str if unit.is_parent else None
+    return build_compose_prompt(json_str, svg, custom_kotlin_files_content, additional_instructions,
+                                json_uses_shared_styles=uses_shared_styles, task_instructions=task,
+                                json_uses_component_definitions=bool(component_definitions))
+
+
+# --- Stitching ---
+
+def _strip_code_fences(code):
+    return "\n".join(line for line in code.splitlines() if not line.strip().startswith("```"))
+
+
+def split_kotlin_unit(code):
+    """Splits generated Kotlin into (package_line, import_lines, body)."""
+    package_line, imports, body_lines = None, [], []
+    for line in _strip_code_fences(code).splitlines():
+        stripped = line.strip()
+        if stripped.startswith("package ") and package_line is None and not any(l.strip() for l in body_lines):
+            package_line = stripped
+        elif stripped.startswith("import ") and not any(l.strip() for l in body_lines):
+            imports.append(stripped)
+        else:
+            body_lines.append(line)
+    return package_line, imports, "\n".join(body_lines).strip()
+
+
+def stitch_kotlin_units(parent_code, subtree_codes):
+    """Merges the parent and subtree outputs into one file: one package line, deduplicated imports, all bodies."""
+    package_line, imports, bodies = None, set(), []
+    for code in [parent_code] + list(subtree_codes):
+        unit_package, unit_imports, body = split_kotlin_unit(code)
+        package_line = package_line or unit_package
+        imports.update(unit_imports)
+        if body:
+            bodies.append(body)
+    parts = []
+    if package_line:
+        parts.append(package_line)
+    if imports:
+        parts.append("\n".join(sorted(imports)))
+    parts.extend(bodies)
+    return "\n\n".join(parts) + "\n"
+
+
+# --- Execution ---
+
+def _generate_unit(model, unit, prompt, events, rate_limit_bucket, cancelled):
+    """Generates one unit, reporting to `events`. Stops quietly, without setting unit.code, once `cancelled` is set."""
+    if cancelled.is_set():
+        return
+    events.put(("start", unit, None))
+    started = time.perf_counter()
+    parts, size, emitted_at = [], 0, 0
+    try:
+        opener = open_gemini_stream(model, prompt, rate_limit_bucket, mode="split")
+        while True:
+            try:
+                events.put(("wait", unit, next(opener)))
+            except StopIteration as stop:
+                response_stream = stop.value
+                break
+            if cancelled.is_set():
+                opener.close()
+                return
+        for chunk in response_stream:
+            if cancelled.is_set():
+                # Another unit failed or the viewer's job was cancelled: stop reading (and paying for) this stream.
+                return
+            if chunk.text:
+                parts.append(chunk.text)
+                size += len(chunk.text)
+                if size - emitted_at >= PROGRESS_EVERY_CHARS:
+                    emitted_at = size
+                    events.put(("progress", unit, size))
+        unit.code = "".join(parts)
+        if not unit.code.strip():
+            raise RuntimeError("No content received from Gemini stream.")
+        events.put(("done", unit, time.perf_counter() - started))
+    except Exception as e:
+        events.put(("error", unit, str(e)))
+
+
+def parallel_generation_sse(model, plan, figma_svg_str=None, custom_kotlin_files_content=None, additional_instructions=None,
+                            float_precision=None, rate_limit_bucket=None, dedupe_instances=True):
+    """
+    Runs every unit of `plan` on the worker pool and yields SSE events, ending with the stitched code.
+    Units marked `reused` already have their code and are not sent to Gemini.
+    """
+    units = [unit for unit in plan.units if not unit.reused]
+    total = len(units)
+    labels = {id(unit): f"[{'parent' if unit.is_parent else 'subtree'} {i}/{total} {unit.name}]" for i, unit in enumerate(units, 1)}
+    events = queue.Queue()
+    started = time.perf_counter()
+
+    reused_note = f", {len(plan.units) - total} reused from the previous generation" if total < len(plan.units) else ""
+    yield sse_info(f"Split generation: {len(plan.subtrees)} subtrees + parent '{plan.parent.name}'{reused_note}, "
+                   f"up to {PARALLEL_GENERATION_WORKERS} in parallel.")
+    cancelled = threading.Event()
+    futures = [
+        _generation_executor.submit(_generate_unit, model, unit,
+                                    unit_prompt(unit, plan, figma_svg_str, custom_kotlin_files_content, additional_instructions,
+                                                float_precision, dedupe_instances),
+                                    events, rate_limit_bucket, cancelled)
+        for unit in units
+    ]
+
+    finished = 0
+    try:
+        while finished < total:
+            kind, unit, value = events.get()
+            label = labels[id(unit)]
+            if kind == "start":
+                yield sse_info(f"{label} started")
+            elif kind == "wait":
+                yield sse_info(f"{label} {value}")
+            elif kind == "progress":
+                yield sse_info(f"{label} {value:,} chars received")
+            elif kind == "done":
+                finished += 1
+                print(f"Parallel generation: {label} done in {value:.2f}s ({len(unit.code):,} chars)")
+                yield sse_info(f"{label} done in {value:.1f}s ({finished}/{total})")
+            else:
+                print(f"Parallel generation: {label} failed: {value}")
+                yield sse_error(f"{label} generation failed: {value}")
+                yield sse_end()
+                return
+    finally:
+        # Also reached when the consumer closes this generator (a cancelled job): running units stop too.
+        cancelled.set()
+        for future in futures:
+            future.cancel()
+
+    stitched = stitch_kotlin_units(plan.parent.code, [unit.code for unit in plan.subtrees])
+    yield sse_info(f"All units finished in {time.perf_counter() - started:.1f}s; stitched into one file.")
+    yield from sse_code_chunks(stitched)
+    yield sse_end()
@@ -0,0 +1,188 @@
+"""Token-bucket rate limiting and retry backoff for the Figma and Gemini APIs.
+
+Buckets live in SQLite, so every thread and every worker process on the host
+draws from the same budget. There is one bucket per upstream and credential
+(keyed by a hash, never the raw token). Acquiring a slot is a reservation:
+if the bucket is empty the caller still takes a token, driving the balance
+negative, and is told how long to wait. That balance is also the caller's
+position in the queue. A 429 with Retry-After pauses the bucket for every
+process, not just the thread that saw it.
+"""
+import os
+import re
+import time
+import math
+import random
+import hashlib
+import threading
+import email.utils
+
+from sqlite_store import connect_sqlite
+from metrics import InstrumentedStream, PROMPT_SIZE_BYTES
+
+# --- Configuration ---
+RATE_LIMIT_DB_PATH_ENV_VAR = "RATE_LIMIT_DB_PATH"
+DEFAULT_RATE_LIMIT_DB_PATH = os.path.join(".figma_cache", "rate_limits.sqlite3")
+FIGMA_RATE_LIMIT_PER_MINUTE_ENV_VAR = "FIGMA_RATE_LIMIT_PER_MINUTE"
+GEMINI_RATE_LIMIT_PER_MINUTE_ENV_VAR = "GEMINI_RATE_LIMIT_PER_MINUTE"
+DEFAULT_FIGMA_RATE_PER_MINUTE = 120
+DEFAULT_GEMINI_RATE_PER_MINUTE = 10
+DEFAULT_BURST = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+MAX_RETRIES = 4
+
+UPSTREAM_FIGMA = "figma"
+UPSTREAM_GEMINI = "gemini"
+
+
+class Reservation:
+    """A granted slot: how long to wait before using it and how many callers are ahead."""
+
+    def __init__(self, wait_seconds, queue_position):
+        self.wait_seconds = wait_seconds
+        self.queue_position = queue_position
+
+    def describe(self, upstream):
+        return (f"{upstream.capitalize()} rate limit: position {self.queue_position} in queue, "
+                f"waiting {self.wait_seconds:.1f}s")
+
+
+def bucket_key(upstream, credential):
+    """Bucket name for an upstream and API key/token (hashed, so no secret is written to disk)."""
+    digest = hashlib.sha256((credential or "").encode('utf-8')).hexdigest()[:16]
+    return f"{upstream}:{digest}"
+
+
+def configured_rate(upstream):
+    env_var, default = {
+        UPSTREAM_FIGMA: (FIGMA_RATE_LIMIT_PER_MINUTE_ENV_VAR, DEFAULT_FIGMA_RATE_PER_MINUTE),
+        UPSTREAM_GEMINI: (GEMINI_RATE_LIMIT_PER_MINUTE_ENV_VAR, DEFAULT_GEMINI_RATE_PER_MINUTE),
+    }[upstream]
+    try:
+        return float(os.environ.get(env_var) or default)
+    except ValueError:
+        return float(default)
+
+
+class RateLimiter:
+    """SQLite-backed token buckets shared by threads and processes."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.environ.get(RATE_LIMIT_DB_PATH_ENV_VAR) or DEFAULT_RATE_LIMIT_DB_PATH
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with connect_sqlite(self.db_path) as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY, tokens REAL, updated_at REAL, paused_until REAL)""")
+
+    def reserve(self, key, rate_per_minute, burst=DEFAULT_BURST):
+        """Takes one token from bucket `key` and returns a Reservation (wait 0 if a token was available)."""
+        rate = rate_per_minute / 60.0
+        with connect_sqlite(self.db_path, immediate=True) as db:
+            now = time.time()
+            row = db.execute("SELECT tokens, updated_at, paused_until FROM buckets WHERE key=?", (key,)).fetchone()
+            tokens, updated_at, paused_until = row if row else (float(burst), now, 0.0)
+            # Tokens only accrue once a Retry-After pause is over.
+            refill_from = max(updated_at, min(paused_until, now))
+            tokens = min(float(burst), tokens + max(0.0, now - refill_from) * rate)
+            tokens -= 1.0
+            wait = max(0.0, paused_until - now) + (-tokens / rate if tokens < 0 else 0.0)
+            db.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated_at, paused_until) VALUES (?, ?, ?, ?)",
+                       (key, tokens, now, paused_until))
+        return Reservation(wait, max(1 if wait > 0 else 0, math.ceil(-tokens)))
+
+    def pause(self, key, seconds):
+        """Stops bucket `key` from granting tokens for `seconds` (e.g. a 429's Retry-After)."""
+        until = time.time() + seconds
+        with connect_sqlite(self.db_path) as db:
+            db.execute("""INSERT INTO buckets (key, tokens, updated_at, paused_until) VALUES (?, 0, ?, ?)
+                          ON CONFLICT(key) DO UPDATE SET paused_until=MAX(paused_until, excluded.paused_until),
+                                                          tokens=MIN(tokens, 0)""",
+                       (key, time.time(), until))
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def shared_rate_limiter():
+    """The process-wide RateLimiter (created on first use)."""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
+
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    """Seconds to wait before retry number `attempt` (0-based): Retry-After if given, else full-jitter exponential."""
+    if retry_after is not None:
+        return min(cap, retry_after) + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (delta-seconds or HTTP-date) into seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# "Please retry in 27.5s." in the message, or a RetryInfo detail rendered as "retry_delay { seconds: 27 }".
+_GEMINI_RETRY_DELAY_RE = re.compile(r"retry in ([0-9]+(?:\.[0-9]+)?)s|retry_delay\s*\{\s*seconds:\s*([0-9]+)", re.IGNORECASE)
+
+
+def is_gemini_quota_error(error):
+    """True for Gemini 429 / RESOURCE_EXHAUSTED errors (google.api_core raises ResourceExhausted)."""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    if getattr(error, "code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text and ("quota" in text.lower() or "exhausted" in text.lower())
+
+
+def gemini_retry_after(error):
+    """The server-suggested retry delay of a Gemini quota error, if it carries one."""
+    match = _GEMINI_RETRY_DELAY_RE.search(str(error))
+    return float(match.group(1) or match.group(2)) if match else None
+
+
+def open_gemini_stream(model, prompt, bucket, limiter=None, max_retries=MAX_RETRIES, mode="single"):
+    """
+    Generator that waits for a Gemini rate-limit slot and calls model.generate_content(prompt, stream=True),
+    retrying quota errors with backoff (a None bucket skips the rate limit). Yields a human-readable message before every wait and returns
+    the response stream, so callers use `response = yield from open_gemini_stream(...)`. The stream is
+    instrumented for /metrics under `mode`.
+    """
+    limiter = limiter or shared_rate_limiter()
+    PROMPT_SIZE_BYTES.labels(mode=mode).observe(len(prompt.encode('utf-8')))
+    for attempt in range(max_retries + 1):
+        if bucket is not None:
+            reservation = limiter.reserve(bucket, configured_rate(UPSTREAM_GEMINI))
+            if reservation.wait_seconds > 0:
+                yield reservation.describe(UPSTREAM_GEMINI)
+                time.sleep(reservation.wait_seconds)
+        try:
+            started_at = time.perf_counter()
+            return InstrumentedStream(model.generate_content(prompt, stream=True), started_at, mode)
+        except Exception as e:
+            if not is_gemini_quota_error(e) or attempt == max_retries:
+                raise
+            retry_after = gemini_retry_after(e)
+            if retry_after is not None and bucket is not None:
+                # The next reservation waits out the pause, for every caller using this key.
+                limiter.pause(bucket, retry_after)
+                yield f"Gemini quota exceeded; retrying after {retry_after:.0f}s as requested (retry {attempt + 1}/{max_retries})."
+            else:
+                delay = backoff_delay(attempt)
+                yield f"Gemini quota exceeded; retrying in {delay:.1f}s (retry {attempt + 1}/{max_retries})."
+                time.sleep(delay)
@@ -0,0 +1,170 @@
+"""Server-side store for the generated code shown on the page.
+
+The session cookie holds only the id of a saved output, not the output
+itself, so request size stays constant however large the generated file
+is. Outputs are stored zlib-compressed. Outputs over a size limit are
+rejected, and entries expire after a TTL. The least recently read entries
+are evicted once the store is over its entry or byte limit.
+
+Two backends, chosen with RESULT_STORE_BACKEND:
+    sqlite  (default) a SQLite file shared by every worker process
+    memory  a per-process LRU; only for a single worker, and lost on restart
+"""
+import os
+import time
+import zlib
+import secrets
+import threading
+import collections
+
+from sqlite_store import connect_sqlite
+
+# --- Configuration ---
+RESULT_STORE_BACKEND_ENV_VAR = "RESULT_STORE_BACKEND"
+RESULT_STORE_PATH_ENV_VAR = "RESULT_STORE_PATH"
+DEFAULT_RESULT_STORE_BACKEND = "sqlite"
+DEFAULT_RESULT_STORE_PATH = os.path.join(".figma_cache", "results.sqlite3")
+RESULT_MAX_BYTES = 4 * 1024 * 1024
+RESULT_STORE_MAX_ENTRIES = 2000
+RESULT_STORE_MAX_BYTES = 128 * 1024 * 1024
+RESULT_TTL_SECONDS = 24 * 60 * 60
+
+
+class ResultTooLargeError(ValueError):
+    pass
+
+
+class ResultStore:
+    """Interface of the result store backends."""
+
+    def __init__(self, max_result_bytes=RESULT_MAX_BYTES, max_entries=RESULT_STORE_MAX_ENTRIES,
+                 max_bytes=RESULT_STORE_MAX_BYTES, ttl_seconds=RESULT_TTL_SECONDS):
+        self.max_result_bytes = max_result_bytes
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+    def _compress(self, code):
+        data = code.encode('utf-8')
+        if len(data) > self.max_result_bytes:
+            raise ResultTooLargeError(f"Generated code is {len(data):,} bytes; the limit is {self.max_result_bytes:,}.")
+        return zlib.compress(data)
+
+    def put(self, code):
+        """Stores `code` and returns its id."""
+        raise NotImplementedError
+
+    def get(self, result_id):
+        """The stored code, or None if the id is unknown or expired."""
+        raise NotImplementedError
+
+    def delete(self, result_id):
+        raise NotImplementedError
+
+
+class MemoryResultStore(ResultStore):
+    """In-process LRU of compressed outputs."""
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self._entries = collections.OrderedDict()  # id -> (compressed, expires_at)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def put(self, code):
+        compressed = self._compress(code)
+        result_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._entries[result_id] = (compressed, time.time() + self.ttl_seconds)
+            self._total += len(compressed)
+            self._evict()
+        return result_id
+
+    def get(self, result_id):
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                self._remove(result_id)
+                return None
+            self._entries.move_to_end(result_id)
+        return zlib.decompress(entry[0]).decode('utf-8')
+
+    def delete(self, result_id):
+        with self._lock:
+            if result_id in self._entries:
+                self._remove(result_id)
+
+    def _remove(self, result_id):
+        compressed, _ = self._entries.pop(result_id)
+        self._total -= len(compressed)
+
+    def _evict(self):
+        now = time.time()
+        for result_id in [result_id for result_id, (_, expires_at) in self._entries.items() if expires_at < now]:
+            self._remove(result_id)
+        while self._entries and (len(self._entries) > self.max_entries or self._total > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+
+class SqliteResultStore(ResultStore):
+    """Compressed outputs in SQLite, shared by threads and worker processes."""
+
+    def __init__(self, db_path=None, **limits):
+        super().__init__(**limits)
+        self.db_path = db_path or os.environ.get(RESULT_STORE_PATH_ENV_VAR) or DEFAULT_RESULT_STORE_PATH
+        self._evict_lock = threading.Lock()
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with connect_sqlite(self.db_path) as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS results (
+                id TEXT PRIMARY KEY, code BLOB, size INTEGER, expires_at REAL, last_access REAL)""")
+
+    def put(self, code):
+        compressed = self._compress(code)
+        result_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with connect_sqlite(self.db_path) as db:
+            db.execute("INSERT INTO results (id, code, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                       (result_id, compressed, len(compressed), now + self.ttl_seconds, now))
+        self.evict()
+        return result_id
+
+    def get(self, result_id):
+        now = time.time()
+        with connect_sqlite(self.db_path) as db:
+            row = db.execute("SELECT code FROM results WHERE id=? AND expires_at>=?", (result_id, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE results SET last_access=? WHERE id=?", (now, result_id))
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def delete(self, result_id):
+        with connect_sqlite(self.db_path) as db:
+            db.execute("DELETE FROM results WHERE id=?", (result_id,))
+
+    def evict(self):
+        with self._evict_lock, connect_sqlite(self.db_path) as db:
+            db.execute("DELETE FROM results WHERE expires_at<?", (time.time(),))
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            if count <= self.max_entries and total <= self.max_bytes:
+                return
+            for result_id, size in db.execute("SELECT id, size FROM results ORDER BY last_access ASC").fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM results WHERE id=?", (result_id,))
+                count -= 1
+                total -= size
+
+
+RESULT_STORE_BACKENDS = {"sqlite": SqliteResultStore, "memory": MemoryResultStore}
+
+
+def create_result_store(backend=None):
+    """The result store selected by `backend` or RESULT_STORE_BACKEND."""
+    name = (backend or os.environ.get(RESULT_STORE_BACKEND_ENV_VAR) or DEFAULT_RESULT_STORE_BACKEND).lower()
+    if name not in RESULT_STORE_BACKENDS:
+        raise ValueError(f"Unknown result store backend '{name}' (choose from {', '.join(RESULT_STORE_BACKENDS)}).")
+    return RESULT_STORE_BACKENDS[name]()
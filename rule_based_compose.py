@@ -0,0 +1,456 @@
+"""Deterministic Figma JSON -> Jetpack Compose for simple nodes, without a Gemini round-trip.
+
+emit_compose covers TEXT, RECTANGLE, circular ELLIPSE and auto-layout
+FRAME/COMPONENT/INSTANCE nodes. It maps layoutMode, itemSpacing, alignment,
+sizing modes, padding, solid fills and strokes, corner radii, opacity and
+typography. Colors, text styles and dp values resolve to the matching
+common/ Kotlin symbols (see kotlin_index.py). Anything else in a visible
+node, such as vectors, images, gradients, effects, absolute positioning or
+mixed text styles, raises UnsupportedNode; try_rule_based_compose then
+returns the reason and generation goes to Gemini as before.
+"""
+import math
+
+from kotlin_index import SYMBOL_COLOR, SYMBOL_TYPOGRAPHY, SYMBOL_DIMENSION, figma_color_hex, matching_symbols
+from parallel_generation import composable_name, root_document
+from sse import sse_info, sse_end, sse_code_chunks
+
+# --- Configuration ---
+# Bigger trees go to the model even if every node is supported: it structures screens better (lists, sections).
+RULE_BASED_MAX_NODES = 60
+INDENT = "    "
+
+CONTAINER_NODE_TYPES = frozenset(["FRAME", "COMPONENT", "INSTANCE"])
+SHAPE_NODE_TYPES = frozenset(["RECTANGLE", "ELLIPSE"])
+DEFAULT_BLEND_MODES = ("PASS_THROUGH", "NORMAL")
+SIZE_TOLERANCE = 0.01
+# Words in a dp symbol's name that give away what it is for, so e.g. a radius token is not used as padding.
+DIMENSION_ROLE_HINTS = {
+    "radius": ("radius", "corner", "round"),
+    "spacing": ("spacing", "space", "padding", "gap", "margin", "inset"),
+    "stroke": ("stroke", "border", "outline"),
+}
+
+IMPORTS = {
+    "Composable": "androidx.compose.runtime.Composable",
+    "Preview": "androidx.compose.ui.tooling.preview.Preview",
+    "Modifier": "androidx.compose.ui.Modifier",
+    "Alignment": "androidx.compose.ui.Alignment",
+    "Color": "androidx.compose.ui.graphics.Color",
+    "alpha": "androidx.compose.ui.draw.alpha",
+    "clip": "androidx.compose.ui.draw.clip",
+    "background": "androidx.compose.foundation.background",
+    "border": "androidx.compose.foundation.border",
+    "Box": "androidx.compose.foundation.layout.Box",
+    "Row": "androidx.compose.foundation.layout.Row",
+    "Column": "androidx.compose.foundation.layout.Column",
+    "Arrangement": "androidx.compose.foundation.layout.Arrangement",
+    "padding": "androidx.compose.foundation.layout.padding",
+    "size": "androidx.compose.foundation.layout.size",
+    "width": "androidx.compose.foundation.layout.width",
+    "height": "androidx.compose.foundation.layout.height",
+    "fillMaxWidth": "androidx.compose.foundation.layout.fillMaxWidth",
+    "fillMaxHeight": "androidx.compose.foundation.layout.fillMaxHeight",
+    "RoundedCornerShape": "androidx.compose.foundation.shape.RoundedCornerShape",
+    "CircleShape": "androidx.compose.foundation.shape.CircleShape",
+    "Text": "androidx.compose.material3.Text",
+    "TextStyle": "androidx.compose.ui.text.TextStyle",
+    "FontWeight": "androidx.compose.ui.text.font.FontWeight",
+    "FontStyle": "androidx.compose.ui.text.font.FontStyle",
+    "TextAlign": "androidx.compose.ui.text.style.TextAlign",
+    "TextDecoration": "androidx.compose.ui.text.style.TextDecoration",
+    "TextOverflow": "androidx.compose.ui.text.style.TextOverflow",
+    "dp": "androidx.compose.ui.unit.dp",
+    "sp": "androidx.compose.ui.unit.sp",
+}
+FONT_WEIGHT_NAMES = {100: "Thin", 200: "ExtraLight", 300: "Light", 400: "Normal", 500: "Medium",
+                     600: "SemiBold", 700: "Bold", 800: "ExtraBold", 900: "Black"}
+TEXT_ALIGNS = {"LEFT": "Start", "CENTER": "Center", "RIGHT": "End", "JUSTIFIED": "Justify"}
+TEXT_DECORATIONS = {"UNDERLINE": "Underline", "STRIKETHROUGH": "LineThrough"}
+
+_KOTLIN_ESCAPES = {"\\": "\\\\", "\"": "\\\"", "$": "\\$", "\n": "\\n", "\t": "\\t", "\r": ""}
+
+
+class UnsupportedNode(Exception):
+    """The tree uses something the rule-based emitter does not translate; the message says what."""
+
+
+def _visible(node):
+    return isinstance(node, dict) and node.get("visible", True) is not False
+
+
+def _label(node):
+    return f"{node.get('type', 'node')} '{node.get('name', '')}'"
+
+
+def _number(value):
+    rounded = round(float(value), 2)
+    return str(int(rounded)) if rounded == int(rounded) else f"{rounded:g}"
+
+
+def kotlin_string(text):
+    return "\"" + "".join(_KOTLIN_ESCAPES.get(char, char) for char in text) + "\""
+
+
+def count_visible_nodes(node):
+    if not _visible(node):
+        return 0
+    return 1 + sum(count_visible_nodes(child) for child in node.get("children") or [])
+
+
+class _Emitter:
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.imports = {IMPORTS["Composable"], IMPORTS["Modifier"], IMPORTS["Preview"]}
+
+    def use(self, *names):
+        self.imports.update(IMPORTS[name] for name in names)
+
+    def token(self, kind, value, role=None):
+        """Name of the common/ symbol for `value` (importing it), or None. dp symbols named for another role are skipped."""
+        candidates = matching_symbols(self.symbols, kind, value)
+        if role:
+            def hints(symbol):
+                name = symbol["name"].lower()
+                return {hinted for hinted, words in DIMENSION_ROLE_HINTS.items() if any(word in name for word in words)}
+            candidates = ([symbol for symbol in candidates if role in hints(symbol)]
+                          + [symbol for symbol in candidates if not hints(symbol)])
+        if not candidates:
+            return None
+        symbol = candidates[0]
+        if symbol.get("package"):
+            self.imports.add(f"{symbol['package']}.{symbol['name'].split('.')[0]}")
+        return symbol["name"]
+
+    def dp(self, value, role=None):
+        """A dp literal, or the matching common/ dimension when `role` (radius, spacing, stroke) is given."""
+        name = self.token(SYMBOL_DIMENSION, float(value), role) if role else None
+        if name:
+            return name
+        self.use("dp")
+        return f"{_number(value)}.dp"
+
+    def sp(self, value):
+        self.use("sp")
+        return f"{_number(value)}.sp"
+
+    # --- Paints and shapes ---
+
+    def paint(self, node, key):
+        """The color expression of a node's single visible solid paint, or None if it has none."""
+        paints = [paint for paint in node.get(key) or [] if _visible(paint)]
+        if not paints:
+            return None
+        if len(paints) > 1:
+            raise UnsupportedNode(f"{_label(node)} has {len(paints)} stacked {key}")
+        paint = paints[0]
+        if paint.get("type") != "SOLID" or not isinstance(paint.get("color"), dict):
+            raise UnsupportedNode(f"{_label(node)} has a {paint.get('type', 'non-solid').lower()} paint in {key}")
+        if paint.get("blendMode", "NORMAL") not in DEFAULT_BLEND_MODES:
+            raise UnsupportedNode(f"{_label(node)} uses blend mode {paint['blendMode']}")
+        argb = figma_color_hex(paint["color"], paint.get("opacity"))
+        name = self.token(SYMBOL_COLOR, argb)
+        if name:
+            return name
+        self.use("Color")
+        return f"Color(0x{argb})"
+
+    def shape(self, node):
+        box = node.get("absoluteBoundingBox") or {}
+        if node.get("type") == "ELLIPSE":
+            arc = node.get("arcData") or {}
+            sweep = abs(arc.get("endingAngle", 2 * math.pi) - arc.get("startingAngle", 0))
+            if arc.get("innerRadius") or abs(sweep - 2 * math.pi) > 0.001:
+                raise UnsupportedNode(f"{_label(node)} is an arc or ring")
+            if abs((box.get("width") or 0) - (box.get("height") or 0)) > SIZE_TOLERANCE:
+                raise UnsupportedNode(f"{_label(node)} is not a circle")
+            self.use("CircleShape")
+            return "CircleShape"
+        radii = node.get("rectangleCornerRadii")
+        if isinstance(radii, list) and len(radii) == 4 and len(set(radii)) > 1:
+            self.use("RoundedCornerShape")
+            corners = ", ".join(f"{corner} = {self.dp(radius, 'radius')}"
+                                for corner, radius in zip(("topStart", "topEnd", "bottomEnd", "bottomStart"), radii))
+            return f"RoundedCornerShape({corners})"
+        radius = node.get("cornerRadius") or (radii[0] if isinstance(radii, list) and radii else 0)
+        if radius:
+            self.use("RoundedCornerShape")
+            return f"RoundedCornerShape({self.dp(radius, 'radius')})"
+        return None
+
+    def check_common(self, node):
+        if any(_visible(effect) for effect in node.get("effects") or []):
+            raise UnsupportedNode(f"{_label(node)} has effects (shadow/blur)")
+        if abs(node.get("rotation") or 0) > 0.001:
+            raise UnsupportedNode(f"{_label(node)} is rotated")
+        if node.get("isMask"):
+            raise UnsupportedNode(f"{_label(node)} is a mask")
+        if node.get("blendMode", "PASS_THROUGH") not in DEFAULT_BLEND_MODES:
+            raise UnsupportedNode(f"{_label(node)} uses blend mode {node['blendMode']}")
+        if node.get("individualStrokeWeights") or node.get("strokeDashes") or node.get("dashPattern"):
+            raise UnsupportedNode(f"{_label(node)} has per-side or dashed strokes")
+        if node.get("layoutPositioning") == "ABSOLUTE":
+            raise UnsupportedNode(f"{_label(node)} is absolutely positioned")
+
+    # --- Modifiers ---
+
+    def _axis_sizing(self, node, horizontal, parent_mode):
+        explicit = node.get("layoutSizingHorizontal" if horizontal else "layoutSizingVertical")
+        if explicit:
+            return explicit
+        if parent_mode:
+            on_parent_primary = horizontal == (parent_mode == "HORIZONTAL")
+            if on_parent_primary and node.get("layoutGrow") == 1:
+                return "FILL"
+            if not on_parent_primary and node.get("layoutAlign") == "STRETCH":
+                return "FILL"
+        if node.get("type") == "TEXT":
+            auto_resize = node.get("textAutoResize") or (node.get("style") or {}).get("textAutoResize")
+            if auto_resize == "WIDTH_AND_HEIGHT" or (auto_resize == "HEIGHT" and not horizontal):
+                return "HUG"
+            return "FIXED"
+        if node.get("layoutMode") in ("HORIZONTAL", "VERTICAL"):
+            on_own_primary = horizontal == (node["layoutMode"] == "HORIZONTAL")
+            mode = node.get("primaryAxisSizingMode" if on_own_primary else "counterAxisSizingMode", "FIXED")
+            return "HUG" if mode == "AUTO" else "FIXED"
+        return "FIXED"
+
+    def size_modifiers(self, node, parent_mode):
+        box = node.get("absoluteBoundingBox") or {}
+        modifiers, fixed = [], {}
+        for horizontal, dimension in ((True, "width"), (False, "height")):
+            sizing = self._axis_sizing(node, horizontal, parent_mode)
+            if sizing == "FILL":
+                if parent_mode and horizontal == (parent_mode == "HORIZONTAL"):
+                    modifiers.append("weight(1f)")  # RowScope/ColumnScope, no import
+                else:
+                    fill = "fillMaxWidth" if horizontal else "fillMaxHeight"
+                    self.use(fill)
+                    modifiers.append(f"{fill}()")
+            elif sizing == "FIXED":
+                if not isinstance(box.get(dimension), (int, float)):
+                    raise UnsupportedNode(f"{_label(node)} has a fixed {dimension} but no bounding box")
+                fixed[dimension] = box[dimension]
+        if len(fixed) == 2:
+            self.use("size")
+            modifiers.append(f"size({self.dp(fixed['width'])}, {self.dp(fixed['height'])})")
+        else:
+            for dimension, value in fixed.items():
+                self.use(dimension)
+                modifiers.append(f"{dimension}({self.dp(value)})")
+        return modifiers
+
+    def decoration_modifiers(self, node, clip_content=False):
+        modifiers = []
+        opacity = node.get("opacity")
+        if opacity is not None and opacity < 1:
+            self.use("alpha")
+            modifiers.append(f"alpha({_number(opacity)}f)")
+        shape = self.shape(node)
+        if clip_content and shape:
+            self.use("clip")
+            modifiers.append(f"clip({shape})")
+        fill = self.paint(node, "fills")
+        if fill:
+            self.use("background")
+            modifiers.append(f"background({fill}, {shape})" if shape else f"background({fill})")
+        stroke = self.paint(node, "strokes")
+        weight = node.get("strokeWeight") or 0
+        if stroke and weight > 0:
+            if node.get("strokeAlign", "INSIDE") != "INSIDE":
+                raise UnsupportedNode(f"{_label(node)} has a {node['strokeAlign'].lower()} stroke")
+            self.use("border")
+            modifiers.append(f"border({self.dp(weight, 'stroke')}, {stroke}, {shape})" if shape else f"border({self.dp(weight, 'stroke')}, {stroke})")
+        return modifiers
+
+    def padding_modifier(self, node):
+        left, top, right, bottom = (node.get(key) or 0 for key in ("paddingLeft", "paddingTop", "paddingRight", "paddingBottom"))
+        if not any((left, top, right, bottom)):
+            return []
+        self.use("padding")
+        if left == top == right == bottom:
+            return [f"padding({self.dp(left, 'spacing')})"]
+        if left == right and top == bottom:
+            return [f"padding(horizontal = {self.dp(left, 'spacing')}, vertical = {self.dp(top, 'spacing')})"]
+        sides = ", ".join(f"{side} = {self.dp(value, 'spacing')}"
+                          for side, value in (("start", left), ("top", top), ("end", right), ("bottom", bottom)) if value)
+        return [f"padding({sides})"]
+
+    # --- Nodes ---
+
+    def modifier_argument(self, modifiers, is_root):
+        if not modifiers:
+            return ["modifier = modifier"] if is_root else []
+        base = "modifier" if is_root else "Modifier"
+        if len(modifiers) == 1:
+            return [f"modifier = {base}.{modifiers[0]}"]
+        return [f"modifier = {base}"] + [f"{INDENT}.{modifier}" for modifier in modifiers]
+
+    def call(self, name, arguments, indent, body=None):
+        """`name(arguments) { body }` as lines; each argument is a list of lines."""
+        self.use(name)
+        pad = INDENT * indent
+        if not arguments:
+            lines = [f"{pad}{name}()"] if body is None else [f"{pad}{name} {{"]
+        else:
+            lines = [f"{pad}{name}("]
+            for argument in arguments:
+                lines += [f"{pad}{INDENT}{line}" for line in argument[:-1]] + [f"{pad}{INDENT}{argument[-1]},"]
+            lines.append(f"{pad})" + (" {" if body is not None else ""))
+        if body is not None:
+            lines += body + [f"{pad}}}"]
+        return lines
+
+    def node(self, node, indent, parent_mode=None, is_root=False):
+        node_type = node.get("type")
+        self.check_common(node)
+        if node_type == "TEXT":
+            return self.text(node, indent, parent_mode, is_root)
+        if node_type in SHAPE_NODE_TYPES:
+            modifiers = self.size_modifiers(node, parent_mode) + self.decoration_modifiers(node)
+            return self.call("Box", [self.modifier_argument(modifiers, is_root)] if modifiers or is_root else [], indent)
+        if node_type in CONTAINER_NODE_TYPES:
+            return self.container(node, indent, parent_mode, is_root)
+        raise UnsupportedNode(f"{_label(node)} is not supported")
+
+    def container(self, node, indent, parent_mode, is_root):
+        children = [child for child in node.get("children") or [] if _visible(child)]
+        layout_mode = node.get("layoutMode") or "NONE"
+        if children and layout_mode not in ("HORIZONTAL", "VERTICAL"):
+            raise UnsupportedNode(f"{_label(node)} positions its children absolutely (no auto layout)")
+        if node.get("layoutWrap") == "WRAP":
+            raise UnsupportedNode(f"{_label(node)} wraps its children")
+        modifiers = (self.size_modifiers(node, parent_mode)
+                     + self.decoration_modifiers(node, clip_content=bool(children) and node.get("clipsContent"))
+                     + self.padding_modifier(node))
+        arguments = [self.modifier_argument(modifiers, is_root)] if modifiers or is_root else []
+        if not children:
+            return self.call("Box", arguments, indent)
+
+        row = layout_mode == "HORIZONTAL"
+        spacing = node.get("itemSpacing") or 0
+        if spacing < 0:
+            raise UnsupportedNode(f"{_label(node)} has negative item spacing (overlapping children)")
+        primary = node.get("primaryAxisAlignItems", "MIN")
+        counter = node.get("counterAxisAlignItems", "MIN")
+        if counter == "BASELINE":
+            raise UnsupportedNode(f"{_label(node)} aligns its children by baseline")
+        if primary == "SPACE_BETWEEN":
+            arrangement = "Arrangement.SpaceBetween"
+        elif spacing:
+            align = {"CENTER": "CenterHorizontally" if row else "CenterVertically", "MAX": "End" if row else "Bottom"}.get(primary)
+            if align:
+                self.use("Alignment")
+            arrangement = f"Arrangement.spacedBy({self.dp(spacing, 'spacing')}" + (f", Alignment.{align})" if align else ")")
+        else:
+            arrangement = {"CENTER": "Arrangement.Center", "MAX": "Arrangement.End" if row else "Arrangement.Bottom"}.get(primary)
+        if arrangement:
+            self.use("Arrangement")
+            arguments.append([f"{'horizontalArrangement' if row else 'verticalArrangement'} = {arrangement}"])
+        alignment = {"CENTER": "CenterVertically" if row else "CenterHorizontally", "MAX": "Bottom" if row else "End"}.get(counter)
+        if alignment:
+            self.use("Alignment")
+            arguments.append([f"{'verticalAlignment' if row else 'horizontalAlignment'} = Alignment.{alignment}"])
+
+        body = []
+        for child in children:
+            body += self.node(child, indent + 1, parent_mode=layout_mode)
+        return self.call("Row" if row else "Column", arguments, indent, body=body)
+
+    def text(self, node, indent, parent_mode, is_root):
+        style = node.get("style") or {}
+        if any(override for override in node.get("characterStyleOverrides") or []):
+            raise UnsupportedNode(f"{_label(node)} mixes text styles")
+        if any(_visible(stroke) for stroke in node.get("strokes") or []):
+            raise UnsupportedNode(f"{_label(node)} has outlined text")
+        if style.get("textAlignVertical", "TOP") != "TOP":
+            raise UnsupportedNode(f"{_label(node)} is vertically aligned inside a fixed box")
+        text_case = style.get("textCase", "ORIGINAL")
+        characters = node.get("characters") or ""
+        if text_case == "UPPER":
+            characters = characters.upper()
+        elif text_case == "LOWER":
+            characters = characters.lower()
+        elif text_case != "ORIGINAL":
+            raise UnsupportedNode(f"{_label(node)} uses text case {text_case}")
+
+        modifiers = self.size_modifiers(node, parent_mode) + self.decoration_modifiers(
+            {key: value for key, value in node.items() if key not in ("fills", "strokes")})
+        arguments = [[f"text = {kotlin_string(characters)}"]]
+        modifier_argument = self.modifier_argument(modifiers, is_root)
+        if modifier_argument:
+            arguments.append(modifier_argument)
+        color = self.paint(node, "fills")
+        if color:
+            arguments.append([f"color = {color}"])
+
+        extras = []
+        if style.get("italic"):
+            self.use("FontStyle")
+            extras.append("fontStyle = FontStyle.Italic")
+        if style.get("textDecoration") in TEXT_DECORATIONS:
+            self.use("TextDecoration")
+            extras.append(f"textDecoration = TextDecoration.{TEXT_DECORATIONS[style['textDecoration']]}")
+        comment = []
+        token = self.token(SYMBOL_TYPOGRAPHY, {"fontSize": style.get("fontSize"), "fontWeight": style.get("fontWeight")})
+        if token:
+            arguments.append([f"style = {token}.copy({', '.join(extras)})" if extras else f"style = {token}"])
+        elif style.get("fontSize"):
+            self.use("TextStyle")
+            fields = [f"fontSize = {self.sp(style['fontSize'])}"]
+            weight = style.get("fontWeight")
+            if weight and weight != 400:
+                self.use("FontWeight")
+                fields.append(f"fontWeight = FontWeight.{FONT_WEIGHT_NAMES[weight]}" if weight in FONT_WEIGHT_NAMES
+                              else f"fontWeight = FontWeight({int(weight)})")
+            if style.get("lineHeightPx") and style.get("lineHeightUnit") != "INTRINSIC_%":
+                fields.append(f"lineHeight = {self.sp(style['lineHeightPx'])}")
+            if style.get("letterSpacing"):
+                fields.append(f"letterSpacing = {self.sp(style['letterSpacing'])}")
+            arguments.append(["style = TextStyle("] + [f"{INDENT}{field}," for field in fields + extras] + [")"])
+            if style.get("fontFamily"):
+                comment = [f"{INDENT * indent}// Figma font family '{style['fontFamily']}' has no matching text style in common/; using the default font."]
+        if style.get("textAlignHorizontal", "LEFT") != "LEFT" and style["textAlignHorizontal"] in TEXT_ALIGNS:
+            self.use("TextAlign")
+            arguments.append([f"textAlign = TextAlign.{TEXT_ALIGNS[style['textAlignHorizontal']]}"])
+        if node.get("maxLines") or style.get("maxLines"):
+            arguments.append([f"maxLines = {int(node.get('maxLines') or style['maxLines'])}"])
+        if (node.get("textTruncation") or style.get("textTruncation")) == "ENDING":
+            self.use("TextOverflow")
+            arguments.append(["overflow = TextOverflow.Ellipsis"])
+        return comment + self.call("Text", arguments, indent)
+
+
+def emit_compose(nodes_response, symbols=(), max_nodes=RULE_BASED_MAX_NODES):
+    """Kotlin source for the root node of a /nodes response. Raises UnsupportedNode if any visible node is not simple."""
+    node_id, entry = root_document(nodes_response)
+    if not entry:
+        raise UnsupportedNode("no node document in the response")
+    document = entry["document"]
+    node_count = count_visible_nodes(document)
+    if node_count > max_nodes:
+        raise UnsupportedNode(f"{node_count} visible nodes (the fast path handles up to {max_nodes})")
+    emitter = _Emitter(list(symbols))
+    name = composable_name(document.get("name"), set(), fallback="Frame")
+    body = emitter.node(document, 1, is_root=True)
+    lines = [f"import {path}" for path in sorted(emitter.imports)]
+    lines += ["", f"// Generated from Figma node '{document.get('name', '')}' ({node_id}) by the rule-based fast path.",
+              "@Composable", f"fun {name}(modifier: Modifier = Modifier) {{"] + body + ["}", "",
+              "@Preview", "@Composable", f"fun {name}Preview() {{", f"{INDENT}{name}()", "}", ""]
+    return "\n".join(lines)
+
+
+def try_rule_based_compose(nodes_response, symbols=(), max_nodes=RULE_BASED_MAX_NODES):
+    """Returns (code, None), or (None, reason) when the node needs the model."""
+    try:
+        return emit_compose(nodes_response, symbols, max_nodes), None
+    except UnsupportedNode as e:
+        return None, str(e)
+
+
+def rule_based_sse(code):
+    """Streams emitted code using the same event protocol as a live generation."""
+    yield sse_info(f"Generated locally by the rule-based fast path ({len(code):,} chars, no Gemini call). "
+                   f"Use 'Force regenerate' to ask Gemini instead.")
+    yield from sse_code_chunks(code)
+    yield sse_end()
@@ -0,0 +1,33 @@
+"""SQLite connections for the on-disk stores (figma_cache, generation_cache, result_store, rate_limit, ...).
+
+Every store opens a short-lived connection per operation, so several worker
+processes can share one database file. connect_sqlite wraps that pattern:
+WAL mode, a busy timeout, one transaction per `with` block, and the
+connection closed when the block ends rather than whenever it is collected.
+"""
+import sqlite3
+import contextlib
+
+# --- Configuration ---
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+
+
+@contextlib.contextmanager
+def connect_sqlite(db_path, immediate=False):
+    """
+    Yields a connection to `db_path` inside one transaction: committed if the block succeeds, rolled back if it
+    raises, and closed either way. `immediate` takes the write lock up front (for read-modify-write blocks).
+    """
+    db = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield db
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+    finally:
+        db.close()
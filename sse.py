@@ -0,0 +1,143 @@
+"""Helpers for the text/event-stream protocol shared by every generation path.
+
+Events are single `data:` lines. Code chunks have their newlines escaped as
+a literal backslash-n, which the browser turns back into newlines. Control
+messages start with [INFO], [ERROR], [RESYNC] or [STREAM_END]. [RESYNC]
+tells the client to drop the code it has accumulated because the code so
+far is about to be re-sent in full.
+
+How events reach a viewer is set by an EmissionPolicy. Consecutive code
+chunks are coalesced into one frame, and a viewer gets at most one write
+per window. An SSE comment is sent as a heartbeat while a stream is idle,
+so proxies do not time it out.
+"""
+import os
+
+# --- Configuration ---
+CODE_CHUNK_CHARS = 1024
+SSE_COALESCE_MAX_BYTES_ENV_VAR = "SSE_COALESCE_MAX_BYTES"
+SSE_COALESCE_WINDOW_MS_ENV_VAR = "SSE_COALESCE_WINDOW_MS"
+SSE_HEARTBEAT_SECONDS_ENV_VAR = "SSE_HEARTBEAT_SECONDS"
+DEFAULT_COALESCE_MAX_BYTES = 16 * 1024
+DEFAULT_COALESCE_WINDOW_MS = 50
+DEFAULT_HEARTBEAT_SECONDS = 15
+
+STREAM_END = "[STREAM_END]"
+INFO_PREFIX = "[INFO]"
+ERROR_PREFIX = "[ERROR]"
+RESYNC = "[RESYNC]"
+# A comment line: keeps the connection alive, ignored by EventSource.
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def _env_number(env_var, default):
+    try:
+        return float(os.environ.get(env_var) or default)
+    except ValueError:
+        return float(default)
+
+
+class EmissionPolicy:
+    """
+    How job events are written to a viewer. Code chunks are merged up to max_bytes per frame (0 sends every
+    chunk as its own frame). After a write the viewer waits window_seconds so that more events accumulate
+    (0 writes as soon as anything arrives). A heartbeat is sent after heartbeat_seconds of silence (0 disables it).
+    Unset values come from the environment, then the defaults.
+    """
+
+    def __init__(self, max_bytes=None, window_seconds=None, heartbeat_seconds=None):
+        self.max_bytes = int(max_bytes if max_bytes is not None
+                             else _env_number(SSE_COALESCE_MAX_BYTES_ENV_VAR, DEFAULT_COALESCE_MAX_BYTES))
+        self.window_seconds = float(window_seconds if window_seconds is not None
+                                    else _env_number(SSE_COALESCE_WINDOW_MS_ENV_VAR, DEFAULT_COALESCE_WINDOW_MS) / 1000.0)
+        self.heartbeat_seconds = float(heartbeat_seconds if heartbeat_seconds is not None
+                                       else _env_number(SSE_HEARTBEAT_SECONDS_ENV_VAR, DEFAULT_HEARTBEAT_SECONDS))
+
+    @property
+    def heartbeat_timeout(self):
+        """Seconds to wait for events before sending a heartbeat, or None to wait indefinitely."""
+        return self.heartbeat_seconds if self.heartbeat_seconds > 0 else None
+
+
+def sse_data(text):
+    """One SSE event carrying a chunk of generated code."""
+    return f"data: {text.replace(chr(10), chr(92) + 'n')}\n\n"
+
+
+def sse_info(message):
+    return f"data: {INFO_PREFIX} {message}\n\n"
+
+
+def sse_info_events(message_generator):
+    """Re-yields a generator's messages as [INFO] events and returns the generator's return value."""
+    while True:
+        try:
+            message = next(message_generator)
+        except StopIteration as stop:
+            return stop.value
+        yield sse_info(message)
+
+
+def sse_error(message):
+    return f"data: {ERROR_PREFIX} {message}\n\n"
+
+
+def sse_resync():
+    return f"data: {RESYNC}\n\n"
+
+
+def sse_end():
+    return f"data: {STREAM_END}\n\n"
+
+
+def sse_code_chunks(code, chunk_chars=CODE_CHUNK_CHARS):
+    """Splits finished code into SSE chunk events."""
+    for i in range(0, len(code), chunk_chars):
+        yield sse_data(code[i:i + chunk_chars])
+
+
+def event_payload(event):
+    """The payload of a `data: ...` event string (without the trailing blank line)."""
+    if event.startswith("data: "):
+        event = event[len("data: "):]
+    return event.rstrip("\n")
+
+
+def decode_code_chunk(payload):
+    """Inverse of sse_data for a payload that is not a control message."""
+    return payload.replace(chr(92) + 'n', chr(10))
+
+
+def is_control_payload(payload):
+    return payload.startswith((INFO_PREFIX, ERROR_PREFIX, RESYNC, STREAM_END))
+
+
+def _merge_code_events(run):
+    """One (event_id, event) for a run of code events: the last id, and the chunks joined."""
+    if len(run) == 1:
+        return run[0]
+    return run[-1][0], sse_data("".join(decode_code_chunk(event_payload(event)) for _, event in run))
+
+
+def coalesce_events(events, max_bytes):
+    """
+    Merges runs of consecutive code events in a list of (event_id, event) into single events of up to
+    `max_bytes` of payload, each carrying the id of its last event. Control events are never merged.
+    """
+    if max_bytes <= 0:
+        return list(events)
+    merged, run, run_size = [], [], 0
+    for event_id, event in events:
+        payload = event_payload(event)
+        control = is_control_payload(payload)
+        if run and (control or run_size + len(payload) > max_bytes):
+            merged.append(_merge_code_events(run))
+            run, run_size = [], 0
+        if control:
+            merged.append((event_id, event))
+        else:
+            run.append((event_id, event))
+            run_size += len(payload)
+    if run:
+        merged.append(_merge_code_events(run))
+    return merged
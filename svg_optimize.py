@@ -0,0 +1,292 @@
+"""Shrinks a Figma SVG export before it is inlined into a prompt.
+
+Figma SVGs carry a lot that does not help the model: editor metadata,
+layer-name ids, many-decimal coordinates in long path data, wrapper groups
+and duplicated gradient/filter definitions. optimize_svg runs these passes:
+  - strip metadata and foreign-namespace attributes
+  - round numbers
+  - merge identical defs
+  - drop unreferenced ids
+  - collapse redundant groups
+The result is minified. If it is still over a byte cap, the fallbacks are
+first whole-pixel precision, then a summary: long path data is dropped and
+the elements that fit the cap are kept, under a comment describing what
+was left out. The optimized SVG is only used for the prompt; the raw export
+stays the job's image.
+"""
+import re
+import copy
+import xml.etree.ElementTree as ET
+
+from figma_compact import compaction_report
+
+# --- Configuration ---
+DEFAULT_COORDINATE_PRECISION = 1
+DEFAULT_SVG_MAX_BYTES = 100 * 1024
+SUMMARY_PATH_DATA_CHARS = 200
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+KEPT_NAMESPACES = (SVG_NS, XLINK_NS)
+DROP_ELEMENTS = frozenset(["metadata", "title", "desc"])
+NUMERIC_ATTRIBUTES = frozenset([
+    "d", "points", "transform", "gradientTransform", "patternTransform", "viewBox",
+    "x", "y", "width", "height", "rx", "ry", "cx", "cy", "r", "fx", "fy", "x1", "y1", "x2", "y2",
+    "dx", "dy", "stdDeviation", "stroke-width", "font-size", "letter-spacing",
+])
+DEFAULT_ATTRIBUTE_VALUES = {
+    "opacity": "1", "fill-opacity": "1", "stroke-opacity": "1", "fill-rule": "nonzero",
+    "stroke-miterlimit": "4", "stroke-dashoffset": "0",
+}
+# Group attributes that apply in the group's coordinate system: not movable onto a transformed child.
+GROUP_SPACE_ATTRIBUTES = frozenset(["clip-path", "mask", "filter"])
+REUSABLE_ELEMENTS = frozenset(["linearGradient", "radialGradient", "filter", "clipPath", "mask", "pattern", "symbol"])
+TEXT_ELEMENTS = frozenset(["text", "tspan", "style", "textPath"])
+
+STRATEGY_OPTIMIZED = "optimized"
+STRATEGY_REDUCED_PRECISION = "reduced_precision"
+STRATEGY_SUMMARIZED = "summarized"
+STRATEGY_UNCHANGED = "unchanged"
+
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+_NUMBER_OR_OTHER_RE = re.compile(r"(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|([^-.\d]+|[-.])")
+_ARC_COMMAND_RE = re.compile(r"[aA]")
+_ID_REFERENCE_RE = re.compile(r"url\(#([^)]+)\)")
+_HREF_ATTRIBUTES = ("href", f"{{{XLINK_NS}}}href")
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else tag
+
+
+def _namespace(name):
+    return name[1:].split("}", 1)[0] if name.startswith("{") else None
+
+
+def _format_number(value, precision):
+    rounded = round(value, precision)
+    if rounded == int(rounded):
+        return str(int(rounded))
+    return f"{rounded:.{precision}f}".rstrip("0").rstrip(".")
+
+
+def round_numbers(text, precision):
+    """Rounds every number in an attribute value (path data, transforms, lists) without merging adjacent numbers."""
+    parts, previous_was_number = [], False
+    for number, other in _NUMBER_OR_OTHER_RE.findall(text):
+        if number:
+            formatted = _format_number(float(number), precision)
+            if previous_was_number and not formatted.startswith("-"):
+                parts.append(" ")
+            parts.append(formatted)
+            previous_was_number = True
+        else:
+            parts.append(other)
+            previous_was_number = False
+    return "".join(parts)
+
+
+def _strip(element, precision):
+    """Drops metadata elements, foreign attributes, default values and whitespace; rounds numbers."""
+    for child in list(element):
+        if not isinstance(child.tag, str) or _local(child.tag) in DROP_ELEMENTS or _namespace(child.tag) not in KEPT_NAMESPACES:
+            element.remove(child)
+            continue
+        _strip(child, precision)
+    for name, value in list(element.attrib.items()):
+        namespace = _namespace(name)
+        if namespace is not None and namespace not in KEPT_NAMESPACES:
+            del element.attrib[name]
+        elif DEFAULT_ATTRIBUTE_VALUES.get(name) == value.strip():
+            del element.attrib[name]
+        elif name in NUMERIC_ATTRIBUTES and not (name == "d" and _ARC_COMMAND_RE.search(value)):
+            # Arc flags may be written without separators ("0110"), which a number tokenizer would misread.
+            element.attrib[name] = round_numbers(value, precision)
+    if _local(element.tag) not in TEXT_ELEMENTS:
+        if element.text is not None and not element.text.strip():
+            element.text = None
+    if element.tail is not None and not element.tail.strip():
+        element.tail = None
+
+
+def _references(root):
+    """Every id referenced through url(#id) or href="#id"."""
+    referenced = set()
+    for element in root.iter():
+        for name, value in element.attrib.items():
+            referenced.update(_ID_REFERENCE_RE.findall(value))
+            if name in _HREF_ATTRIBUTES and value.startswith("#"):
+                referenced.add(value[1:])
+        if _local(element.tag) == "style" and element.text:
+            referenced.update(_ID_REFERENCE_RE.findall(element.text))
+    return referenced
+
+
+def _rewrite_references(root, replacements):
+    def replace_url(match):
+        return f"url(#{replacements.get(match.group(1), match.group(1))})"
+
+    for element in root.iter():
+        for name, value in list(element.attrib.items()):
+            if "url(#" in value:
+                element.attrib[name] = _ID_REFERENCE_RE.sub(replace_url, value)
+            elif name in _HREF_ATTRIBUTES and value.startswith("#") and value[1:] in replacements:
+                element.attrib[name] = "#" + replacements[value[1:]]
+
+
+def dedupe_definitions(root):
+    """Removes gradients/filters/clip paths identical to an earlier one and points references at the first. Returns the count."""
+    first_by_signature, replacements = {}, {}
+    for parent in list(root.iter()):
+        for child in list(parent):
+            if _local(child.tag) not in REUSABLE_ELEMENTS or "id" not in child.attrib:
+                continue
+            anonymous = copy.deepcopy(child)
+            del anonymous.attrib["id"]
+            anonymous.tail = None
+            signature = ET.tostring(anonymous, encoding="unicode")
+            first_id = first_by_signature.setdefault(signature, child.attrib["id"])
+            if first_id != child.attrib["id"]:
+                replacements[child.attrib["id"]] = first_id
+                parent.remove(child)
+    if replacements:
+        _rewrite_references(root, replacements)
+    return len(replacements)
+
+
+def strip_unreferenced_ids(root):
+    referenced = _references(root)
+    for element in root.iter():
+        if "id" in element.attrib and element.attrib["id"] not in referenced:
+            del element.attrib["id"]
+
+
+def collapse_groups(element):
+    """Unwraps attribute-less groups, merges single-child groups into their child and drops empty groups."""
+    index = 0
+    while index < len(element):
+        child = element[index]
+        collapse_groups(child)
+        if _local(child.tag) != "g":
+            index += 1
+            continue
+        if len(child) == 0:
+            element.remove(child)
+            continue
+        if not child.attrib:
+            element.remove(child)
+            for offset, grandchild in enumerate(list(child)):
+                element.insert(index + offset, grandchild)
+            continue
+        only_child = child[0] if len(child) == 1 else None
+        if only_child is not None and "id" not in child.attrib and \
+                not set(child.attrib) & set(only_child.attrib) and \
+                not ("transform" in only_child.attrib and set(child.attrib) & GROUP_SPACE_ATTRIBUTES):
+            only_child.attrib.update(child.attrib)
+            element.remove(child)
+            element.insert(index, only_child)
+            continue
+        index += 1
+
+
+def _drop_empty_defs(root):
+    for parent in list(root.iter()):
+        for child in list(parent):
+            if _local(child.tag) == "defs" and len(child) == 0:
+                parent.remove(child)
+
+
+def _serialize(root):
+    # ElementTree escapes '>' in attribute values and text, so " />" only occurs at the end of an empty tag.
+    return ET.tostring(root, encoding="unicode", short_empty_elements=True).replace(" />", "/>")
+
+
+def _optimized_tree(root, precision):
+    root = copy.deepcopy(root)
+    _strip(root, precision)
+    deduped = dedupe_definitions(root)
+    strip_unreferenced_ids(root)
+    collapse_groups(root)
+    _drop_empty_defs(root)
+    return root, deduped
+
+
+def _element_counts(root):
+    counts = {}
+    for element in root.iter():
+        tag = _local(element.tag)
+        counts[tag] = counts.get(tag, 0) + 1
+    return counts
+
+
+def summarize_svg(root, max_bytes):
+    """A summary SVG under max_bytes: long path data dropped, then only the leading top-level elements kept."""
+    summary = copy.deepcopy(root)
+    dropped_paths = 0
+    for parent in list(summary.iter()):
+        for child in list(parent):
+            if _local(child.tag) == "path" and len(child.attrib.get("d", "")) > SUMMARY_PATH_DATA_CHARS:
+                parent.remove(child)
+                dropped_paths += 1
+    collapse_groups(summary)
+
+    # defs first, so the elements that fit can still resolve their gradients, filters and clip paths
+    kept = sorted(summary, key=lambda child: _local(child.tag) != "defs")
+    for child in kept:
+        summary.remove(child)
+    colors = sorted({value for element in root.iter() for name, value in element.attrib.items()
+                     if name in ("fill", "stroke", "stop-color") and value.startswith("#")})
+    counts = ", ".join(f"{count} {tag}" for tag, count in sorted(_element_counts(root).items()) if tag != "svg")
+
+    def note(kept_count):
+        dropped_elements = len(kept) - kept_count
+        return ET.Comment(f" Summarized to fit {max_bytes:,} bytes. Original: {counts}. Colors: {', '.join(colors[:24])}. "
+                          f"Omitted: {dropped_paths} long path(s), {dropped_elements} trailing top-level element(s). ")
+
+    summary.append(note(len(kept)))
+    size = len(_serialize(summary).encode("utf-8"))
+    kept_count = 0
+    for child in kept:
+        child_size = len(ET.tostring(child, encoding="unicode").encode("utf-8"))
+        if size + child_size > max_bytes:
+            break
+        summary.append(child)
+        size += child_size
+        kept_count += 1
+    summary[0] = note(kept_count)
+    return summary
+
+
+def optimize_svg(svg_text, precision=DEFAULT_COORDINATE_PRECISION, max_bytes=DEFAULT_SVG_MAX_BYTES):
+    """
+    Returns (optimized_svg_str, report). The report has compaction_report's byte/token fields plus `strategy`
+    (optimized, reduced_precision, summarized, or unchanged if the SVG could not be parsed) and `defs_merged`.
+    """
+    before_bytes = len(svg_text.encode("utf-8"))
+    try:
+        if "<!ENTITY" in svg_text:
+            raise ValueError("SVG with entity declarations")
+        root = ET.fromstring(svg_text)
+    except (ET.ParseError, ValueError) as e:
+        report = compaction_report(before_bytes, svg_text)
+        report.update(strategy=STRATEGY_UNCHANGED, defs_merged=0, error=str(e))
+        return svg_text, report
+
+    tree, deduped = _optimized_tree(root, precision)
+    optimized, strategy = _serialize(tree), STRATEGY_OPTIMIZED
+    if max_bytes and len(optimized.encode("utf-8")) > max_bytes and precision > 0:
+        tree, deduped = _optimized_tree(root, 0)
+        optimized, strategy = _serialize(tree), STRATEGY_REDUCED_PRECISION
+    if max_bytes and len(optimized.encode("utf-8")) > max_bytes:
+        optimized, strategy = _serialize(summarize_svg(tree, max_bytes)), STRATEGY_SUMMARIZED
+    report = compaction_report(before_bytes, optimized)
+    report.update(strategy=strategy, defs_merged=deduped)
+    return optimized, report
+
+
+def format_svg_report(report):
+    strategy = "" if report["strategy"] == STRATEGY_OPTIMIZED else f", {report['strategy'].replace('_', ' ')}"
+    return (f"SVG optimized for the prompt: {report['before_bytes']:,} -> {report['after_bytes']:,} bytes "
+            f"(~{report['before_tokens']:,} -> ~{report['after_tokens']:,} tokens, {report['saved_percent']:.0f}% smaller{strategy})")
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from asset_export import export_assets, AssetExportError, ASSET_MANIFEST_FILENAME
+from figma_client import FigmaClient, FigmaAPIError
+from rate_limit import RATE_LIMIT_DB_PATH_ENV_VAR
+from stub_figma import StubFigmaServer, file_key_for
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    monkeypatch.setenv(RATE_LIMIT_DB_PATH_ENV_VAR, str(tmp_path / "rate_limits.sqlite3"))
+    server = StubFigmaServer().start()
+    yield server
+    server.stop()
+
+
+class RenderingDownClient(FigmaClient):
+    def get_image_urls(self, *args, **kwargs):
+        raise FigmaAPIError("Figma API Error: 500 Internal Server Error")
+
+
+def exported_files(output_dir):
+    return sorted(os.path.relpath(os.path.join(root, name), output_dir)
+                  for root, _, names in os.walk(output_dir) for name in names)
+
+
+def test_a_narrower_export_replaces_the_previous_one(stub, tmp_path):
+    client = FigmaClient("token", base_url=stub.base_url)
+    file_key = file_key_for("small")
+    nodes_response = client.get_file_nodes(file_key, "1:2")
+    output_dir = str(tmp_path / "assets")
+    export_assets(client, file_key, nodes_response, output_dir, "png@1x,png@2x")
+
+    assets, export, warnings = export_assets(client, file_key, nodes_response, output_dir, "png@1x")
+    assert assets and not warnings
+    assert all(path.startswith(output_dir) and os.path.exists(path) for path in export.files)
+    assert not any(path.startswith("drawable-xhdpi") for path in exported_files(output_dir))
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".assets.")]
+
+
+def test_a_failed_export_keeps_the_previous_one(stub, tmp_path):
+    client = FigmaClient("token", base_url=stub.base_url)
+    file_key = file_key_for("small")
+    nodes_response = client.get_file_nodes(file_key, "1:2")
+    output_dir = str(tmp_path / "assets")
+    export_assets(client, file_key, nodes_response, output_dir, "png@1x")
+    before = exported_files(output_dir)
+    with open(os.path.join(output_dir, ASSET_MANIFEST_FILENAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    with pytest.raises(AssetExportError, match="500"):
+        export_assets(RenderingDownClient("token", base_url=stub.base_url), file_key, nodes_response, output_dir,
+                      "png@1x,svg")
+    assert exported_files(output_dir) == before
+    with open(os.path.join(output_dir, ASSET_MANIFEST_FILENAME), encoding="utf-8") as f:
+        assert json.load(f) == manifest
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".assets.")]
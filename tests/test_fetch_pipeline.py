@@ -0,0 +1,58 @@
+import pytest
+
+from fetch_pipeline import run_batch_fetch_pipeline, CACHE_STATUS_MISS, CACHE_STATUS_REFRESHED
+from figma_cache import FigmaCache
+from figma_client import FigmaClient
+from rate_limit import RATE_LIMIT_DB_PATH_ENV_VAR
+from sqlite_store import connect_sqlite
+from stub_figma import StubFigmaServer, file_key_for
+
+NODE_IDS = ["1:2", "3:4"]
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    monkeypatch.setenv(RATE_LIMIT_DB_PATH_ENV_VAR, str(tmp_path / "rate_limits.sqlite3"))
+    server = StubFigmaServer().start()
+    yield server
+    server.stop()
+
+
+def targets(tmp_path, prefix):
+    return [(node_id, str(tmp_path / f"{prefix}{i}.json"), str(tmp_path / f"{prefix}{i}.svg"))
+            for i, node_id in enumerate(NODE_IDS)]
+
+
+def make_stale(cache, **columns):
+    assignments = ", ".join(f"{column}=?" for column in columns)
+    with connect_sqlite(cache.db_path) as db:
+        db.execute(f"UPDATE entries SET {assignments}, validated_at=0", tuple(columns.values()))
+
+
+def test_stale_batch_entries_reuse_images_when_the_node_is_unchanged(stub, tmp_path):
+    client = FigmaClient("token", base_url=stub.base_url)
+    cache = FigmaCache(str(tmp_path / "cache"))
+    file_key = file_key_for("small")
+    first = run_batch_fetch_pipeline(client, file_key, targets(tmp_path, "a"), "svg", cache=cache)
+    assert [result.cache_status for result in first.results] == [CACHE_STATUS_MISS] * 2
+
+    make_stale(cache, version="old")
+    requests = stub.requests
+    batch = run_batch_fetch_pipeline(client, file_key, targets(tmp_path, "b"), "svg", cache=cache)
+    assert [result.cache_status for result in batch.results] == [CACHE_STATUS_REFRESHED] * 2
+    assert all(result.image_path and not result.image_error for result in batch.results)
+    assert stub.requests - requests == 2  # the version check and /nodes; no /images call, no download
+
+
+def test_stale_batch_entries_render_again_when_the_node_changed(stub, tmp_path):
+    client = FigmaClient("token", base_url=stub.base_url)
+    cache = FigmaCache(str(tmp_path / "cache"))
+    file_key = file_key_for("small")
+    run_batch_fetch_pipeline(client, file_key, targets(tmp_path, "a"), "svg", cache=cache)
+
+    make_stale(cache, version="old", node_hash="changed")
+    requests = stub.requests
+    batch = run_batch_fetch_pipeline(client, file_key, targets(tmp_path, "b"), "svg", cache=cache)
+    assert [result.cache_status for result in batch.results] == [CACHE_STATUS_REFRESHED] * 2
+    assert all(result.image_path and not result.image_error for result in batch.results)
+    assert stub.requests - requests == 5  # the version check, /nodes, /images and two downloads
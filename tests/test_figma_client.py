@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from figma_client import ConnectionPool, FigmaAPIError, FigmaClient, extract_figma_error
+from rate_limit import Reservation
+
+CDN_BODY = b"\x89PNG" + b"x" * 5000
+
+
+class RecordingLimiter:
+    """Grants every slot at once and records the pauses a Retry-After asks for."""
+
+    def __init__(self):
+        self.pauses = []
+
+    def reserve(self, key, rate_per_minute):
+        return Reservation(0, 0)
+
+    def pause(self, key, seconds):
+        self.pauses.append(seconds)
+
+
+class FigmaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.client_address[1], self.headers.get("X-Figma-Token")))
+        if self.path.startswith("/v1/ok"):
+            self._send(200, json.dumps({"path": self.path}).encode())
+        elif self.path == "/v1/err":
+            self._send(403, json.dumps({"status": 403, "err": "Invalid token"}).encode())
+        elif self.path == "/v1/message":
+            self._send(404, json.dumps({"status": 404, "message": "Not found"}).encode())
+        elif self.path == "/v1/limited":
+            server.limited_calls += 1
+            if server.limited_calls <= 2:
+                self._send(429, b'{"status":429,"err":"Rate limit exceeded"}', headers=[("Retry-After", "7")])
+            else:
+                self._send(200, b'{"ok":true}')
+        elif self.path == "/v1/unavailable":
+            server.unavailable_calls += 1
+            if server.unavailable_calls <= 1:
+                self._send(503, b"upstream unavailable", content_type="text/plain")
+            else:
+                self._send(200, b'{"ok":true}')
+        elif self.path == "/v1/redirect":
+            self.send_response(302)
+            self.send_header("Location", f"http://localhost:{server.server_port}/cdn/image.png")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/cdn/image.png":
+            self._send(200, CDN_BODY, content_type="image/png")
+        elif self.path == "/cdn/truncated.png":
+            self.send_response(200)
+            self.send_header("Content-Length", "100000")
+            self.end_headers()
+            self.wfile.write(b"x" * 10)
+            self.wfile.flush()
+            self.close_connection = True
+        else:
+            self._send(404, b"no route", content_type="text/plain")
+
+
+@pytest.fixture
+def figma_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FigmaHandler)
+    server.requests = []
+    server.limited_calls = 0
+    server.unavailable_calls = 0
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(figma_server):
+    pool = ConnectionPool()
+    client = FigmaClient("test-token", base_url=f"http://127.0.0.1:{figma_server.server_port}", pool=pool,
+                         rate_limiter=RecordingLimiter(), max_retries=3)
+    client.waits = []
+    client._wait = client.waits.append
+    yield client
+    pool.close()
+
+
+def test_requests_reuse_the_pooled_connection(client, figma_server):
+    assert client.get_json("/v1/ok/1") == {"path": "/v1/ok/1"}
+    assert client.get_json("/v1/ok/2") == {"path": "/v1/ok/2"}
+    ports = {port for _, port, _ in figma_server.requests}
+    assert len(ports) == 1
+
+
+def test_redirect_to_another_host_drops_the_token(client, figma_server, tmp_path):
+    output_path = tmp_path / "image.png"
+    written = client.download_to_file(client.api_url("/v1/redirect"), str(output_path))
+    assert written == len(CDN_BODY)
+    assert output_path.read_bytes() == CDN_BODY
+    tokens = {path: token for path, _, token in figma_server.requests}
+    assert tokens == {"/v1/redirect": None, "/cdn/image.png": None}
+
+    with client.open(client.api_url("/v1/redirect")) as resp:
+        assert resp.read() == CDN_BODY
+    (api_path, _, api_token), (cdn_path, _, cdn_token) = figma_server.requests[-2:]
+    assert (api_path, api_token) == ("/v1/redirect", "test-token")
+    assert (cdn_path, cdn_token) == ("/cdn/image.png", None)
+
+
+@pytest.mark.parametrize("path, status, message", [
+    ("/v1/err", 403, "Figma API: Invalid token"),
+    ("/v1/message", 404, "Figma API: Not found"),
+])
+def test_error_bodies_surface_err_or_message(client, path, status, message):
+    with pytest.raises(FigmaAPIError) as excinfo:
+        client.get_json(path)
+    assert excinfo.value.status == status
+    assert str(excinfo.value) == message
+
+
+def test_extract_figma_error_falls_back_to_the_raw_text():
+    assert extract_figma_error('{"err": "Bad ids"}') == "Bad ids"
+    assert extract_figma_error('{"message": "Gone"}') == "Gone"
+    assert extract_figma_error(" <html>502</html> ") == "<html>502</html>"
+    assert extract_figma_error('["not", "a", "dict"]') == '["not", "a", "dict"]'
+    assert extract_figma_error(None) == ""
+
+
+def test_429_waits_out_retry_after_through_the_rate_limiter(client, figma_server):
+    assert client.get_json("/v1/limited") == {"ok": True}
+    assert figma_server.limited_calls == 3
+    assert client.rate_limiter.pauses == [7.0, 7.0]
+    assert client.waits == []
+
+
+def test_5xx_without_retry_after_backs_off_and_retries(client, figma_server):
+    assert client.get_json("/v1/unavailable") == {"ok": True}
+    assert figma_server.unavailable_calls == 2
+    assert len(client.waits) == 1 and client.waits[0] > 0
+
+
+def test_retries_give_up_after_max_retries(client, figma_server):
+    client.max_retries = 1
+    with pytest.raises(FigmaAPIError) as excinfo:
+        client.get_json("/v1/limited")
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == 7.0
+    assert figma_server.limited_calls == 2
+
+
+def test_failed_download_removes_the_part_file(client, figma_server, tmp_path):
+    output_path = tmp_path / "image.png"
+    with pytest.raises(FigmaAPIError, match="byte"):
+        client.download_to_file(client.api_url("/cdn/truncated.png"), str(output_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_status_leaves_no_file(client, tmp_path):
+    output_path = tmp_path / "missing.png"
+    with pytest.raises(FigmaAPIError) as excinfo:
+        client.download_to_file(client.api_url("/cdn/missing.png"), str(output_path))
+    assert excinfo.value.status == 404
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,158 @@
+import threading
+
+from generation_jobs import GenerationJob, GenerationJobManager, job_events_sse
+from sse import (sse_data, sse_info, sse_error, sse_end, sse_resync, event_payload, decode_code_chunk, is_control_payload,
+                 STREAM_END)
+
+
+def code_of(events):
+    return "".join(decode_code_chunk(event_payload(event)) for _, event in events
+                   if not is_control_payload(event_payload(event)))
+
+
+def finished_job(buffer_events=16):
+    job = GenerationJob("job", buffer_events=buffer_events)
+    job.append(sse_info("starting"))
+    for part in ["package a\n", "fun A() {\n", "}\n", "// end\n", "\n"]:
+        job.append(sse_data(part))
+    job.append(sse_end())
+    return job
+
+
+def test_viewer_resumes_after_last_event_id():
+    job = finished_job()
+    events = list(job.events_after(0))
+    assert [event_id for event_id, _ in events] == list(range(1, 8))
+    assert code_of(events) == "package a\nfun A() {\n}\n// end\n\n"
+
+    resumed = list(job.events_after(3))
+    assert resumed == events[3:]
+    assert list(job.events_after(7)) == []
+
+
+def test_viewer_behind_the_ring_buffer_gets_a_resync():
+    job = finished_job(buffer_events=3)
+    events = list(job.events_after(1))
+    # Ids 1-4 were evicted: the code so far (as of event 6) comes first, then what is still buffered after it.
+    assert events[0] == (6, sse_resync())
+    assert code_of(events) == "package a\nfun A() {\n}\n// end\n\n"
+    assert events[-1] == (7, sse_end())
+
+    assert list(job.events_after(5)) == [(6, sse_data("\n")), (7, sse_end())]
+
+
+def test_resync_replays_only_code_and_keeps_errors_out():
+    job = GenerationJob("job", buffer_events=2)
+    job.append(sse_data("a"))
+    job.append(sse_error("model failed"))
+    job.append(sse_data("b"))
+    job.append(sse_end())
+    assert job.has_error
+    events = list(job.events_after(0))
+    assert events[0] == (3, sse_resync())
+    assert code_of(events) == "ab"
+
+
+def test_live_viewer_sees_events_appended_later():
+    job = GenerationJob("job")
+    job.append(sse_data("a"))
+    seen = []
+    viewer = threading.Thread(target=lambda: seen.extend(job.events_after(0)))
+    viewer.start()
+    job.append(sse_data("b"))
+    job.append(sse_end())
+    viewer.join(5)
+    assert not viewer.is_alive()
+    assert [event for _, event in seen] == [sse_data("a"), sse_data("b"), sse_end()]
+
+
+def test_cancel_ends_the_job_exactly_once():
+    job = GenerationJob("job")
+    job.append(sse_data("a"))
+    assert job.cancel("superseded")
+    assert not job.cancel("again")
+    assert not job.append(sse_data("late"))
+    payloads = [event_payload(event) for _, event in job.events_after(0)]
+    assert payloads == ["a", "[INFO] Generation cancelled: superseded.", STREAM_END]
+
+
+def test_run_stops_and_closes_the_generator_once_cancelled():
+    job = GenerationJob("job")
+    closed = threading.Event()
+    produced = threading.Event()
+
+    def generator():
+        try:
+            while True:
+                yield sse_data("x")
+                produced.set()
+        finally:
+            closed.set()
+
+    runner = threading.Thread(target=job.run, args=(generator(),))
+    runner.start()
+    assert produced.wait(5)
+    assert job.cancel("test")
+    runner.join(5)
+    assert closed.is_set()
+    payloads = [event_payload(event) for _, event in job.events_after(0)]
+    assert payloads.count(STREAM_END) == 1 and payloads[-1] == STREAM_END
+
+
+def test_run_reports_a_failing_generator():
+    def generator():
+        yield sse_data("partial")
+        raise RuntimeError("boom")
+
+    job = GenerationJob("job")
+    job.run(generator())
+    payloads = [event_payload(event) for _, event in job.events_after(0)]
+    assert payloads == ["partial", "[ERROR] Generation failed: boom", STREAM_END]
+
+
+def test_manager_shares_running_jobs_by_dedupe_key():
+    manager = GenerationJobManager(max_workers=2)
+    release = threading.Event()
+
+    def factory():
+        release.wait(5)
+        yield sse_data("code")
+
+    first = manager.submit(factory, dedupe_key="key")
+    assert manager.submit(factory, dedupe_key="key") is first
+    assert manager.submit(factory, dedupe_key="other") is not first
+    release.set()
+    assert code_of(first.events_after(0)) == "code"
+    assert manager.get(first.job_id) is first
+
+
+def test_speculative_jobs_are_limited_claimed_and_cancelled_under_the_lock():
+    manager = GenerationJobManager(max_workers=4, max_speculative=1)
+    release = threading.Event()
+
+    def factory():
+        release.wait(5)
+        yield sse_data("code")
+
+    speculative = manager.submit(factory, dedupe_key="a", speculative=True)
+    assert manager.submit(factory, dedupe_key="b", speculative=True) is None
+    assert manager.claim(speculative)
+    assert not manager.claim(speculative)
+    assert not manager.cancel_speculative(speculative, "claimed jobs are not cancelled")
+
+    other = manager.submit(factory, dedupe_key="b", speculative=True)
+    assert other is not None
+    assert manager.cancel_speculative(other, "not needed")
+    assert not manager.claim(other)
+    release.set()
+    assert code_of(speculative.events_after(0)) == "code"
+    assert code_of(other.events_after(0)) == ""
+
+
+def test_job_events_sse_writes_ids_and_coalesces_code():
+    job = finished_job()
+    frames = "".join(job_events_sse(job))
+    assert frames.startswith("retry: ")
+    assert frames.count("id: ") == 3  # [INFO], the merged code, [STREAM_END]
+    assert "id: 6\ndata: package a\\nfun A() {\\n}\\n// end\\n\\n\n\n" in frames
+    assert frames.endswith(f"id: 7\n{sse_end()}")
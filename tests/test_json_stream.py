@@ -0,0 +1,87 @@
+import json
+import random
+
+import pytest
+
+import json_stream
+from json_stream import build_value, iter_events, skip_value, write_value
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(9 if depth < 4 else 6)
+    if kind == 0:
+        return rng.randint(-10 ** 12, 10 ** 12)
+    if kind == 1:
+        return rng.uniform(-1e6, 1e6) if rng.random() < 0.8 else rng.choice([1e-9, 6.02e23, -0.0, 1.5e300])
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind in (3, 4, 5):
+        alphabet = "abc xyz\"\\/\n\té中\U0001F600"
+        return "".join(rng.choice(alphabet) for _ in range(rng.randrange(12)))
+    if kind in (6, 7):
+        return {f"k{i}é": random_value(rng, depth + 1) for i in range(rng.randrange(6))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randrange(6))]
+
+
+def random_chunks(data, rng):
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.choice([1, 2, 3, 7, 64, 4096])
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def parse(chunks):
+    events = iter_events(chunks)
+    value = build_value(events, next(events))
+    for _ in events:
+        pass
+    return value
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_events_rebuild_what_json_loads_returns(seed):
+    rng = random.Random(seed)
+    value = {"document": random_value(rng), "list": [random_value(rng) for _ in range(5)]}
+    indent = rng.choice([None, 2])
+    data = json.dumps(value, indent=indent, ensure_ascii=rng.random() < 0.5).encode("utf-8")
+    assert parse(random_chunks(data, rng)) == json.loads(data)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_write_value_matches_compact_json_dumps(seed):
+    rng = random.Random(seed)
+    value = random_value(rng)
+    data = json.dumps(value, indent=1).encode("utf-8")
+    parts = []
+    events = iter_events(random_chunks(data, rng))
+    write_value(events, next(events), parts.append)
+    assert "".join(parts) == json.dumps(json.loads(data), separators=(",", ":"))
+
+
+@pytest.mark.parametrize("text", ["0", "-12", "3.25", "1e5", "-2.5E-3", "true", "null", '"a\\u00e9\\ud83d\\ude00"'])
+def test_scalars_split_at_every_byte(text):
+    data = text.encode("utf-8")
+    expected = json.loads(data)
+    for cut in range(1, len(data)):
+        assert parse([data[:cut], data[cut:]]) == expected
+
+
+def test_skip_value_leaves_the_following_events():
+    events = iter_events([b'{"skip": {"a": [1, {"b": 2}]}, "keep": 3}'])
+    assert next(events) == (json_stream.START_MAP, None)
+    assert next(events) == (json_stream.KEY, "skip")
+    skip_value(events, next(events))
+    assert next(events) == (json_stream.KEY, "keep")
+    assert next(events) == (json_stream.VALUE, 3)
+    assert next(events) == (json_stream.END_MAP, None)
+
+
+@pytest.mark.parametrize("data", [b'{"a": 1', b'[1, 2,]', b'{"a" 1}', b'[1] [2]', b'12a', b'tru', b'', b'{"a": 01}', b'"\xff"'])
+def test_malformed_documents_raise_like_json_loads(data):
+    with pytest.raises(ValueError):
+        json.loads(data)
+    for chunks in ([data], [data[i:i + 1] for i in range(len(data))]):
+        with pytest.raises(ValueError):
+            parse(chunks)
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from figma_cache import node_content_hash
+from figma_compact import prune_value
+from nodes_stream import (scan_nodes_body, scan_nodes_response, stream_nodes_response, load_prompt_json,
+                          prompt_json_path_for, write_prompt_json, STREAMING_NODES_MIN_BYTES_ENV_VAR)
+from stub_figma import StubFigmaData, file_key_for
+
+HAND_MADE_RESPONSE = {
+    "name": "Screens", "version": "42", "lastModified": "2024-01-01T00:00:00Z",
+    "nodes": {
+        "1:2": {"document": {
+            "id": "1:2", "type": "FRAME", "name": "Card", "visible": True, "blendMode": "PASS_THROUGH",
+            "absoluteBoundingBox": {"x": 0.333333, "y": 1e-7, "width": 375, "height": 812.5},
+            "children": [
+                {"id": "1:3", "visible": False, "type": "TEXT", "characters": "hidden"},
+                {"id": "1:4", "type": "TEXT", "characters": "Café \U0001F600", "effects": [], "fills": []},
+            ],
+        }, "components": {}, "styles": {}},
+        "5:6": {"document": {"visible": False, "type": "FRAME", "name": "Hidden root"}},
+    },
+}
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def responses():
+    yield json.dumps(HAND_MADE_RESPONSE, indent=2).encode("utf-8")
+    yield StubFigmaData(sizes=["medium"]).nodes_response(file_key_for("medium"), ["1:2", "3:4"])
+
+
+@pytest.mark.parametrize("body", list(responses()))
+def test_streamed_and_buffered_scans_agree(body, tmp_path):
+    data = json.loads(body)
+    streamed_paths = {key: str(tmp_path / f"s{i}.json") for i, key in enumerate(data["nodes"])}
+    buffered_paths = {key: str(tmp_path / f"b{i}.json") for i, key in enumerate(data["nodes"])}
+    streamed = scan_nodes_response(chunked(body, 7), streamed_paths)
+    buffered = scan_nodes_body(body, buffered_paths)
+
+    assert streamed.fields == buffered.fields == {key: value for key, value in data.items() if key != "nodes"}
+    assert streamed.raw_bytes == buffered.raw_bytes == len(body)
+    assert streamed.version == buffered.version
+    assert streamed.pruned_nodes == buffered.pruned_nodes
+    assert streamed.node_hashes == buffered.node_hashes
+    for node_key, entry in data["nodes"].items():
+        assert streamed.node_hashes[node_key] == node_content_hash({"nodes": {node_key: entry}})
+        assert streamed.pruned_nodes[node_key] == prune_value(entry, precision=None)
+        with open(streamed_paths[node_key]) as s, open(buffered_paths[node_key]) as b:
+            streamed_text, buffered_text = s.read(), b.read()
+        assert streamed_text == buffered_text
+        assert json.loads(streamed_text) == entry
+
+
+def test_pruning_drops_hidden_layers_and_default_members():
+    scan = scan_nodes_body(json.dumps(HAND_MADE_RESPONSE).encode("utf-8"))
+    card = scan.pruned_nodes["1:2"]["document"]
+    assert [child["id"] for child in card["children"]] == ["1:4"]
+    assert "visible" not in card and "blendMode" not in card
+    assert card["absoluteBoundingBox"]["x"] == 0.333333
+    assert scan.pruned_nodes["5:6"] == {}  # the hidden root, then its emptied entry, are dropped
+    assert scan.pruned_response("1:2")["nodes"] == {"1:2": scan.pruned_nodes["1:2"]}
+
+
+def test_stream_nodes_response_keeps_no_part_file_on_malformed_json(tmp_path):
+    json_path = tmp_path / "node.json"
+    with pytest.raises(ValueError):
+        stream_nodes_response(chunked(b'{"nodes": {"1:2": {"document": [1, 2}}}', 4), str(json_path))
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("min_bytes", ["0", str(1 << 30)])
+def test_load_prompt_json_without_a_prompt_file(min_bytes, tmp_path, monkeypatch):
+    monkeypatch.setenv(STREAMING_NODES_MIN_BYTES_ENV_VAR, min_bytes)
+    json_path = tmp_path / "node.json"
+    json_path.write_text(json.dumps(HAND_MADE_RESPONSE))
+    pruned = load_prompt_json(str(json_path), prompt_json_path_for(str(json_path)))
+    assert pruned == scan_nodes_body(json_path.read_bytes()).pruned_response()
+
+    write_prompt_json({"nodes": {}}, prompt_json_path_for(str(json_path)))
+    assert load_prompt_json(str(json_path), prompt_json_path_for(str(json_path))) == {"nodes": {}}
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from parallel_generation import plan_subtrees, parallel_generation_sse, stitch_kotlin_units
+from rate_limit import RATE_LIMIT_DB_PATH_ENV_VAR
+from sse import event_payload, STREAM_END
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class EndlessModel:
+    """Streams forever, except for a prompt containing FAIL_MARKER, which fails at once."""
+
+    FAIL_MARKER = "FAIL_THIS_UNIT"
+
+    def __init__(self):
+        self.chunks_sent = 0
+        self.streams_opened = 0
+        self.streams_closed = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=True):
+        if self.FAIL_MARKER in prompt:
+            raise RuntimeError("model exploded")
+        with self._lock:
+            self.streams_opened += 1
+        return self._stream()
+
+    def _stream(self):
+        try:
+            while True:
+                time.sleep(0.005)
+                with self._lock:
+                    self.chunks_sent += 1
+                yield Chunk("x")
+        finally:
+            with self._lock:
+                self.streams_closed += 1
+
+
+def frame(children):
+    document = {"id": "1:1", "type": "FRAME", "name": "Screen", "children": children}
+    return {"name": "File", "nodes": {"1:1": {"document": document}}}
+
+
+def text(node_id, name, characters):
+    return {"id": node_id, "type": "TEXT", "name": name, "characters": characters}
+
+
+@pytest.fixture(autouse=True)
+def rate_limit_db(tmp_path, monkeypatch):
+    monkeypatch.setenv(RATE_LIMIT_DB_PATH_ENV_VAR, str(tmp_path / "rate_limits.sqlite3"))
+
+
+def wait_until_idle(model, timeout=2.0):
+    """Waits until the model stops sending chunks; returns False if it never does."""
+    deadline = time.monotonic() + timeout
+    last = -1
+    while time.monotonic() < deadline:
+        if model.chunks_sent == last:
+            return True
+        last = model.chunks_sent
+        time.sleep(0.1)
+    return False
+
+
+def test_a_failing_unit_stops_the_running_ones():
+    model = EndlessModel()
+    plan = plan_subtrees(frame([text("1:2", "Title", "Hello"), text("1:3", "Broken", EndlessModel.FAIL_MARKER)]))
+    payloads = [event_payload(event) for event in parallel_generation_sse(model, plan)]
+    assert payloads[-2].startswith("[ERROR]") and "model exploded" in payloads[-2]
+    assert payloads[-1] == STREAM_END
+    assert wait_until_idle(model)
+    assert model.streams_opened and model.streams_closed == model.streams_opened
+
+
+def test_closing_the_stream_stops_running_units():
+    model = EndlessModel()
+    plan = plan_subtrees(frame([text("1:2", "Title", "Hello"), text("1:3", "Body", "World")]))
+    events = parallel_generation_sse(model, plan)
+    assert event_payload(next(events)).startswith("[INFO] Split generation")
+    assert event_payload(next(events)).endswith("started")
+    deadline = time.monotonic() + 2
+    while model.chunks_sent < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert model.chunks_sent >= 3
+    events.close()
+    assert wait_until_idle(model)
+    assert model.streams_closed == model.streams_opened
+
+
+def test_stitching_keeps_one_package_and_merges_imports():
+    parent = "package app\nimport a.B\n\n@Composable\nfun Screen() { Title() }\n"
+    subtree = "```kotlin\npackage app\nimport a.B\nimport c.D\n\n@Composable\nfun Title() {}\n```"
+    stitched = stitch_kotlin_units(parent, [subtree])
+    assert stitched.count("package app") == 1
+    assert "import a.B\nimport c.D" in stitched
+    assert "fun Screen()" in stitched and "fun Title()" in stitched and "```" not in stitched
@@ -0,0 +1,100 @@
+import copy
+
+import pytest
+
+from kotlin_index import KotlinIndex
+from rule_based_compose import try_rule_based_compose, rule_based_sse, RULE_BASED_MAX_NODES
+from sse import event_payload, decode_code_chunk, is_control_payload, STREAM_END
+
+THEME_KT = """package com.example.ui.theme
+
+import androidx.compose.ui.graphics.Color
+
+object AppColors {
+    val Primary = Color(0xFF6200EE)
+}
+"""
+
+
+def solid(r, g, b, a=1.0):
+    return [{"type": "SOLID", "color": {"r": r, "g": g, "b": b, "a": a}}]
+
+
+def card():
+    return {
+        "id": "1:2", "type": "FRAME", "name": "Promo card", "layoutMode": "VERTICAL", "itemSpacing": 8,
+        "primaryAxisSizingMode": "AUTO", "counterAxisSizingMode": "AUTO",
+        "paddingLeft": 16, "paddingRight": 16, "paddingTop": 16, "paddingBottom": 16, "cornerRadius": 4,
+        "fills": solid(0x62 / 255, 0, 0xEE / 255),
+        "absoluteBoundingBox": {"x": 0, "y": 0, "width": 328, "height": 120},
+        "children": [
+            {"id": "1:3", "type": "TEXT", "name": "Title", "characters": "Save $5 \"now\"",
+             "style": {"fontFamily": "Inter", "fontSize": 20, "fontWeight": 700, "textAutoResize": "WIDTH_AND_HEIGHT"},
+             "fills": solid(1, 1, 1), "absoluteBoundingBox": {"x": 0, "y": 0, "width": 200, "height": 24}},
+            {"id": "1:4", "type": "RECTANGLE", "name": "Hidden image", "visible": False, "fills": [{"type": "IMAGE"}]},
+        ],
+    }
+
+
+def response(document):
+    return {"name": "File", "nodes": {"1:2": {"document": document}}}
+
+
+def test_simple_tree_is_emitted_locally():
+    code, reason = try_rule_based_compose(response(card()))
+    assert reason is None
+    assert "fun PromoCard(modifier: Modifier = Modifier)" in code
+    assert "fun PromoCardPreview()" in code
+    assert "Column(" in code and "Text(" in code
+    assert "\"Save \\$5 \\\"now\\\"\"" in code
+    assert "FontWeight.Bold" in code
+    assert "Color(0xFF6200EE)" in code
+    assert "Hidden image" not in code
+
+
+def test_theme_symbols_replace_literals(tmp_path):
+    (tmp_path / "Theme.kt").write_text(THEME_KT)
+    index = KotlinIndex(str(tmp_path))
+    index.refresh()
+    code, reason = try_rule_based_compose(response(card()), index.symbols())
+    assert reason is None
+    assert "AppColors.Primary" in code
+    assert "import com.example.ui.theme.AppColors" in code
+
+
+@pytest.mark.parametrize("mutate, expected_reason", [
+    (lambda c: c["children"].append({"type": "VECTOR", "name": "Icon"}), "VECTOR 'Icon' is not supported"),
+    (lambda c: c.update(layoutMode="NONE"), "absolutely"),
+    (lambda c: c.update(effects=[{"type": "DROP_SHADOW"}]), "effects"),
+    (lambda c: c.update(fills=[{"type": "GRADIENT_LINEAR"}]), "gradient_linear"),
+    (lambda c: c["children"][0].update(characterStyleOverrides=[0, 1]), "mixes"),
+    (lambda c: c["children"].extend([{"type": "RECTANGLE", "name": "r", "absoluteBoundingBox": {"width": 1, "height": 1}}]
+                                    * RULE_BASED_MAX_NODES), "visible nodes"),
+])
+def test_unsupported_trees_go_to_the_model(mutate, expected_reason):
+    document = copy.deepcopy(card())
+    mutate(document)
+    code, reason = try_rule_based_compose(response(document))
+    assert code is None
+    assert expected_reason in reason
+
+
+def test_shape_without_modifiers_is_emitted_bare():
+    document = card()
+    document["children"].append({"id": "1:5", "type": "RECTANGLE", "name": "Spacer",
+                                 "layoutSizingHorizontal": "HUG", "layoutSizingVertical": "HUG"})
+    code, reason = try_rule_based_compose(response(document))
+    assert reason is None
+    assert code.count("Box()") == 1
+
+
+def test_response_without_a_document_is_unsupported():
+    code, reason = try_rule_based_compose({"nodes": {}})
+    assert code is None and reason
+
+
+def test_rule_based_sse_streams_the_code_like_a_generation():
+    code, _ = try_rule_based_compose(response(card()))
+    payloads = [event_payload(event) for event in rule_based_sse(code)]
+    assert payloads[0].startswith("[INFO]") and payloads[-1] == STREAM_END
+    assert "".join(decode_code_chunk(payload) for payload in payloads if not is_control_payload(payload)) == code
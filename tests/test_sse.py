@@ -0,0 +1,41 @@
+import pytest
+
+from sse import (coalesce_events, sse_code_chunks, sse_data, sse_end, sse_error, sse_info, event_payload,
+                 decode_code_chunk, is_control_payload)
+
+
+def numbered(events):
+    return list(enumerate(events, start=1))
+
+
+def test_runs_of_code_merge_into_one_event_with_the_last_id():
+    events = numbered([sse_data("a\n"), sse_data("b"), sse_data("c"), sse_end()])
+    assert coalesce_events(events, 1024) == [(3, sse_data("a\nbc")), (4, sse_end())]
+
+
+def test_control_events_are_never_merged_and_split_runs():
+    events = numbered([sse_info("start"), sse_data("a"), sse_error("oops"), sse_data("b"), sse_data("c"), sse_end()])
+    assert coalesce_events(events, 1024) == [
+        (1, sse_info("start")), (2, sse_data("a")), (3, sse_error("oops")), (5, sse_data("bc")), (6, sse_end())]
+
+
+def test_merged_payloads_stay_within_max_bytes():
+    events = numbered(list(sse_code_chunks("x" * 100, chunk_chars=10)))
+    merged = coalesce_events(events, 35)
+    assert [event_id for event_id, _ in merged] == [3, 6, 9, 10]
+    assert all(len(event_payload(event)) <= 35 for _, event in merged)
+    assert "".join(decode_code_chunk(event_payload(event)) for _, event in merged) == "x" * 100
+
+
+@pytest.mark.parametrize("max_bytes", [0, -1])
+def test_coalescing_can_be_turned_off(max_bytes):
+    events = numbered([sse_data("a"), sse_data("b")])
+    assert coalesce_events(events, max_bytes) == events
+
+
+def test_code_chunks_carry_newlines_escaped():
+    code = "line one\nline two\n"
+    payloads = [event_payload(event) for event in sse_code_chunks(code, chunk_chars=4)]
+    assert not any(is_control_payload(payload) for payload in payloads)
+    assert all("\n" not in payload for payload in payloads)
+    assert "".join(decode_code_chunk(payload) for payload in payloads) == code